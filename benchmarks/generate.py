@@ -0,0 +1,136 @@
+# Generates synthetic list.tsv files and books.db databases for the benchmarks
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from src.importer import Importer
+
+# Header of the original spreadsheet export, padded with blank columns
+HEADER = (
+    ["KKKt", "#", "", "Title", "Author", "Date", "Pages", "Last Edition", "Owned"]
+    + ["Status", "Date Started", "Date Finished", "Days Read", "Pages per Day"]
+    + ["Rating", "", "", "", "rating", "r/tbr"]
+    + [""] * 58
+)
+
+WORDS = (
+    "the of and a in to love war night house time man woman city river "
+    "garden stranger mother father island road winter summer death life "
+    "secret world tale story history last first letters journey"
+).split()
+
+SURNAMES = (
+    "Dickens Austen Woolf Tolstoy Zola Balzac Brontë Joyce Kafka Mann Hesse "
+    "Márquez Borges Calvino Eco Murakami Achebe Morrison Nabokov Orwell"
+).split()
+
+
+def messy_dates(dates: pd.Series, rng: np.random.Generator) -> pd.Series:
+    """Formats dates in the mix of styles found in real spreadsheets"""
+    styles = rng.integers(0, 10, len(dates))
+    formatted = pd.Series(
+        np.select(
+            [styles < 5, styles < 8, styles < 9],
+            [
+                dates.dt.strftime("%d-%b-%y"),
+                dates.dt.strftime("%Y-%m-%d"),
+                dates.dt.strftime("%d.%m.%Y"),
+            ],
+            dates.dt.strftime("%B %d %Y") + " (approx.)",
+        ),
+        index=dates.index,
+    )
+    return formatted.where(dates.notna(), "")
+
+
+def random_words(rng: np.random.Generator, words: list, rows: int) -> pd.Series:
+    return pd.Series(rng.choice(words, rows))
+
+
+def generate_list(path: str, rows: int, seed: int = 1001) -> None:
+    """Writes a list.tsv shaped file with rows books"""
+    rng = np.random.default_rng(seed)
+    started = pd.Timestamp("2015-01-01") + pd.to_timedelta(
+        rng.integers(0, 3000, rows), unit="D"
+    )
+    reading_days = pd.to_timedelta(rng.integers(0, 60, rows), unit="D")
+    is_started = rng.random(rows) < 0.15
+    is_finished = is_started & (rng.random(rows) < 0.8)
+    started = pd.Series(started).where(is_started)
+    finished = (started + reading_days).where(is_finished)
+
+    years = rng.integers(-800, 2020, rows)
+    numbers = pd.Series(range(rows)).astype(str)
+    titles = (
+        random_words(rng, WORDS, rows).str.title()
+        + " "
+        + random_words(rng, WORDS, rows)
+        + " "
+        + random_words(rng, WORDS, rows).str.title()
+        + " "
+        + numbers
+    )
+    authors = (
+        random_words(rng, SURNAMES, rows)
+        + ", "
+        + random_words(rng, WORDS, rows).str.title()
+    )
+    dates = pd.Series(np.abs(years)).astype(str) + np.where(years < 0, "BC", "")
+    columns = {
+        "KKKt": [""] * rows,
+        "#": (numbers.astype(int) + 1).astype(str).str.zfill(4),
+        "": is_finished.astype(int),
+        "Title": titles,
+        "Author": authors,
+        "Date": dates,
+        "Pages": rng.integers(80, 1500, rows),
+        "Last Edition": rng.integers(1950, 2023, rows),
+        "Owned": rng.integers(0, 2, rows),
+        "Status": np.where(is_finished, "r", ""),
+        "Date Started": messy_dates(started, rng),
+        "Date Finished": messy_dates(finished, rng),
+    }
+    with open(path, "w") as stream:
+        stream.write("\t".join(HEADER) + "\n")
+        # the named columns come first, the rest of the header stays blank
+        frame = pd.DataFrame({position: [""] * rows for position in range(len(HEADER))})
+        for position, values in enumerate(columns.values()):
+            frame[position] = values
+        frame.to_csv(stream, sep="\t", header=False, index=False)
+
+
+def write_config(directory: str, template: str = "config/config.yaml") -> str:
+    """Writes a copy of the template config that points to a database in directory"""
+    with open(template) as stream:
+        config = yaml.safe_load(stream)
+    config["db_name"] = os.path.join(directory, "books.db")
+    if config.get("snapshot"):
+        config["snapshot"] = os.path.join(directory, "books.feather")
+    config_file = os.path.join(directory, "config.yaml")
+    with open(config_file, "w") as stream:
+        yaml.safe_dump(config, stream)
+    return config_file
+
+
+def generate_db(directory: str, rows: int, seed: int = 1001) -> str:
+    """Generates list.tsv and books.db in directory, returns the config file"""
+    os.makedirs(directory, exist_ok=True)
+    list_file = os.path.join(directory, "list.tsv")
+    generate_list(list_file, rows, seed)
+    config_file = write_config(directory)
+    importer = Importer(config_file)
+    with importer.model:
+        importer.perform_import(list_file)
+    return config_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1001)
+    args = parser.parse_args()
+    generate_db(args.directory, args.rows, args.seed)
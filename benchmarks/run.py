@@ -0,0 +1,196 @@
+# Times the main operations on generated catalogs and compares against a baseline
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.generate import generate_db
+from src.importer import Importer
+from src.model import Model
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def measure(function, repeats: int, items: int = 1) -> dict:
+    """Runs function repeats times, returning latency percentiles and peak memory
+
+    Throughput counts items processed per second at the median latency.
+    The first run is traced with tracemalloc for the peak memory so that the
+    tracing overhead does not distort the timings of the others.
+    """
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+        "throughput": items / p50 if p50 else float("inf"),
+        "peak_memory": peak_memory,
+    }
+
+
+def run_benchmarks(directory: str, rows: int, repeats: int = 5) -> dict:
+    """Benchmarks the operations on a catalog of rows books generated in directory"""
+    config_file = generate_db(directory, rows)
+    list_file = os.path.join(directory, "list.tsv")
+    results = {}
+
+    importer = Importer(config_file)
+    with importer.model:
+        results["import"] = measure(
+            lambda: importer.perform_import(list_file), max(1, repeats // 2), rows
+        )
+
+    model = Model(config_file)
+    with model:
+        config = model.config
+        model.config = config.replace(snapshot=None)
+        results["read_data_from_db"] = measure(model.read_data_from_db, repeats, rows)
+        model.config = config
+        if config["snapshot"]:
+            results["read_data_from_snapshot"] = measure(
+                model.read_data_from_db, repeats, rows
+            )
+        results["write_to_sqlite"] = measure(model.write_to_sqlite, repeats, rows)
+
+        ids = model.data["index"].to_numpy()
+        rng = np.random.default_rng(1001)
+
+        def save_edits(count=100):
+            for book_id in rng.choice(ids, count, replace=False):
+                model.update_book(int(book_id), {"Pages": int(rng.integers(80, 1500))})
+            model.save_changes()
+
+        results["save_changes_100"] = measure(save_edits, repeats, 100)
+
+        def search_author():
+            model._search_indexes = {}
+            model.search("Author", "tolstoy")
+
+        results["search_author_cold"] = measure(search_author, repeats)
+        results["search_author"] = measure(
+            lambda: model.search("Author", "tolstoy"), repeats * 20
+        )
+        results["search_title"] = measure(
+            lambda: model.search("Title", "night garden"), repeats * 20
+        )
+        results["get_book"] = measure(
+            lambda: model.get_book(int(rng.choice(ids))), repeats * 100
+        )
+        results["kpi_rebuild"] = measure(model.kpis.rebuild, repeats, rows)
+
+        def update_progress():
+            # a KPI input, so the engine recomputes the book and its totals
+            book_id = int(rng.choice(ids))
+            finished = np.datetime64("2020-01-01") + int(rng.integers(1, 60))
+            model.update_book(book_id, {"Date Finished": finished})
+            return model.kpis.average_speed
+
+        results["kpi_update"] = measure(update_progress, repeats * 20)
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lists the operations whose median latency or peak memory grew beyond tolerance
+
+    Operations that are missing from the baseline are not compared.
+    """
+    regressions = []
+    for operation, result in results.items():
+        reference = baseline.get(operation)
+        if reference is None:
+            continue
+        for metric in ("p50", "peak_memory"):
+            if result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{operation} {metric}: {result[metric]:.6g} "
+                    f"(baseline {reference[metric]:.6g})"
+                )
+    return regressions
+
+
+def print_results(size: str, results: dict) -> None:
+    print(f"\n{size} rows")
+    print(
+        f"{'operation':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'items/s':>14}{'peak MiB':>10}"
+    )
+    for operation, result in results.items():
+        print(
+            f"{operation:<26}{result['p50'] * 1000:>10.3f}{result['p95'] * 1000:>10.3f}"
+            f"{result['p99'] * 1000:>10.3f}{result['throughput']:>14.1f}"
+            f"{result['peak_memory'] / 2**20:>10.1f}"
+        )
+
+
+def main(arguments: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=["1k"])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="allowed relative slowdown or memory growth before failing",
+    )
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="store the results as the new baseline instead of comparing",
+    )
+    args = parser.parse_args(arguments)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+
+    regressions = []
+    for size in args.sizes:
+        directory = tempfile.mkdtemp(prefix=f"books_benchmark_{size}_")
+        try:
+            results = run_benchmarks(directory, SIZES[size], args.repeats)
+        finally:
+            shutil.rmtree(directory)
+        print_results(size, results)
+        if args.update_baseline:
+            baseline[size] = results
+        elif size not in baseline:
+            print(f"\nNo baseline for {size}, store one with --update-baseline")
+        else:
+            regressions += [
+                f"{size} {regression}"
+                for regression in find_regressions(
+                    results, baseline.get(size, {}), args.tolerance
+                )
+            ]
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as stream:
+            json.dump(baseline, stream, indent=2, sort_keys=True)
+        return 0
+    if regressions:
+        print("\nRegressions:")
+        print("\n".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+# Serves the book list as a local HTTP/JSON API, see src/service.py
+import argparse
+import asyncio
+
+from src.importer import Importer
+from src.model import Model
+from src.service import BookService
+
+
+async def serve(config: str, host: str, port: int):
+    model = Model(config)
+    model.read_data_from_db()
+    # warm the indexes once so the first requests do not pay for them
+    model.search_index("Author")
+    model.search_index("Title")
+    model.kpis
+    server = await BookService(model).start(host, port)
+    print(f"Serving {len(model.data)} books on http://{host}:{port}")
+    with model:
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    importer = Importer(args.config)
+    with importer.model:
+        importer.sync("list.tsv")
+    asyncio.run(serve(args.config, args.host, args.port))
@@ -1,60 +1,97 @@
-from os import wait
-import sqlite3
-import datetime
 import pandas as pd
-from tabulate import tabulate
-from dateutil.parser import parse
-from src.model import Model
-import numpy as np
+from src.instrumentation import timed, timer
+from src.lazy_model import NotLoadedError, open_model
+from src.model import ConflictError
+from src.pager import Pager
+from src.progress import ProgressFileError, apply_progress_file
+from src.years import parse_year_range
 
 pd.options.mode.chained_assignment = None
 
 
+def tabulate(*args, **kwargs) -> str:
+    # tabulate takes a tenth of a second to import, pay for it on first output
+    from tabulate import tabulate
+
+    return tabulate(*args, **kwargs)
+
+
 class Browser:
     def __init__(self, config: str):
-        self.model = Model(config)
+        self.model = open_model(config)
         self.model.read_data_from_db()
+        self._pager = None
 
     def menu(self):
+        self.reload_changed_books()
         print("\n\n\nMenu")
         print("1. Show all books")
         print("2. Show books by author")
         print("3. Show books by title")
         print("4. Show books by id")
         print("5. Edit book details")
+        print("l. Log a reading session")
+        print("y. Show books by year of publication")
         print("6. Show reading progress")
+        print("s. Show statistics by status, owned, author and century")
+        print("f. Forecast when the list will be finished")
+        print("p. Import reading progress from a CSV/TSV file")
         print("q to exit")
         choice = input("Enter your choice: ")
 
-        if choice == "1":
-            self.show_all_books()
-        elif choice == "2":
-            self.show_books_by_author()
-        elif choice == "3":
-            self.show_books_by_title()
-        elif choice == "4":
-            self.show_books_by_id()
-        elif choice == "5":
-            self.edit_book_details()
-        elif choice == "6":
-            self.show_average_reading_speed()
-        elif choice == "q":
-            self.save_and_exit()
-            return
-        else:
-            print("Invalid choice")
+        # the lazy backend has no statistics over all books
+        try:
+            if choice == "1":
+                self.show_all_books()
+            elif choice == "2":
+                self.show_books_by_author()
+            elif choice == "3":
+                self.show_books_by_title()
+            elif choice == "4":
+                self.show_books_by_id()
+            elif choice == "5":
+                self.edit_book_details()
+            elif choice == "l":
+                self.log_reading_session()
+            elif choice == "y":
+                self.show_books_by_year()
+            elif choice == "6":
+                self.show_average_reading_speed()
+            elif choice == "s":
+                self.show_facets()
+            elif choice == "f":
+                self.time_to_finish_list()
+            elif choice == "p":
+                self.import_progress_file()
+            elif choice == "q":
+                self.save_and_exit()
+                return
+            else:
+                print("Invalid choice")
+        except NotLoadedError as error:
+            print(error)
         self.menu()
 
-    def show_all_books(self):
-        for row_number in range(51, len(self.model.data) + 51, 51):
-            print(
-                tabulate(
-                    self.model.data[row_number - 50 : row_number],
-                    headers="keys",
-                    tablefmt="fancy_grid",
-                    showindex=False,
-                )
+    @property
+    def pager(self) -> Pager:
+        if self._pager is None:
+            self._pager = Pager(
+                self.model,
+                self.model.config["page_size"],
+                self.model.config["table_format"],
             )
+        return self._pager
+
+    def show_all_books(self):
+        # timed per page, without the wait for the key press
+        pages = iter(self.pager.pages())
+        while True:
+            with timer("browser.show_all_books"):
+                page = next(pages, None)
+                if page is not None:
+                    print(page)
+            if page is None:
+                break
             key_press = input("Press enter to continue or q to quit: ")
             if key_press == "q":
                 break
@@ -62,50 +99,71 @@ class Browser:
     # TODO: Refactor this to select books by criteria in single function
     def show_books_by_author(self) -> pd.DataFrame:
         author = input("Enter author: ")
-        found_books = self.model.data[
-            self.model.data["Author"].str.contains(author, case=False)
-        ]
-        print(
-            tabulate(
-                found_books,
-                headers="keys",
-                tablefmt="fancy_grid",
-                showindex=False,
+        with timer("browser.show_books_by_author"):
+            found_books = self.model.search("Author", author)
+            print(
+                tabulate(
+                    found_books,
+                    headers="keys",
+                    tablefmt="fancy_grid",
+                    showindex=False,
+                )
             )
-        )
         return found_books
 
     def show_books_by_title(self) -> pd.DataFrame:
         title = input("Enter title: ")
-        found_books = self.model.data[
-            self.model.data["Title"].str.contains(title, case=False)
-        ]
-        print(
-            tabulate(
-                found_books,
-                headers="keys",
-                tablefmt="fancy_grid",
-                showindex=False,
+        with timer("browser.show_books_by_title"):
+            found_books = self.model.search("Title", title)
+            print(
+                tabulate(
+                    found_books,
+                    headers="keys",
+                    tablefmt="fancy_grid",
+                    showindex=False,
+                )
+            )
+        return found_books
+
+    def show_books_by_year(self) -> pd.DataFrame:
+        text = input("Enter a year or years (e.g. 1850, 1900-1950, 500BC-100): ")
+        try:
+            first, last = parse_year_range(text)
+        except ValueError as error:
+            print(error)
+            return pd.DataFrame()
+        with timer("browser.show_books_by_year"):
+            found_books = self.model.books_by_year(first, last)
+            print(
+                tabulate(
+                    found_books,
+                    headers="keys",
+                    tablefmt="fancy_grid",
+                    showindex=False,
+                )
             )
-        )
         return found_books
 
     def show_books_by_id(self) -> pd.DataFrame:
         book_id = input("Enter book id: ")
-        found_books = self.model.data[self.model.data["index"] == int(book_id)]
-        print(
-            tabulate(
-                found_books,
-                headers="keys",
-                tablefmt="fancy_grid",
-                showindex=False,
+        with timer("browser.show_books_by_id"):
+            found_books = self.model.get_book(int(book_id))
+            print(
+                tabulate(
+                    found_books,
+                    headers="keys",
+                    tablefmt="fancy_grid",
+                    showindex=False,
+                )
             )
-        )
         return found_books
 
     def edit_book_details(self):
         book_id = input("Enter book id: ")
-        found_books = self.model.data[self.model.data["index"] == int(book_id)]
+        found_books = self.model.get_book(int(book_id))
+        if found_books.empty:
+            print("Book not found")
+            return found_books
         print(
             tabulate(
                 found_books,
@@ -114,63 +172,109 @@ class Browser:
                 showindex=False,
             )
         )
+        from dateutil.parser import parse
+
         # Get new values for start/finish dates from user
+        new_values = {}
         start_new_value = input("Enter start reading date (YYYY-MM-DD): ")
         if start_new_value:
-            self.model.data.loc[
-                self.model.data["index"] == int(book_id), "Date Started"
-            ] = pd.to_datetime(parse(start_new_value, fuzzy=True))
+            new_values["Date Started"] = pd.to_datetime(
+                parse(start_new_value, fuzzy=True)
+            )
         end_new_value = input("Enter end reading date (YYYY-MM-DD): ")
         if end_new_value:
-            self.model.data.loc[
-                self.model.data["index"] == int(book_id), "Date Finished"
-            ] = pd.to_datetime(parse(end_new_value, fuzzy=True))
-        print(
-            tabulate(
-                self.model.data[self.model.data["index"] == int(book_id)],
-                headers="keys",
-                tablefmt="fancy_grid",
-                showindex=False,
+            new_values["Date Finished"] = pd.to_datetime(
+                parse(end_new_value, fuzzy=True)
             )
-        )
-        return self.model.data[self.model.data["index"] == int(book_id)]
+        with timer("browser.edit_book_details"):
+            if new_values:
+                found_books = self.model.update_book(int(book_id), new_values)
+            print(
+                tabulate(
+                    found_books,
+                    headers="keys",
+                    tablefmt="fancy_grid",
+                    showindex=False,
+                )
+            )
+        return found_books
+
+    def log_reading_session(self) -> pd.DataFrame:
+        book_id = input("Enter book id: ")
+        pages = input("Enter pages read: ")
+        date = input("Enter date (empty for today): ").strip() or None
+        with timer("browser.log_reading_session"):
+            try:
+                self.model.log_session(int(book_id), int(pages), date)
+            except (KeyError, ValueError) as error:
+                print(f"Session not logged: {error}")
+                return pd.DataFrame()
+            progress = self.model.reading_log.progress()
+            progress = progress[progress["book_id"] == int(book_id)]
+            print(
+                tabulate(
+                    progress,
+                    headers="keys",
+                    tablefmt=self.model.config["table_format"],
+                    showindex=False,
+                )
+            )
+        return progress
+
+    def import_progress_file(self) -> int:
+        print("The file needs the columns id, Date Started and/or Date Finished")
+        path = input("Enter file path: ")
+        try:
+            with timer("browser.import_progress_file"):
+                # conflicts are resolved by asking, as when saving on exit
+                updated = apply_progress_file(self.model, path, self.save_changes)
+        except (OSError, ProgressFileError) as e:
+            print(e)
+            return 0
+        print(f"Updated and saved {updated} books")
+        return updated
 
+    # not timed here, model.save_changes is, without the wait for the answers
     def save_and_exit(self):
         want_to_save = input("Do you want to save changes? (y/n): ")
         if want_to_save == "y":
             try:
-                self.update_kpi()
-                self.model.write_to_sqlite(write_index=False)
+                self.save_changes()
                 print("Changes saved")
             except Exception as e:
                 print(e)
                 return False
+            finally:
+                self.model.close()
         else:
             print("Changes not saved")
+            self.model.close()
+
+    def save_changes(self):
+        """Saves the edits, asking whose version to keep of conflicting books"""
+        try:
+            self.model.save_changes()
+        except ConflictError as e:
+            print(e)
+            overwrite = input("Overwrite them with your edits? (y/n): ")
+            if overwrite == "y":
+                self.model.save_changes(force=True)
+            else:
+                self.model.refresh(overwrite_dirty=True)
+                self.model.save_changes()
+
+    def reload_changed_books(self):
+        """Reloads the books another program, e.g. the Qt UI, has saved"""
+        reloaded = self.model.refresh()
+        if reloaded:
+            print(f"Reloaded {len(reloaded)} books changed by another program")
 
     def update_kpi(self):
-        self.model.data["Days Read"] = (
-            self.model.data["Date Finished"] - self.model.data["Date Started"]
-        ).dt.days
-        self.model.data["Pages per Day"] = (
-            self.model.data["Pages"] / self.model.data["Days Read"]
-        )
+        # recompute the derived reading columns of all books at once
+        self.model.kpis.rebuild()
 
     def show_reading_progress(self):
-        # filter out books that haven't been started
-        progress = self.model.data[self.model.data["Date Started"].notna()]
-        progress = progress[progress["Date Finished"].notna()]
-        # convert to reading days
-        progress["Reading Days"] = (
-            progress["Date Finished"] - progress["Date Started"]
-        ).dt.days
-        # replace 0 days with 1 day in order to avoid division by 0
-        progress["Reading Days"] = progress["Reading Days"].replace(0, 1)
-        # calculate pages per day
-        progress["Reading Speed"] = progress["Pages"] / progress["Reading Days"]
-
-        # sort by date started
-        progress = progress.sort_values(by="Date Started")
+        progress = self.model.reading_progress()
         print(
             tabulate(
                 progress[["Title", "Reading Days", "Reading Speed"]],
@@ -182,37 +286,50 @@ class Browser:
         )
         return progress
 
-    def time_to_finish_list(self):
-        # filter out books that haven't been started
-        progress = self.model.data[self.model.data["Date Started"].notna()]
-        # convert to reading days
-        progress["Reading Days"] = (
-            progress["Date Finished"] - progress["Date Started"]
-        ).dt.days
-        # calculate reading speed
-        progress["Reading Speed"] = progress["Pages"] / progress["Reading Days"]
-        # calculate time to finish
-        progress["Time to Finish"] = (
-            progress["Pages"] - progress["Pages Read"]
-        ) / progress["Reading Speed"]
+    @timed("browser.show_facets")
+    def show_facets(self, limit: int = 10) -> dict:
+        # counted once and kept current by edits, so this is cheap to repeat
+        summaries = self.model.facet_summary(limit=limit)
+        for facet, summary in summaries.items():
+            print(f"\nBy {facet}")
+            print(
+                tabulate(
+                    summary,
+                    headers="keys",
+                    tablefmt=self.model.config["table_format"],
+                    floatfmt=".1f",
+                )
+            )
+        return summaries
+
+    @timed("browser.time_to_finish_list")
+    def time_to_finish_list(self) -> pd.DataFrame:
+        # simulated from the reading speeds of the finished books
+        try:
+            forecast = self.model.forecaster.forecast(
+                birth_date=self.model.config["birth_date"]
+            )
+        except ValueError as error:
+            print(f"Cannot forecast the finish date: {error}")
+            return pd.DataFrame()
         print(
             tabulate(
-                progress[["Title", "Time to Finish"]],
+                forecast,
                 headers="keys",
-                tablefmt="fancy_grid",
+                tablefmt=self.model.config["table_format"],
                 showindex=False,
             )
         )
-        return progress
+        return forecast
 
+    @timed("browser.show_average_reading_speed")
     def show_average_reading_speed(self):
-        progress = self.show_reading_progress()
+        self.show_reading_progress()
         self.show_read_unread_count()
-        avg_speed = progress["Reading Speed"].mean()
+        avg_speed = self.model.calculate_average_reading_speed()
 
         print(f"\nAverage reading speed: {avg_speed:.2f} pages/day")
 
     def show_read_unread_count(self):
-        read_count = len(self.model.data[self.model.data["Date Finished"].notna()])
-        unread_count = len(self.model.data[self.model.data["Date Finished"].isna()])
-        print(f"\nBooks read: {read_count}, Books unread: {unread_count}")
+        kpis = self.model.kpis
+        print(f"\nBooks read: {kpis.finished_count}, Books unread: {kpis.unread_count}")
@@ -0,0 +1,281 @@
+# Tracks which books other programs saved, for save conflicts and refreshes
+import json
+import secrets
+
+import pandas as pd
+
+# entries of books_change_log kept after a save; instances that loaded the
+# books before the oldest entry reload the whole table
+CHANGE_LOG_LIMIT = 100000
+# more changed books than this are reloaded with the whole table
+REFRESH_ROW_LIMIT = 1000
+
+
+class ConflictError(RuntimeError):
+    """Unsaved books were saved by another program since they were loaded"""
+
+    def __init__(self, book_ids):
+        self.book_ids = sorted(book_ids)
+        super().__init__(
+            "Books changed by another program since they were loaded: "
+            + ", ".join(map(str, self.book_ids))
+        )
+
+
+class ChangeLog:
+    """The books_change_log table and how far one model has read it"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        # last entry the loaded books include, None until they are loaded
+        self.synced = None
+        # books saved, or kept unsaved, at another entry than synced
+        self.books = {}
+        self.data_version = None
+
+    def _table_exists(self, table: str) -> bool:
+        return (
+            self.connection.execute(
+                "select 1 from sqlite_master where type = 'table' and name = ?",
+                (table,),
+            ).fetchone()
+            is not None
+        )
+
+    def create(self) -> None:
+        """Creates the tables and triggers of the log unless they exist"""
+        con = self.connection
+        columns = [row[1] for row in con.execute("pragma table_info(books)")]
+        triggers = {
+            row[0]
+            for row in con.execute(
+                "select name from sqlite_master "
+                "where type = 'trigger' and tbl_name = 'books'"
+            )
+        }
+        if "books_logged_on_delete" in triggers and self._table_exists(
+            "books_database"
+        ):
+            return
+        with con:
+            con.execute("create table if not exists books_database (token text)")
+            if con.execute("select 1 from books_database").fetchone() is None:
+                con.execute(
+                    "insert into books_database values (?)", (secrets.token_hex(16),)
+                )
+            con.execute(
+                "create table if not exists books_changes (changes integer not null)"
+            )
+            if con.execute("select 1 from books_changes").fetchone() is None:
+                con.execute("insert into books_changes values (0)")
+            con.execute(
+                "create table if not exists books_change_log "
+                "(seq integer primary key autoincrement, book_id integer)"
+            )
+            con.execute(
+                "create index if not exists ix_books_change_log_book "
+                "on books_change_log (book_id, seq)"
+            )
+            if not columns:
+                return
+            for event, row in (("insert", "new"), ("update", "new"), ("delete", "old")):
+                con.execute(
+                    f"create trigger if not exists books_changed_on_{event} "
+                    f"after {event} on books begin "
+                    "update books_changes set changes = changes + 1; end"
+                )
+                if "index" in columns:
+                    # a null book id means the whole table was replaced
+                    con.execute(
+                        f"create trigger if not exists books_logged_on_{event} "
+                        f"after {event} on books begin "
+                        "insert into books_change_log (book_id) "
+                        f'values ({row}."index"); end'
+                    )
+
+    def version(self) -> dict:
+        """Returns the token and change count of the database, None before create"""
+        if not self._table_exists("books_database"):
+            return None
+        con = self.connection
+        return {
+            "token": con.execute("select token from books_database").fetchone()[0],
+            "changes": con.execute("select changes from books_changes").fetchone()[0],
+        }
+
+    def table_replaced(self) -> None:
+        """Records that every book may have changed, e.g. after an import"""
+        self.create()
+        with self.connection:
+            self.connection.execute(
+                "insert into books_change_log (book_id) values (null)"
+            )
+
+    def mark_synced(self) -> None:
+        """Remembers that the loaded books match the table as of now"""
+        self.synced = self.last()
+        self.books = {}
+        self.data_version = self.current_data_version()
+
+    def current_data_version(self) -> int:
+        return self.connection.execute("pragma data_version").fetchone()[0]
+
+    def last(self) -> int:
+        # without the log nothing was logged yet, all later entries are new
+        if not self._table_exists("books_change_log"):
+            return 0
+        return self.connection.execute(
+            "select coalesce(max(seq), 0) from books_change_log"
+        ).fetchone()[0]
+
+    def known(self, book_id: int) -> int:
+        return self.books.get(book_id, self.synced)
+
+    def since(self, seq: int) -> tuple:
+        """Returns the last entry and the last entry per book after seq"""
+        if not self._table_exists("books_change_log"):
+            return seq, {}
+        con = self.connection
+        first, last = con.execute(
+            "select min(seq), max(seq) from books_change_log"
+        ).fetchone()
+        changes = dict(
+            con.execute(
+                "select book_id, max(seq) from books_change_log "
+                "where seq > ? group by book_id",
+                (seq,),
+            ).fetchall()
+        )
+        # pruned entries may have named any book
+        if first is not None and first > seq + 1:
+            changes[None] = last
+        return max(last or 0, seq), changes
+
+    def conflicts(self, book_ids) -> set:
+        """Returns the books of book_ids another program saved since they were read"""
+        if self.synced is None or not book_ids:
+            return set()
+        _, changes = self.since(min(self.known(book_id) for book_id in book_ids))
+        if None in changes:
+            return set(book_ids)
+        return {
+            book_id
+            for book_id in book_ids
+            if changes.get(book_id, 0) > self.known(book_id)
+        }
+
+    def changed_elsewhere(self) -> bool:
+        """Tells without a query whether another connection committed anything"""
+        return self.synced is not None and (
+            self.current_data_version() != self.data_version
+        )
+
+    def prune(self) -> int:
+        """Deletes all but the last CHANGE_LOG_LIMIT entries, returns the last"""
+        last = self.last()
+        self.connection.execute(
+            "delete from books_change_log where seq <= ?", (last - CHANGE_LOG_LIMIT,)
+        )
+        return last
+
+    def saved(self, book_ids) -> None:
+        """Records that this model saved the books, inside the saving transaction"""
+        if self.synced is None:
+            return
+        last = self.prune()
+        for book_id in book_ids:
+            self.books[book_id] = last
+
+
+def refresh_books(model, overwrite_dirty: bool = False) -> list:
+    """Loads the books other programs saved into model, returns their ids"""
+    log = model.change_log
+    if log.synced is None:
+        return []
+    if not overwrite_dirty and not log.changed_elsewhere():
+        return []
+    con = model.database.connection
+    data_version = log.current_data_version()
+    kept = set() if overwrite_dirty else set(model.dirty_rows)
+    since = min([log.synced] + [log.known(book_id) for book_id in model.dirty_rows])
+    rows = None
+    # the log and the rows are read in one transaction, so they agree
+    with con:
+        con.execute("begin")
+        last, changes = log.since(since)
+        changed = {
+            book_id: change
+            for book_id, change in changes.items()
+            if book_id is None or change > log.known(book_id)
+        }
+        if changed and None not in changed and len(changed) <= REFRESH_ROW_LIMIT:
+            rows = pd.read_sql(
+                'select * from books where "index" in '
+                "(select value from json_each(?))",
+                con,
+                params=(json.dumps(sorted(int(book_id) for book_id in changed)),),
+            )
+    if not changed:
+        log.data_version = data_version
+        return []
+    deleted = (
+        rows is not None
+        and len(rows) < len(changed)
+        and any(
+            book_id in model.book_index
+            for book_id in set(changed) - set(rows["index"].tolist())
+        )
+    )
+    if rows is None or deleted:
+        reload_keeping_edits(model, changed, overwrite_dirty)
+        return model.data["index"].tolist()
+
+    for column in model.config.date_columns:
+        if column in rows.columns:
+            rows[column] = pd.to_datetime(rows[column])
+    columns = [
+        column
+        for column in rows.columns
+        if column != "index" and column in model.data.columns
+    ]
+    rows = rows[~rows["index"].isin(kept)]
+    present = model.book_positions(rows["index"]).notna()
+    if present.any():
+        model.update_books(rows.loc[present, ["index"] + columns], keep_missing=False)
+    for book in rows[~present].to_dict("records"):
+        model.add_book(book)
+    reloaded = rows["index"].tolist()
+    model.dirty_rows.difference_update(reloaded)
+    # kept books stay behind the log, so their next save still conflicts
+    log.books = {book_id: log.known(book_id) for book_id in kept if book_id in changed}
+    log.synced = last
+    log.data_version = data_version
+    return reloaded
+
+
+def reload_keeping_edits(model, changed: dict, overwrite_dirty: bool) -> None:
+    """Reloads the whole table into model and applies the unsaved edits again"""
+    log = model.change_log
+    dirty = model.dirty_rows
+    if overwrite_dirty:
+        dirty = {
+            book_id
+            for book_id in dirty
+            if None not in changed and book_id not in changed
+        }
+    known = {book_id: log.known(book_id) for book_id in dirty}
+    edits = model.data.iloc[sorted(model.book_index[book_id] for book_id in dirty)]
+    model.read_data_from_db()
+    if edits.empty:
+        return
+    columns = [column for column in edits.columns if column in model.data.columns]
+    present = model.book_positions(edits["index"]).notna()
+    if present.any():
+        model.update_books(edits.loc[present, columns], keep_missing=False)
+    for book in edits[~present].to_dict("records"):
+        model.add_book(book)
+    log.books.update(
+        (book_id, change)
+        for book_id, change in known.items()
+        if None in changed or book_id in changed
+    )
@@ -0,0 +1,75 @@
+# Typed columnar files of the books for analysis outside the app
+import os
+
+import pandas as pd
+
+# file suffixes and the format they are written in; Arrow IPC is Feather v2
+FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+    ".ipc": "feather",
+}
+
+
+def columnar_format(path: str, format: str = None) -> str:
+    """Returns "parquet" or "feather", from format or else the suffix of path"""
+    if format is None:
+        format = FORMATS.get(os.path.splitext(str(path))[1].lower())
+    if format not in ("parquet", "feather"):
+        raise ValueError(
+            f"Cannot tell the format of {path}, use one of "
+            + ", ".join(sorted(FORMATS))
+        )
+    return format
+
+
+def write_books(
+    frame: pd.DataFrame, path: str, format: str = None, metadata: dict = None
+) -> None:
+    """Writes the books with their dtypes as Parquet or Arrow IPC (Feather)
+
+    Dates, categories and the nullable dtypes come back unchanged when read.
+    Feather files are written uncompressed, so readers can memory map them
+    and use the columns without copying. metadata is stored with the schema.
+    The file is written next to path and renamed, so readers never see half
+    a file. Raises ImportError if pyarrow is not installed.
+    """
+    import pyarrow as pa
+
+    format = columnar_format(path, format)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if metadata:
+        table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+    partial = f"{path}.tmp"
+    if format == "parquet":
+        from pyarrow import parquet
+
+        parquet.write_table(table, partial)
+    else:
+        from pyarrow import feather
+
+        feather.write_feather(table, partial, compression="uncompressed")
+    os.replace(partial, path)
+
+
+def read_table(path: str, columns: list = None, format: str = None):
+    """Returns the books in path as a pyarrow Table, memory mapped
+
+    Only the given columns are read. The columns of an uncompressed Feather
+    file point into the mapped file, so opening a large history costs neither
+    a copy nor parsing; Parquet is decoded, but only the columns asked for.
+    """
+    if columnar_format(path, format) == "parquet":
+        from pyarrow import parquet
+
+        return parquet.read_table(path, columns=columns, memory_map=True)
+    from pyarrow import feather
+
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def read_books(path: str, columns: list = None, format: str = None) -> pd.DataFrame:
+    """Returns the books in path as a frame with the dtypes they were written with"""
+    return read_table(path, columns, format).to_pandas()
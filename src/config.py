@@ -0,0 +1,204 @@
+# Loads and validates config.yaml once per process
+import datetime
+import os
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+import yaml
+
+DATE_DTYPES = ("datetime64", "date", "time", "datetime", "timedelta")
+
+# type of each setting; settings without a default are required
+SCHEMA = {
+    "relevant_columns": list,
+    "column_dtypes": dict,
+    "db_name": str,
+    "sqlite_pragmas": dict,
+    "import_chunksize": int,
+    "identity_columns": list,
+    "progress_columns": list,
+    "page_size": int,
+    "table_format": str,
+    "instrumentation": dict,
+    "snapshot": str,
+    "forecast_simulations": int,
+    "year_column": str,
+    "backend": str,
+    # YAML reads unquoted dates as dates
+    "birth_date": (str, datetime.date),
+}
+
+DEFAULTS = {
+    "sqlite_pragmas": {},
+    "import_chunksize": 10000,
+    "identity_columns": ["Title", "Author"],
+    "progress_columns": [],
+    "page_size": 50,
+    "table_format": "fancy_grid",
+    "instrumentation": {},
+    "snapshot": None,
+    "forecast_simulations": 5000,
+    "year_column": "Date",
+    "backend": "memory",
+    "birth_date": None,
+}
+
+# memory loads all books into a DataFrame, lazy queries SQLite per view
+BACKENDS = ("memory", "lazy")
+
+COLUMN_LIST_SETTINGS = ("relevant_columns", "identity_columns", "progress_columns")
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def is_compact_dtype(dtype: str) -> bool:
+    return dtype in ("category", "string") or dtype.startswith(
+        ("string[", "Int", "UInt", "Float")
+    )
+
+
+def freeze(value):
+    """Turns dicts into read-only mappings and lists into tuples, recursively"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Reverses freeze, e.g. to serialize settings as JSON"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class Config(Mapping):
+    """Read-only settings with the values derived from them computed once
+
+    Settings are read like a dict, with the defaults filled in. The column
+    lists and dtype maps that the model and importer need are attributes, so
+    no consumer derives or modifies them. Use replace for a changed copy.
+    """
+
+    def __init__(self, settings: Mapping, path: str = None):
+        self.path = path
+        self._settings = freeze({**DEFAULTS, **settings})
+        self.relevant_columns = self._settings.get("relevant_columns", ())
+        self.column_dtypes = self._settings.get("column_dtypes", MappingProxyType({}))
+        self.date_columns = tuple(
+            column
+            for column, dtype in self.column_dtypes.items()
+            if dtype in DATE_DTYPES
+        )
+        # non-date dtypes can be applied while the list is parsed
+        self.parse_dtypes = MappingProxyType(
+            {
+                column: dtype
+                for column, dtype in self.column_dtypes.items()
+                if dtype not in DATE_DTYPES
+            }
+        )
+        self.compact_dtypes = MappingProxyType(
+            {
+                column: dtype
+                for column, dtype in self.column_dtypes.items()
+                if is_compact_dtype(dtype)
+            }
+        )
+
+    def __getitem__(self, key):
+        return self._settings[key]
+
+    def __iter__(self):
+        return iter(self._settings)
+
+    def __len__(self) -> int:
+        return len(self._settings)
+
+    def __repr__(self) -> str:
+        return f"Config({thaw(self._settings)!r})"
+
+    def replace(self, **settings) -> "Config":
+        return Config({**thaw(self._settings), **settings}, self.path)
+
+    def to_dict(self) -> dict:
+        return thaw(self._settings)
+
+
+def validate(settings) -> None:
+    """Raises ConfigError for missing, unknown or malformed settings"""
+    if not isinstance(settings, Mapping):
+        raise ConfigError("The config has to be a mapping of settings")
+    missing = [key for key in SCHEMA if key not in DEFAULTS and key not in settings]
+    if missing:
+        raise ConfigError(f"Missing settings: {', '.join(missing)}")
+    unknown = [key for key in settings if key not in SCHEMA]
+    if unknown:
+        raise ConfigError(f"Unknown settings: {', '.join(map(str, unknown))}")
+
+    for key, value in settings.items():
+        expected = SCHEMA[key]
+        if value is None and key in DEFAULTS:
+            continue
+        # bool is a subclass of int, but not a valid number of rows
+        if not isinstance(value, expected) or isinstance(value, bool):
+            kinds = expected if isinstance(expected, tuple) else (expected,)
+            names = [kind.__name__ for kind in kinds]
+            raise ConfigError(f"{key} has to be a {' or '.join(names)}")
+        if expected is int and value < 1:
+            raise ConfigError(f"{key} has to be positive")
+
+    relevant_columns = settings["relevant_columns"]
+    for key in COLUMN_LIST_SETTINGS:
+        columns = settings.get(key) or []
+        if not all(isinstance(column, str) for column in columns):
+            raise ConfigError(f"{key} has to be a list of column names")
+        if key != "relevant_columns":
+            unknown = [column for column in columns if column not in relevant_columns]
+            if unknown:
+                raise ConfigError(
+                    f"{key} has columns that are not relevant: {', '.join(unknown)}"
+                )
+    backend = settings.get("backend")
+    if backend is not None and backend not in BACKENDS:
+        raise ConfigError(f"backend has to be one of {', '.join(BACKENDS)}")
+    year_column = settings.get("year_column")
+    if year_column is not None and year_column not in relevant_columns:
+        raise ConfigError(f"year_column {year_column} is not a relevant column")
+    for column, dtype in settings["column_dtypes"].items():
+        if column not in relevant_columns:
+            raise ConfigError(f"column_dtypes has the unknown column {column}")
+        if not isinstance(dtype, str):
+            raise ConfigError(f"The dtype of {column} has to be a string")
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_config(path: str) -> Config:
+    """Returns the validated config in path, parsed again only if the file changed"""
+    key = os.path.abspath(path)
+    try:
+        mtime = os.stat(key).st_mtime_ns
+    except OSError as error:
+        raise ConfigError(f"Cannot read config {path}: {error}") from error
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(key, "r") as stream:
+            try:
+                settings = yaml.safe_load(stream)
+            except yaml.YAMLError as error:
+                raise ConfigError(f"Invalid YAML in {path}: {error}") from error
+        validate(settings)
+        config = Config(settings, path)
+        _cache[key] = (mtime, config)
+        return config
@@ -0,0 +1,42 @@
+import sqlite3
+
+
+class Database:
+    """Lazily opened SQLite connection that is shared by all queries of a Model
+
+    The pragmas from the config are applied once when the connection is opened.
+    Can be used as a context manager to close the connection on exit.
+    """
+
+    def __init__(self, db_name: str, pragmas: dict = None):
+        self.db_name = db_name
+        self.pragmas = pragmas or {}
+        self._connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # the connection may be used from a worker thread, callers make
+            # sure only one thread uses it at a time
+            self._connection = sqlite3.connect(self.db_name, check_same_thread=False)
+            self.apply_pragmas(self._connection)
+        return self._connection
+
+    def apply_pragmas(self, connection: sqlite3.Connection) -> None:
+        for name, value in self.pragmas.items():
+            if not str(name).isidentifier():
+                raise ValueError(f"Invalid pragma name {name}")
+            if not str(value).lstrip("-").isalnum():
+                raise ValueError(f"Invalid value {value} for pragma {name}")
+            connection.execute(f"pragma {name} = {value}")
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
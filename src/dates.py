@@ -0,0 +1,138 @@
+import re
+from functools import lru_cache
+
+import pandas as pd
+from dateutil.parser import parse
+
+# Candidates for the format of a column, most common spreadsheet formats
+# first; on a tie the earlier one wins, so slashes are read month first
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%d-%b-%y",
+    "%d-%b-%Y",
+    "%d.%m.%Y",
+    "%d.%m.%y",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%d %B %Y",
+    "%B %d, %Y",
+]
+
+# number of distinct strings the format of a column is inferred from
+FORMAT_SAMPLE_SIZE = 1000
+
+# a year with an optional circa and era, e.g. "1850", "c. 1600", "500BC", "AD 8"
+YEAR_PATTERN = re.compile(
+    r"^(?:c(?:irca|a)?\.?\s*)?(?:a\.?d\.?\s*)?(?P<year>-?\d{1,4})\s*"
+    r"(?P<era>b\.?c\.?(?:e\.?)?|a\.?d\.?|c\.?e\.?)?$",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=4096)
+def parse_fuzzy(value: str, dayfirst: bool = False):
+    """Parses a single odd date string, NaT if dateutil cannot make sense of it"""
+    try:
+        return pd.Timestamp(parse(value, fuzzy=True, dayfirst=dayfirst))
+    except (ValueError, OverflowError):
+        return pd.NaT
+
+
+def has_fixed_order(date_format: str) -> bool:
+    """Tells if no other format reads the same strings in another order"""
+    return date_format.startswith("%Y") or "%b" in date_format or "%B" in date_format
+
+
+def infer_date_format(uniques: pd.Series):
+    """Returns the format in DATE_FORMATS with numeric day and month that
+    parses most of a sample of the strings, or None if none parses any
+
+    It decides the order of day and month for the whole column; the other
+    formats cannot swap them.
+    """
+    sample = uniques.head(FORMAT_SAMPLE_SIZE)
+    best_format, best_count = None, 0
+    for date_format in DATE_FORMATS:
+        if has_fixed_order(date_format):
+            continue
+        count = pd.to_datetime(sample, format=date_format, errors="coerce").count()
+        if count > best_count:
+            best_format, best_count = date_format, count
+    return best_format
+
+
+def is_day_first(date_format: str) -> bool:
+    return date_format is not None and (
+        date_format.index("%d") < date_format.index("%m")
+    )
+
+
+def normalize_dates(values: pd.Series) -> tuple:
+    """Converts a column of date strings to datetime64
+
+    Every distinct string is parsed only once, by formats applied vectorized.
+    The order of day and month is inferred once per column, from the numeric
+    format most strings have, so every value of the column is read in the
+    same order. Besides that format only those that cannot swap day and
+    month, like ISO dates, are applied; only what is left after that goes
+    through fuzzy dateutil parsing, in the order of the column too. Returns
+    the converted series and the list of strings that could not be parsed.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, []
+    strings = values.where(values.isna(), values.astype(str).str.strip())
+    strings = strings.mask(strings == "")
+    uniques = pd.Series(strings.dropna().unique(), dtype=object)
+
+    date_format = infer_date_format(uniques)
+    formats = [date_format] if date_format is not None else []
+    formats += [other for other in DATE_FORMATS if has_fixed_order(other)]
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+    for other in formats:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(
+            uniques[missing], format=other, errors="coerce"
+        )
+    missing = parsed.isna()
+    if missing.any():
+        dayfirst = is_day_first(date_format)
+        parsed[missing] = pd.to_datetime(
+            uniques[missing].map(lambda value: parse_fuzzy(value, dayfirst))
+        )
+
+    unparseable = uniques[parsed.isna()].tolist()
+    lookup = pd.Series(parsed.values, index=uniques.values)
+    converted = pd.Series(
+        strings.map(lookup).values, index=values.index, name=values.name
+    ).astype("datetime64[ns]")
+    return converted, unparseable
+
+
+def parse_years(values: pd.Series) -> tuple:
+    """Converts a column of publication years to signed integers
+
+    Years before Christ become negative, so "500BC" is -500 and sorting by
+    the result is chronological. Every distinct string is matched once.
+    Returns the years as Int32, missing where empty or unparseable, and the
+    list of strings that could not be parsed.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("Int32"), []
+    strings = values.where(values.isna(), values.astype(str).str.strip())
+    strings = strings.mask(strings == "")
+    uniques = pd.Series(strings.dropna().unique(), dtype=object)
+
+    parts = uniques.str.extract(YEAR_PATTERN)
+    years = pd.to_numeric(parts["year"])
+    before_christ = parts["era"].str.lower().str.startswith("b").fillna(False)
+    years = years.where(~before_christ, -years)
+
+    unparseable = uniques[years.isna()].tolist()
+    lookup = pd.Series(years.values, index=uniques.values)
+    converted = pd.Series(
+        strings.map(lookup).values, index=values.index, name=values.name
+    ).astype("Int32")
+    return converted, unparseable
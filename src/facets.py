@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from src.years import YEAR_COLUMN
+
+# Columns the books are grouped by; Century is derived from the year
+FACET_COLUMNS = ("Status", "Owned", "Author", "Century")
+# label of the books without a value in the facet column
+MISSING = "(none)"
+
+
+def facet_values(data: pd.DataFrame, facet: str) -> pd.Series:
+    if facet == "Century":
+        return data[YEAR_COLUMN] // 100 * 100
+    return data[facet]
+
+
+def facet_value(data: pd.DataFrame, label, facet: str):
+    """The value of one book, read with scalar lookups instead of a row copy"""
+    if facet == "Century":
+        year = data.at[label, YEAR_COLUMN]
+        return year if pd.isna(year) else year // 100 * 100
+    return data.at[label, facet]
+
+
+class FacetEngine:
+    """Number of books, books read, pages and reading speed per facet value
+
+    The counts of all books are computed once by rebuild and kept current by
+    update_book, which moves one book between values in constant time, like
+    the totals of KpiEngine. summary aggregates any subset of the books, e.g.
+    a search result, in one vectorized pass per facet. Facets whose column is
+    not in the data are left out. Reading speeds come from the "Pages per
+    Day" column, so the KPI columns have to be current.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        columns = set(self.data.columns)
+        self.facets = [
+            facet
+            for facet in FACET_COLUMNS
+            if (YEAR_COLUMN if facet == "Century" else facet) in columns
+        ]
+        self.finished = self.data["Date Finished"].notna().to_numpy()
+        self.pages = self.data["Pages"].to_numpy(dtype=float, na_value=np.nan).copy()
+        self.speeds = (
+            self.data["Pages per Day"].to_numpy(dtype=float, na_value=np.nan).copy()
+        )
+        self.labels = {}
+        self.codes = {}
+        self.label_codes = {}
+        self.totals = {}
+        for facet in self.facets:
+            values = facet_values(self.data, facet).astype(object).to_numpy()
+            codes, uniques = pd.factorize(values)
+            labels = list(uniques) + [MISSING]
+            codes[codes == -1] = len(labels) - 1
+            self.labels[facet] = labels
+            self.codes[facet] = codes
+            self.label_codes[facet] = {label: code for code, label in enumerate(labels)}
+            self.totals[facet] = self._aggregate(codes, slice(None), len(labels))
+
+    def _aggregate(self, codes: np.ndarray, rows, size: int) -> np.ndarray:
+        """Sums books, books read, pages, speeds and speed count per code"""
+        codes = codes[rows]
+        pages = self.pages[rows]
+        speeds = self.speeds[rows]
+        has_pages = ~np.isnan(pages)
+        has_speed = ~np.isnan(speeds)
+        return np.stack(
+            [
+                np.bincount(codes, minlength=size),
+                np.bincount(codes, self.finished[rows], size),
+                np.bincount(codes[has_pages], pages[has_pages], size),
+                np.bincount(codes[has_speed], speeds[has_speed], size),
+                np.bincount(codes[has_speed], minlength=size),
+            ]
+        ).astype(float)
+
+    def update_book(self, position: int) -> None:
+        """Moves one book to its current facet values and measures"""
+        self._count(position, -1)
+        label = self.data.index[position]
+        self.finished[position] = pd.notna(self.data.at[label, "Date Finished"])
+        for column, measures in (("Pages", self.pages), ("Pages per Day", self.speeds)):
+            value = self.data.at[label, column]
+            measures[position] = value if pd.notna(value) else np.nan
+        for facet in self.facets:
+            value = facet_value(self.data, label, facet)
+            self.codes[facet][position] = self._code(facet, value)
+        self._count(position, 1)
+
+    def append_book(self) -> None:
+        """Adds the last row of the frame, which was just appended"""
+        self.finished = np.append(self.finished, False)
+        self.pages = np.append(self.pages, np.nan)
+        self.speeds = np.append(self.speeds, np.nan)
+        for facet in self.facets:
+            self.codes[facet] = np.append(
+                self.codes[facet], self.label_codes[facet][MISSING]
+            )
+        self._count(len(self.finished) - 1, 1)
+        self.update_book(len(self.finished) - 1)
+
+    def _code(self, facet: str, value) -> int:
+        if pd.isna(value):
+            value = MISSING
+        code = self.label_codes[facet].get(value)
+        if code is None:
+            code = self.label_codes[facet][value] = len(self.labels[facet])
+            self.labels[facet].append(value)
+            totals = self.totals[facet]
+            self.totals[facet] = np.hstack([totals, np.zeros((len(totals), 1))])
+        return code
+
+    def _count(self, position: int, sign: int) -> None:
+        pages = self.pages[position]
+        speed = self.speeds[position]
+        measures = sign * np.array(
+            [
+                1,
+                self.finished[position],
+                0 if np.isnan(pages) else pages,
+                0 if np.isnan(speed) else speed,
+                0 if np.isnan(speed) else 1,
+            ],
+            dtype=float,
+        )
+        for facet in self.facets:
+            self.totals[facet][:, self.codes[facet][position]] += measures
+
+    def summary(self, positions=None, limit: int = None) -> dict:
+        """Returns a frame per facet with the books, books read, pages and
+        average pages per day of each value, most books first
+
+        positions restricts the summary to those rows, e.g. a search result;
+        limit keeps only the values with the most books.
+        """
+        summaries = {}
+        for facet in self.facets:
+            labels = self.labels[facet]
+            if positions is None:
+                totals = self.totals[facet]
+            else:
+                totals = self._aggregate(
+                    self.codes[facet], np.asarray(positions, dtype=int), len(labels)
+                )
+            books, read, pages, speed_sum, speed_count = totals
+            with np.errstate(invalid="ignore", divide="ignore"):
+                speed = np.where(speed_count > 0, speed_sum / speed_count, np.nan)
+            summary = pd.DataFrame(
+                {
+                    "Books": books.astype(int),
+                    "Read": read.astype(int),
+                    "Pages": pages,
+                    "Pages per Day": speed,
+                },
+                index=pd.Index(labels, dtype=object, name=facet),
+            )
+            summary = summary[summary["Books"] > 0].sort_values(
+                "Books", ascending=False, kind="stable"
+            )
+            summaries[facet] = summary if limit is None else summary.head(limit)
+        return summaries
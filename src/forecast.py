@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# pages times simulations up to which every book gets its own drawn speed
+MAX_EXACT_DRAWS = 20_000_000
+# draws per block, bounds the memory of the exact simulation
+BLOCK_DRAWS = 1_000_000
+
+
+class FinishForecaster:
+    """Monte Carlo forecast of the date the whole list will be read
+
+    The reading speeds in pages per day of the finished books are fitted with
+    a log-normal distribution. Each simulation draws a speed for every unread
+    book and adds up the days needed for its pages; the order in which the
+    books are read does not change that sum, so no orders are shuffled. The
+    simulations run as array operations in blocks; when there are more
+    draws than MAX_EXACT_DRAWS, the sums are drawn from a log-normal
+    distribution with their mean and variance instead (Fenton-Wilkinson),
+    which is close for long lists and, unlike a normal one, never negative.
+    The simulated totals are cached until the data version of the model
+    changes, so asking for other percentiles or another day is immediate.
+    """
+
+    def __init__(self, model, simulations: int = 5000, seed: int = None):
+        self.model = model
+        self.simulations = simulations
+        self.seed = seed
+        self._days = None
+        self._version = None
+
+    def fit(self) -> tuple:
+        """Returns mu and sigma of the log of the reading speeds"""
+        speeds = self.model.kpis.speeds
+        speeds = speeds[np.isfinite(speeds) & (speeds > 0)]
+        if len(speeds) == 0:
+            raise ValueError("Finish a book with start and finish date first")
+        log_speeds = np.log(speeds)
+        sigma = log_speeds.std(ddof=1) if len(speeds) > 1 else 0.0
+        return log_speeds.mean(), sigma
+
+    def remaining_pages(self) -> np.ndarray:
+        """Pages left in the unread books, less those logged in reading sessions
+
+        Books of unknown length are taken to have the median length.
+        """
+        kpis = self.model.kpis
+        unread = ~kpis.finished
+        pages = kpis.pages[unread]
+        known = pages[~np.isnan(pages)]
+        fill = np.median(known) if len(known) else 0.0
+        pages = np.where(np.isnan(pages), fill, pages)
+        return np.clip(pages - self.model.pages_read()[unread], 0, None)
+
+    def simulate_days(self) -> np.ndarray:
+        """Returns the sorted simulated reading days for the unread books"""
+        if self._days is not None and self._version == self.model.data_version:
+            return self._days
+        mu, sigma = self.fit()
+        pages = self.remaining_pages()
+        rng = np.random.default_rng(self.seed)
+        # days per page is log-normal too, with the mean of the log negated
+        if len(pages) * self.simulations <= MAX_EXACT_DRAWS:
+            days = np.zeros(self.simulations)
+            block = max(1, BLOCK_DRAWS // self.simulations)
+            for start in range(0, len(pages), block):
+                chunk = pages[start : start + block]
+                per_page = rng.lognormal(-mu, sigma, (self.simulations, len(chunk)))
+                days += per_page @ chunk
+        else:
+            mean = pages.sum() * np.exp(-mu + sigma**2 / 2)
+            variance = (pages**2).sum() * (
+                (np.exp(sigma**2) - 1) * np.exp(-2 * mu + sigma**2)
+            )
+            sum_sigma = np.sqrt(np.log1p(variance / mean**2))
+            days = rng.lognormal(
+                np.log(mean) - sum_sigma**2 / 2, sum_sigma, self.simulations
+            )
+        self._days = np.sort(days)
+        self._version = self.model.data_version
+        return self._days
+
+    def forecast(
+        self, percentiles=(10, 50, 90), today: pd.Timestamp = None, birth_date=None
+    ) -> pd.DataFrame:
+        """Returns the finish date, and the age then if birth_date is given,
+        for each percentile of the simulations
+
+        The 90th percentile is the date by which the list is finished in 90%
+        of the simulations. Raises ValueError if no book has a reading speed.
+        """
+        days = np.percentile(self.simulate_days(), percentiles)
+        today = pd.Timestamp.today().normalize() if today is None else today
+        # rounded first, so that 20 days summed from fractions stay 20 days
+        finish = today + pd.to_timedelta(np.ceil(days.round(6)), unit="D")
+        forecast = pd.DataFrame(
+            {"Percentile": list(percentiles), "Finish Date": finish.date}
+        )
+        if birth_date is not None:
+            born = pd.Timestamp(birth_date)
+            # a year older on each birthday, not every 365.25 days
+            before_birthday = finish.month * 100 + finish.day < (
+                born.month * 100 + born.day
+            )
+            forecast["Age"] = finish.year - born.year - before_birthday
+        return forecast
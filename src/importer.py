@@ -1,20 +1,219 @@
 # Imports the data from the csv file into the database
+import hashlib
+import json
+import os
+
 import pandas as pd
-from dateutil.parser import parse
+from src.config import DATE_DTYPES, thaw
+from src.dates import normalize_dates
+from src.instrumentation import metrics, timed
 from src.model import Model
 
 
 class Importer:
     def __init__(self, config_file: str):
         self.model = Model(config_file)
+        self.unparseable_dates = {}
+        self.unparseable_years = []
+
+    @timed("importer.perform_import")
+    def perform_import(self, list_file: str = "list.tsv"):
+        """Streams the list into the database chunk by chunk
+
+        Each chunk is parsed with only the relevant columns, normalized and
+        appended to a staging table in its own transaction, so peak memory is
+        bounded by the chunk size. The staging table replaces the books table
+        in one final transaction.
+        """
+        config = self.model.config
+        con = self.model.database.connection
+        with con:
+            con.execute("drop table if exists books_import")
+        for chunk in self.read_list_in_chunks(list_file, config["import_chunksize"]):
+            self.normalize_chunk(chunk).to_sql(
+                "books_import", con=con, if_exists="append", index=True
+            )
+            metrics.count("importer.perform_import", "rows", len(chunk))
+        if metrics.enabled:
+            metrics.count(
+                "importer.perform_import", "bytes", os.path.getsize(list_file)
+            )
+        with con:
+            con.execute("begin")
+            con.execute("drop table if exists books")
+            con.execute('drop index if exists "ix_books_import_index"')
+            con.execute("alter table books_import rename to books")
+        self.model.create_id_index()
+        self.model.change_log.table_replaced()
+        self.model.data = None
+
+    @timed("importer.normalize_chunk")
+    def normalize_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        config = self.model.config
+        self.model.data = chunk
+        self.model.data = self.reduce_to_relevant_columns(list(config.relevant_columns))
+        self.model.data = self.convert_column_dtypes(config.column_dtypes)
+        unparseable = self.model.derive_publication_years()
+        if unparseable:
+            self.unparseable_years.extend(unparseable)
+            print(f"Could not read {len(unparseable)} publication years:")
+            print(", ".join(unparseable))
+        return self.model.data
+
+    @timed("importer.sync")
+    def sync(self, list_file: str = "list.tsv") -> str:
+        """Brings the database up to date with the list
+
+        The list and import settings are fingerprinted. If the fingerprint
+        matches the one stored with the last import nothing is done. A missing
+        books table triggers a full import, otherwise the changed list is merged
+        by merge_import, keeping the reading progress entered by the user.
+        Returns "unchanged", "imported" or "merged".
+        """
+        fingerprint = self.fingerprint(list_file)
+        if self.model.table_exists("books"):
+            if self.read_fingerprint() == fingerprint:
+                return "unchanged"
+            self.merge_import(list_file)
+            result = "merged"
+        else:
+            self.perform_import(list_file)
+            result = "imported"
+        self.write_fingerprint(fingerprint)
+        return result
+
+    def fingerprint(self, list_file: str) -> str:
+        """Hashes the list file together with the settings that shape the import"""
+        config = self.model.config
+        digest = hashlib.sha256()
+        with open(list_file, "rb") as stream:
+            for block in iter(lambda: stream.read(1 << 20), b""):
+                digest.update(block)
+        settings = {
+            key: thaw(config[key])
+            for key in (
+                "relevant_columns",
+                "column_dtypes",
+                "identity_columns",
+                "progress_columns",
+                "year_column",
+            )
+        }
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def read_fingerprint(self):
+        if not self.model.table_exists("import_meta"):
+            return None
+        row = self.model.database.connection.execute(
+            "select value from import_meta where key = 'fingerprint'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def write_fingerprint(self, fingerprint: str) -> None:
+        con = self.model.database.connection
+        with con:
+            con.execute(
+                "create table if not exists import_meta "
+                "(key text primary key, value text)"
+            )
+            con.execute(
+                "insert or replace into import_meta values ('fingerprint', ?)",
+                (fingerprint,),
+            )
+
+    @timed("importer.merge_import")
+    def merge_import(self, list_file: str = "list.tsv") -> tuple:
+        """Applies only the differences between the list and the database
 
-    def perform_import(self):
-        self.model.import_original_list("list.tsv")
-        self.model.data = self.reduce_to_relevant_columns(
-            self.model.config["relevant_columns"]
+        Books are matched on the identity columns. For matched books the list
+        columns are updated where they changed, while the progress columns keep
+        the value from the database unless it is empty there. Books that are
+        new in the list are added with fresh ids; books that disappeared from
+        the list and values that were cleared in it are kept. Returns the
+        number of updated and added books.
+        """
+        config = self.model.config
+        identity_columns = list(config["identity_columns"])
+        progress_columns = config["progress_columns"]
+
+        source = pd.concat(
+            [
+                self.normalize_chunk(chunk)
+                for chunk in self.read_list_in_chunks(
+                    list_file, config["import_chunksize"]
+                )
+            ],
+            ignore_index=True,
+        )
+        self.model.read_data_from_db()
+        existing = self.model.data
+        if set(source.columns) - set(existing.columns):
+            raise ValueError(
+                "The list has columns that are not in the database, "
+                "delete the database to import it again"
+            )
+
+        merged = source.assign(_key=self.identity_keys(source, identity_columns))
+        merged = merged.merge(
+            existing[["index"] + list(source.columns)].assign(
+                _key=self.identity_keys(existing, identity_columns)
+            ),
+            on="_key",
+            how="left",
+            suffixes=("", "_db"),
+        )
+
+        changes = pd.DataFrame(index=merged.index)
+        for column in source.columns:
+            # compare as objects, categoricals with other categories do not compare
+            new_values = merged[column].astype(object)
+            old_values = merged[f"{column}_db"].astype(object)
+            if column in progress_columns:
+                new_values = old_values.where(old_values.notna(), new_values)
+            unchanged = (new_values == old_values) | (
+                new_values.isna() & old_values.isna()
+            )
+            changes[column] = new_values.where(~unchanged)
+
+        matched = merged["index"].notna()
+        updated = 0
+        for position in changes.index[matched & changes.notna().any(axis=1)]:
+            values = changes.loc[position].dropna().to_dict()
+            self.model.update_book(int(merged.at[position, "index"]), values)
+            updated += 1
+
+        next_id = int(existing["index"].max()) + 1 if len(existing) else 0
+        added = 0
+        for book in source[~matched.values].to_dict("records"):
+            self.model.add_book({"index": next_id + added, **book})
+            added += 1
+
+        self.model.save_changes()
+        return updated, added
+
+    @staticmethod
+    def identity_keys(frame: pd.DataFrame, columns: list) -> pd.Series:
+        """Builds a normalized key per book, numbering repeated keys"""
+        keys = pd.Series("", index=frame.index)
+        for column in columns:
+            keys = keys + frame[column].astype(str).str.strip().str.casefold() + "\x1f"
+        return keys + keys.groupby(keys).cumcount().astype(str)
+
+    def read_list_in_chunks(self, list_file: str, chunksize: int):
+        """Reads the list in chunks, parsing only the relevant columns
+
+        Non-date dtypes from the config are applied while parsing; the date
+        columns are converted per chunk by convert_column_dtypes.
+        """
+        config = self.model.config
+        return pd.read_csv(
+            list_file,
+            sep="\t",
+            usecols=list(config.relevant_columns),
+            dtype=dict(config.parse_dtypes),
+            chunksize=chunksize,
         )
-        self.model.data = self.convert_column_dtypes(self.model.config["column_dtypes"])
-        self.model.data = self.model.write_to_sqlite()
 
     def reduce_to_relevant_columns(self, relevant_columns: list) -> pd.DataFrame:
         reduced_dataframe = self.model.data[relevant_columns]
@@ -29,40 +228,29 @@ class Importer:
             if column not in self.model.data.columns:
                 raise Exception(f"Column {column} not in dataframe")
 
-        # Check if date columns are in the correct format
-        for column_dtype in column_dtypes.items():
-            if column_dtype[1] in (
-                "datetime64",
-                "date",
-                "time",
-                "datetime",
-                "timedelta",
-            ):
-                column_dtypes[
-                    column_dtype[0]
-                ] = "datetime64"  # Make sure the desired dtype is datetime64
-                try:
-                    pd.to_datetime(self.model.data[column_dtype[0]])
-                except ValueError:
-                    print(f"Column {column} is not in the correct format")
-                    print(
-                        "Trying to convert to datetime64 compatible format automatically"
-                    )
-                    self.model.data[
-                        column_dtype[0]
-                    ] = self.convert_dates_to_correct_format(column_dtype[0])
+        # Convert date columns, whatever format the spreadsheet used; the
+        # given dtypes are left as they are, they may be shared by the config
+        target_dtypes = dict(column_dtypes)
+        for column, dtype in column_dtypes.items():
+            if dtype in DATE_DTYPES:
+                target_dtypes[
+                    column
+                ] = "datetime64"  # Make sure the dtype is datetime64
+                self.model.data[column] = self.convert_dates_to_correct_format(column)
 
         # Convert the dtypes to the specified dtypes
-        self.model.data = self.model.data.astype(column_dtypes)
+        self.model.data = self.model.data.astype(target_dtypes)
         return self.model.data
 
     def convert_dates_to_correct_format(self, column: str) -> pd.Series:
-        """Converts the dates in the column to the correct format"""
-        try:
-            self.model.data[column] = self.model.data.apply(
-                lambda x: parse(x[column], fuzzy=True), axis=1
-            )
-        except pd.errors.ParserError:
-            f"Could not convert {column} to datetime64 compatible format"
-            return False
+        """Converts the dates in the column to datetime64
+
+        Cells that cannot be parsed become NaT and are collected in
+        unparseable_dates instead of failing the import.
+        """
+        self.model.data[column], unparseable = normalize_dates(self.model.data[column])
+        if unparseable:
+            self.unparseable_dates.setdefault(column, []).extend(unparseable)
+            print(f"Could not convert {len(unparseable)} values in column {column}:")
+            print(", ".join(unparseable))
         return self.model.data[column]
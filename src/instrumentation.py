@@ -0,0 +1,201 @@
+# Opt-in timing of the hot paths, exported as JSON or Prometheus text
+import contextlib
+import functools
+import inspect
+import json
+import threading
+import time
+
+# upper bounds of the duration histogram buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class Metrics:
+    """Counters and duration histograms per operation
+
+    Operations are dotted names such as "model.read_data_from_db". Counters
+    hold totals like rows or bytes, histograms the durations of the calls.
+    While disabled every method returns at once, so instrumented code only
+    pays for one attribute check.
+    """
+
+    def __init__(self, enabled: bool = False, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, operation: str, name: str, amount: float = 1) -> None:
+        """Adds amount to the counter name of the operation, e.g. rows"""
+        if not self.enabled:
+            return
+        with self.lock:
+            key = (name, operation)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, operation: str, seconds: float) -> None:
+        """Records the duration of one call of the operation"""
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = {
+                    "count": 0,
+                    "sum": 0.0,
+                    "buckets": [0] * len(self.buckets),
+                }
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][position] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            counters = {}
+            for (name, operation), value in sorted(self.counters.items()):
+                counters.setdefault(name, {})[operation] = value
+            histograms = {
+                operation: {
+                    "count": histogram["count"],
+                    "sum": histogram["sum"],
+                    "buckets": dict(zip(map(str, self.buckets), histogram["buckets"])),
+                }
+                for operation, histogram in sorted(self.histograms.items())
+            }
+        return {"counters": counters, "durations": histograms}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Renders the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, operations in snapshot["counters"].items():
+            metric = f"books_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for operation, value in operations.items():
+                lines.append(f'{metric}{{operation="{operation}"}} {value}')
+        if snapshot["durations"]:
+            lines.append("# TYPE books_duration_seconds histogram")
+        for operation, histogram in snapshot["durations"].items():
+            label = f'operation="{operation}"'
+            for bound, count in histogram["buckets"].items():
+                lines.append(
+                    f'books_duration_seconds_bucket{{{label},le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'books_duration_seconds_bucket{{{label},le="+Inf"}} '
+                f'{histogram["count"]}'
+            )
+            lines.append(f"books_duration_seconds_sum{{{label}}} {histogram['sum']}")
+            lines.append(
+                f"books_duration_seconds_count{{{label}}} {histogram['count']}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str, export_format: str = None) -> None:
+        """Writes the metrics to path, as Prometheus text for .prom files"""
+        if export_format is None:
+            export_format = "prometheus" if path.endswith(".prom") else "json"
+        if export_format not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics format {export_format}")
+        text = self.to_prometheus() if export_format == "prometheus" else self.to_json()
+        with open(path, "w") as stream:
+            stream.write(text)
+
+
+metrics = Metrics()
+# where close_session writes the metrics, set by configure
+_export_settings = {}
+
+
+def configure(settings: dict = None) -> None:
+    """Applies the instrumentation section of the config
+
+    The section has the keys enabled, path and format; without it, or with
+    enabled false, instrumentation stays off.
+    """
+    settings = settings or {}
+    metrics.enabled = bool(settings.get("enabled", False))
+    _export_settings.clear()
+    if metrics.enabled and settings.get("path"):
+        _export_settings.update(path=settings["path"], format=settings.get("format"))
+
+
+def close_session() -> None:
+    """Writes the metrics to the configured path, if any"""
+    if metrics.enabled and _export_settings:
+        metrics.export(_export_settings["path"], _export_settings["format"])
+
+
+def timed(operation: str):
+    """Decorator recording the duration and number of calls of a function"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.observe(operation, time.perf_counter() - start)
+                metrics.count(operation, "calls")
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def timer(operation: str):
+    """Like timed, for a block of a function
+
+    For functions waiting for the user, e.g. at an input prompt, where only
+    the work after the answer is of interest.
+    """
+    if not metrics.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(operation, time.perf_counter() - start)
+        metrics.count(operation, "calls")
+
+
+def slot(operation: str):
+    """Like timed, for methods connected to Qt signals
+
+    Qt passes all signal arguments, e.g. the checked state of a button, to
+    a wrapper that accepts any arguments; the ones the method does not take
+    are dropped here.
+    """
+
+    def decorator(function):
+        parameters = inspect.signature(function).parameters.values()
+        if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+            accepted = None
+        else:
+            accepted = sum(
+                p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+                for p in parameters
+            )
+        timed_function = timed(operation)(function)
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            return timed_function(*args[:accepted])
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+# Columns whose values the derived reading columns depend on
+KPI_INPUT_COLUMNS = ("Pages", "Date Started", "Date Finished")
+# Columns computed from them
+KPI_DERIVED_COLUMNS = ("Days Read", "Pages per Day")
+
+
+def reading_days_and_speed(date_started, date_finished, pages: float) -> tuple:
+    """Returns Days Read and Pages per Day of one book, NaN unless it was read"""
+    if pd.isna(date_started) or pd.isna(date_finished):
+        return np.nan, np.nan
+    days = (date_finished - date_started).days
+    return days, pages / max(days, 1)
+
+
+class KpiEngine:
+    """Derived reading columns and running totals for a frame of books
+
+    rebuild computes "Days Read" and "Pages per Day" for every book in one
+    vectorized pass and sums up the totals. After that, update_book only
+    recomputes one book and adjusts the totals by the difference, so the
+    figures on the progress screen stay current in constant time per edit.
+    A book counts as read once it has a finish date; its reading speed only
+    counts if it also has a start date. Books finished on the day they were
+    started count as one reading day.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        started = self.data["Date Started"].notna().to_numpy()
+        finished = self.data["Date Finished"].notna().to_numpy()
+        days = (self.data["Date Finished"] - self.data["Date Started"]).dt.days
+        speed = self.data["Pages"] / days.clip(lower=1)
+        self.data["Days Read"] = days
+        self.data["Pages per Day"] = speed
+
+        self.started = started.copy()
+        self.finished = finished.copy()
+        self.speeds = speed.to_numpy(dtype=float, na_value=np.nan).copy()
+        self.pages = self.data["Pages"].to_numpy(dtype=float, na_value=np.nan).copy()
+
+        has_speed = ~np.isnan(self.speeds)
+        self.book_count = len(self.data)
+        self.started_count = int(started.sum())
+        self.finished_count = int(finished.sum())
+        self.speed_count = int(has_speed.sum())
+        self.speed_sum = float(self.speeds[has_speed].sum())
+        self.pages_read = float(np.nansum(self.pages[finished]))
+
+    def update_book(self, position: int) -> None:
+        """Recomputes one book and adjusts the totals by the difference"""
+        self._remove(position)
+        # scalar lookups, a row copy costs more than the whole update
+        label = self.data.index[position]
+        date_started = self.data.at[label, "Date Started"]
+        date_finished = self.data.at[label, "Date Finished"]
+        pages = self.data.at[label, "Pages"]
+        started = pd.notna(date_started)
+        finished = pd.notna(date_finished)
+        pages = float(pages) if pd.notna(pages) else np.nan
+        days, speed = reading_days_and_speed(date_started, date_finished, pages)
+        self.data.at[label, "Days Read"] = days
+        self.data.at[label, "Pages per Day"] = speed
+
+        self.started[position] = started
+        self.finished[position] = finished
+        self.speeds[position] = speed
+        self.pages[position] = pages
+        self._add(position)
+
+    def append_book(self) -> None:
+        """Adds the last row of the frame, which was just appended"""
+        self.started = np.append(self.started, False)
+        self.finished = np.append(self.finished, False)
+        self.speeds = np.append(self.speeds, np.nan)
+        self.pages = np.append(self.pages, np.nan)
+        self.book_count += 1
+        self.update_book(len(self.data) - 1)
+
+    def _remove(self, position: int) -> None:
+        self._count(position, -1)
+
+    def _add(self, position: int) -> None:
+        self._count(position, 1)
+
+    def _count(self, position: int, sign: int) -> None:
+        self.started_count += sign * int(self.started[position])
+        self.finished_count += sign * int(self.finished[position])
+        if self.finished[position] and not np.isnan(self.pages[position]):
+            self.pages_read += sign * self.pages[position]
+        if not np.isnan(self.speeds[position]):
+            self.speed_count += sign
+            self.speed_sum += sign * self.speeds[position]
+
+    @property
+    def unread_count(self) -> int:
+        return self.book_count - self.finished_count
+
+    @property
+    def average_speed(self) -> float:
+        """Mean pages per day over all books with start and finish date"""
+        if self.speed_count == 0:
+            return 0.0
+        return self.speed_sum / self.speed_count
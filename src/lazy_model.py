@@ -0,0 +1,264 @@
+import numpy as np
+import pandas as pd
+from src.changes import ConflictError
+from src.config import load_config
+from src.instrumentation import metrics, timed
+from src.kpi import KPI_DERIVED_COLUMNS, KPI_INPUT_COLUMNS, reading_days_and_speed
+from src.model import Model
+from src.search import parse_query
+
+
+class NotLoadedError(RuntimeError):
+    """Raised by LazyModel for features that need all books in memory"""
+
+
+def open_model(config_file: str) -> Model:
+    """Returns the backend the config selects, before the books are read"""
+    if load_config(config_file)["backend"] == "lazy":
+        return LazyModel(config_file)
+    return Model(config_file)
+
+
+def _needs_loaded_books(feature: str):
+    def refuse(self, *args, **kwargs):
+        raise NotLoadedError(f"{feature} needs the memory backend")
+
+    return refuse
+
+
+class LazyModel(Model):
+    """Model backend that leaves the books in SQLite and loads only what a view needs
+
+    Filters, projections and pagination are pushed down into the SQL query, so
+    memory use and startup time do not grow with the size of the table. Edits
+    and new books are buffered per book and written in one transaction by
+    save_changes, which reports conflicts with other programs like Model.
+    Features computed over all books raise NotLoadedError.
+    """
+
+    book_index = property(_needs_loaded_books("Looking up books by position"))
+    kpis = property(_needs_loaded_books("Reading statistics"))
+    facets = property(_needs_loaded_books("Statistics by facet"))
+    forecaster = property(_needs_loaded_books("The finish date forecast"))
+    year_index = property(_needs_loaded_books("Searching by year"))
+    books_by_year = _needs_loaded_books("Searching by year")
+    search_index = _needs_loaded_books("Full-text search")
+    pages_read = _needs_loaded_books("Pages read per book")
+    memory_usage = _needs_loaded_books("Memory usage")
+    write_to_sqlite = _needs_loaded_books("Writing the whole table")
+    export_books = _needs_loaded_books("Exporting the books")
+    import_books = _needs_loaded_books("Importing the books")
+
+    def __init__(self, config_file: str):
+        super().__init__(config_file)
+        self.columns = []
+        self.pending_changes = {}
+        self.new_books = set()
+
+    def read_data_from_db(self):
+        # only the table layout is read, rows are fetched by the queries below
+        con = self.database.connection
+        self.columns = [row[1] for row in con.execute("pragma table_info(books)")]
+        self.pending_changes = {}
+        self.new_books = set()
+        self.dirty_rows = set()
+        self.change_log.mark_synced()
+
+    @timed("lazy_model.query")
+    def query(
+        self,
+        columns: list = None,
+        where: str = None,
+        params: tuple = (),
+        order_by: str = "index",
+        limit: int = None,
+        offset: int = None,
+    ) -> pd.DataFrame:
+        """Fetches the given columns of the rows matching the where clause
+
+        The book id is always part of the result so that unsaved edits can be
+        applied to the rows that are returned.
+        """
+        columns = self.columns if columns is None else columns
+        columns = ["index"] + [column for column in columns if column != "index"]
+        for column in columns + [order_by]:
+            if column not in self.columns:
+                raise KeyError(f"Column {column} not in books table")
+
+        sql = "select " + ", ".join(f'"{column}"' for column in columns)
+        sql += " from books"
+        if where:
+            sql += f" where {where}"
+        sql += f' order by "{order_by}"'
+        params = list(params)
+        if limit is not None:
+            sql += " limit ?"
+            params.append(limit)
+            if offset:
+                sql += " offset ?"
+                params.append(offset)
+
+        frame = pd.read_sql(sql, con=self.database.connection, params=params)
+        for column in self.config.date_columns:
+            if column in frame.columns:
+                frame[column] = pd.to_datetime(frame[column])
+        if metrics.enabled:
+            self.count_rows("lazy_model.query", frame)
+        return self._apply_pending_changes(frame)
+
+    def _apply_pending_changes(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if not self.pending_changes:
+            return frame
+        for position, book_id in enumerate(frame["index"].tolist()):
+            for column, value in self.pending_changes.get(book_id, {}).items():
+                if column in frame.columns:
+                    frame.loc[frame.index[position], column] = value
+        return frame
+
+    def count(self, where: str = None, params: tuple = ()) -> int:
+        sql = "select count(*) from books"
+        if where:
+            sql += f" where {where}"
+        return self.database.connection.execute(sql, params).fetchone()[0]
+
+    def page(self, after_id: int = None, limit: int = 50, columns: list = None):
+        """Returns the next page of books ordered by id (keyset pagination)"""
+        if after_id is None:
+            return self.query(columns, limit=limit)
+        # numpy integers would be bound as blobs, which sort after all numbers
+        return self.query(columns, '"index" > ?', (int(after_id),), limit=limit)
+
+    def get_book(self, book_id: int) -> pd.DataFrame:
+        return self.query(where='"index" = ?', params=(book_id,))
+
+    def search(self, column: str, query: str, limit: int = None) -> pd.DataFrame:
+        """Returns the books whose column contains all words of the query
+
+        Quoted phrases have to appear as written. Matching uses SQLite's LIKE,
+        which ignores case for ASCII letters only.
+        """
+        if column not in self.columns:
+            raise KeyError(f"Column {column} not in books table")
+        phrases, terms = parse_query(query)
+        patterns = [" ".join(phrase) for phrase in phrases] + terms
+        where = " and ".join(f'"{column}" like ?' for _ in patterns)
+        params = tuple(f"%{pattern}%" for pattern in patterns)
+        return self.query(where=where or None, params=params, limit=limit)
+
+    def add_book(self, book: dict) -> None:
+        """Buffers a new book until save_changes inserts it
+
+        Queries only return the book once it is saved.
+        """
+        book_id = book["index"]
+        if book_id in self.pending_changes or self.count('"index" = ?', (book_id,)):
+            raise KeyError(f"Book id {book_id} already exists")
+        values = {column: value for column, value in book.items() if column != "index"}
+        self.new_books.add(book_id)
+        self._buffer(book_id, values)
+
+    def update_book(self, book_id: int, values: dict) -> pd.DataFrame:
+        """Buffers new column values of a book until save_changes is called"""
+        if book_id not in self.pending_changes and not self.count(
+            '"index" = ?', (book_id,)
+        ):
+            raise KeyError(f"No book with id {book_id}")
+        self._buffer(book_id, values)
+        return self.get_book(book_id)
+
+    def _buffer(self, book_id: int, values: dict) -> None:
+        for column in values:
+            if column not in self.columns:
+                raise KeyError(f"Column {column} not in books table")
+        if book_id not in self.pending_changes:
+            # rows are read when queried, so an edit is based on the table
+            # as of the first edit rather than as of loading
+            self.change_log.books[book_id] = self.change_log.last()
+        self.pending_changes.setdefault(book_id, {}).update(values)
+        if any(column in KPI_INPUT_COLUMNS for column in values):
+            self._update_derived(book_id)
+        self.dirty_rows.add(book_id)
+        self.data_version += 1
+
+    def _update_derived(self, book_id: int) -> None:
+        # the derived reading columns are saved, so they follow their inputs
+        columns = KPI_INPUT_COLUMNS + KPI_DERIVED_COLUMNS
+        if not all(column in self.columns for column in columns):
+            return
+        pending = self.pending_changes[book_id]
+        if book_id in self.new_books:
+            book = {column: pending.get(column) for column in KPI_INPUT_COLUMNS}
+        else:
+            book = self.query(list(KPI_INPUT_COLUMNS), '"index" = ?', (book_id,))
+            book = book.iloc[0]
+        pages = float(book["Pages"]) if pd.notna(book["Pages"]) else np.nan
+        days, speed = reading_days_and_speed(
+            pd.to_datetime(book["Date Started"]),
+            pd.to_datetime(book["Date Finished"]),
+            pages,
+        )
+        pending.update({"Days Read": days, "Pages per Day": speed})
+
+    def log_session(self, book_id: int, pages: int, date=None) -> None:
+        if not self.count('"index" = ?', (book_id,)):
+            raise KeyError(f"No book with id {book_id}")
+        self.reading_log.log_session(book_id, pages, date)
+        self.data_version += 1
+
+    def refresh(self, overwrite_dirty: bool = False) -> list:
+        """Discards the edits of books another program saved, if overwrite_dirty"""
+        # queries always read the current rows, there is nothing to reload
+        if not overwrite_dirty:
+            return []
+        conflicts = sorted(self.change_log.conflicts(self.dirty_rows))
+        for book_id in conflicts:
+            del self.pending_changes[book_id]
+            self.new_books.discard(book_id)
+            self.dirty_rows.discard(book_id)
+            self.change_log.books.pop(book_id, None)
+        if conflicts:
+            self.data_version += 1
+        return conflicts
+
+    @timed("lazy_model.save_changes")
+    def save_changes(self, force: bool = False) -> int:
+        """Writes the buffered edits and new books in a single transaction
+
+        Raises ConflictError and writes nothing if another program saved any
+        of the buffered books since they were first edited, unless force is
+        set. Returns the number of books written.
+        """
+        if not self.pending_changes:
+            return 0
+        self.create_id_index()
+        self.change_log.create()
+        con = self.database.connection
+        with con:
+            con.execute("begin immediate")
+            conflicts = set() if force else self.change_log.conflicts(self.dirty_rows)
+            if conflicts:
+                raise ConflictError(conflicts)
+            for book_id, values in self.pending_changes.items():
+                sql_values = [self._to_sql_value(value) for value in values.values()]
+                if book_id in self.new_books:
+                    column_names = ", ".join(
+                        f'"{column}"' for column in ["index", *values]
+                    )
+                    placeholders = ", ".join("?" for _ in range(len(values) + 1))
+                    con.execute(
+                        f"insert into books ({column_names}) values ({placeholders})",
+                        [book_id] + sql_values,
+                    )
+                elif values:
+                    assignments = ", ".join(f'"{column}" = ?' for column in values)
+                    con.execute(
+                        f'update books set {assignments} where "index" = ?',
+                        sql_values + [book_id],
+                    )
+            self.change_log.prune()
+        saved = len(self.pending_changes)
+        self.pending_changes = {}
+        self.new_books = set()
+        self.dirty_rows = set()
+        self.change_log.books = {}
+        return saved
@@ -1,46 +1,648 @@
+import json
+
+import numpy as np
 import pandas as pd
-import sqlite3
-import yaml
+from src import columnar
+from src.changes import ChangeLog, ConflictError, refresh_books
+from src.config import Config, is_compact_dtype, load_config, thaw
+from src.database import Database
+from src.dates import parse_years
+from src.facets import FacetEngine
+from src.forecast import FinishForecaster
+from src.instrumentation import close_session, configure, metrics, timed
+from src.kpi import KPI_INPUT_COLUMNS, KpiEngine
+from src.search import SearchIndex
+from src.sessions import ReadingLog
+from src.years import YEAR_COLUMN, YearIndex
+
+# up to this many books edited together adjust the KPI and facet totals book
+# by book, more rebuild them
+INCREMENTAL_UPDATE_LIMIT = 100
 
 
 class Model:
-    def __init__(self, config_file: yaml):
+    def __init__(self, config_file: str):
+        # increases with every change of data, caches compare against it
+        self.data_version = 0
         self.data = None
+        self._database = None
+        self._forecaster = None
+        self._reading_log = None
+        self._change_log = None
         self.config = self.read_config_file(config_file)
+        configure(self.config["instrumentation"])
 
-    def read_data_from_db(self):
-        self.data = pd.read_sql(
-            "select * from books", con=sqlite3.connect(self.config["db_name"])
+    @property
+    def data(self) -> pd.DataFrame:
+        return self._data
+
+    @data.setter
+    def data(self, data: pd.DataFrame):
+        # a new frame invalidates the indexes, they are rebuilt on next lookup
+        self._data = data
+        self.data_version += 1
+        self.dirty_rows = set()
+        self._book_index = None
+        self._id_order = None
+        self._search_indexes = {}
+        self._kpis = None
+        self._facets = None
+        self._year_index = None
+
+    @property
+    def book_index(self) -> dict:
+        """Maps each book id to its row position in data"""
+        if self._book_index is None:
+            self._book_index = {
+                book_id: position
+                for position, book_id in enumerate(self._data["index"].tolist())
+            }
+        return self._book_index
+
+    def book_positions(self, ids: pd.Series) -> pd.Series:
+        """Looks up the row positions of the ids, NaN where an id is unknown"""
+        # a dict lookup per id, Series.map would first copy the whole index
+        return pd.Series(
+            [self.book_index.get(book_id) for book_id in ids],
+            index=ids.index,
+            dtype=float,
         )
-        date_columns = [
-            k for k, v in self.config["column_dtypes"].items() if v == "date"
+
+    def page(self, after_id: int = None, limit: int = 50, columns: list = None):
+        """Returns the next books ordered by id (keyset pagination)
+
+        Starts after the book with id after_id, or at the lowest id if None.
+        """
+        if self._id_order is None:
+            ids = self._data["index"].to_numpy()
+            self._id_order = np.argsort(ids, kind="stable")
+            self._sorted_ids = ids[self._id_order]
+        start = (
+            0
+            if after_id is None
+            else np.searchsorted(self._sorted_ids, after_id, "right")
+        )
+        books = self._data.iloc[self._id_order[start : start + limit]]
+        return books if columns is None else books[["index"] + columns]
+
+    @property
+    def kpis(self) -> KpiEngine:
+        """Reading statistics, computed on first use and kept current by edits"""
+        if self._kpis is None:
+            self._kpis = KpiEngine(self._data)
+        return self._kpis
+
+    @property
+    def forecaster(self) -> FinishForecaster:
+        """Finish date forecast, its simulations are cached per data version"""
+        if self._forecaster is None:
+            self._forecaster = FinishForecaster(
+                self, self.config["forecast_simulations"]
+            )
+        return self._forecaster
+
+    @property
+    def facets(self) -> FacetEngine:
+        """Counts per Status, Owned, Author and century, kept current by edits"""
+        if self._facets is None:
+            self.kpis  # the reading speeds have to be computed first
+            self._facets = FacetEngine(self._data)
+        return self._facets
+
+    def facet_summary(self, positions=None, limit: int = None) -> dict:
+        """Returns the facets of all books or of the books at positions"""
+        return self.facets.summary(positions, limit)
+
+    def calculate_average_reading_speed(self) -> float:
+        return self.kpis.average_speed
+
+    def reading_progress(self) -> pd.DataFrame:
+        """Returns the finished books with reading days and speed by start date"""
+        self.kpis
+        finished = self.data[
+            self.data["Date Started"].notna() & self.data["Date Finished"].notna()
         ]
-        self.data = self.convert_columns_to_datetime(date_columns)
+        progress = finished[["Title", "Date Started"]].assign(
+            **{
+                "Reading Days": finished["Days Read"].clip(lower=1),
+                "Reading Speed": finished["Pages per Day"],
+            }
+        )
+        return progress.sort_values(by="Date Started")
+
+    def search_index(self, column: str) -> SearchIndex:
+        """Returns the full-text index of a column, building it on first use"""
+        if column not in self._search_indexes:
+            self._search_indexes[column] = SearchIndex(self._data[column].tolist())
+        return self._search_indexes[column]
+
+    def search_positions(self, column: str, query: str) -> list:
+        """Returns the row positions of the books matching the query"""
+        return self.search_index(column).search(query)
+
+    @timed("model.search")
+    def search(self, column: str, query: str) -> pd.DataFrame:
+        """Returns the books whose column matches the query, best match first"""
+        return self.data.iloc[self.search_positions(column, query)]
+
+    def derive_publication_years(self) -> list:
+        """Sets the Year column from the year column of the config
+
+        Returns the values that are not a year, e.g. "unknown".
+        """
+        source = self.config["year_column"]
+        if source not in self.config.relevant_columns:
+            return []
+        self._data[YEAR_COLUMN], unparseable = parse_years(self._data[source])
+        self._year_index = None
+        return unparseable
+
+    @property
+    def year_index(self) -> YearIndex:
+        """Books sorted by publication year, rebuilt on first use after a change"""
+        if self._year_index is None:
+            self._year_index = YearIndex(self._data[YEAR_COLUMN])
+        return self._year_index
+
+    def books_by_year(self, first: int = None, last: int = None) -> pd.DataFrame:
+        """Returns the books published from first to last, oldest first
+
+        Years before Christ are negative; a missing bound leaves the range open.
+        """
+        return self._data.iloc[self.year_index.between(first, last)]
+
+    def year_facets(self, width: int = 10) -> pd.Series:
+        """Counts the books per decade (width 10), century (100) or other period"""
+        return self.year_index.facets(width)
+
+    def _update_years(self, labels, columns) -> None:
+        # keeps the derived year in step with edits of the year column
+        source = self.config["year_column"]
+        if source in columns and YEAR_COLUMN in self._data.columns:
+            self._data.loc[labels, YEAR_COLUMN] = parse_years(
+                self._data.loc[labels, source]
+            )[0]
+        if source in columns or YEAR_COLUMN in columns:
+            self._year_index = None
+
+    @property
+    def database(self) -> Database:
+        if self._database is None:
+            self._database = Database(
+                self.config["db_name"], self.config["sqlite_pragmas"]
+            )
+        return self._database
+
+    @property
+    def reading_log(self) -> ReadingLog:
+        """Reading sessions in the database, the tables are created on first use"""
+        if self._reading_log is None:
+            self._reading_log = ReadingLog(self.database.connection)
+        return self._reading_log
+
+    @property
+    def change_log(self) -> ChangeLog:
+        """Books changed by any program, the tables are created on first save"""
+        if self._change_log is None:
+            self._change_log = ChangeLog(self.database.connection)
+        return self._change_log
+
+    def log_session(self, book_id: int, pages: int, date=None) -> None:
+        """Logs pages read in a book on date (today if None), saved right away"""
+        if book_id not in self.book_index:
+            raise KeyError(f"No book with id {book_id}")
+        self.reading_log.log_session(book_id, pages, date)
+        self.data_version += 1
+
+    def log_sessions(self, sessions: pd.DataFrame) -> int:
+        """Logs many sessions in one transaction, see ReadingLog.log_sessions"""
+        ids = sessions["index"]
+        unknown = self.book_positions(ids).isna()
+        if unknown.any():
+            raise KeyError(f"No books with ids {ids[unknown].tolist()}")
+        logged = self.reading_log.log_sessions(sessions)
+        self.data_version += 1
+        return logged
+
+    def pages_read(self) -> np.ndarray:
+        """Returns the pages logged in reading sessions for each book of data"""
+        read = np.zeros(len(self._data))
+        if self._reading_log is None and not self.table_exists("book_progress"):
+            return read
+        progress = self.reading_log.progress()
+        positions = self.book_positions(progress["book_id"])
+        known = positions.notna().to_numpy()
+        read[positions[known].astype(int)] = progress["pages_read"][known]
+        return read
+
+    def close(self) -> None:
+        if self._database is not None:
+            self._database.close()
+        close_session()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @timed("model.read_data_from_db")
+    def read_data_from_db(self):
+        """Loads the books table with the dtypes from the config
+
+        If a snapshot file is configured and its version matches the table,
+        the typed frame is read from it instead; otherwise the snapshot is
+        rewritten after the table was loaded and converted.
+        """
+        # the position in the change log is taken before reading, so changes
+        # committed meanwhile are found by the next refresh
+        self.change_log.mark_synced()
+        snapshot = self.config["snapshot"]
+        version = self.snapshot_version() if snapshot else None
+        if version is not None and self.read_snapshot(snapshot, version):
+            return
+        self.data = pd.read_sql("select * from books", con=self.database.connection)
+        self.data = self.convert_columns_to_datetime(self.config.date_columns)
+        self.data = self.convert_columns_to_compact_dtypes(self.config.compact_dtypes)
+        self.derive_publication_years()
+        if metrics.enabled:
+            self.count_rows("model.read_data_from_db", self.data)
+        if version is not None:
+            self.write_snapshot(snapshot, version)
 
+    def snapshot_version(self) -> dict:
+        """Identifies the books table and its dtypes, None before the first save"""
+        version = self.change_log.version()
+        if version is None:
+            return None
+        con = self.database.connection
+        return {
+            **version,
+            "schema_version": con.execute("pragma schema_version").fetchone()[0],
+            "column_dtypes": thaw(self.config.column_dtypes),
+            # the derived Year column is stored in the snapshot too
+            "year_column": self.config["year_column"],
+        }
+
+    def changed_elsewhere(self) -> bool:
+        """Tells without a query whether another connection committed anything"""
+        return self._change_log is not None and self._change_log.changed_elsewhere()
+
+    @timed("model.refresh")
+    def refresh(self, overwrite_dirty: bool = False) -> list:
+        """Loads the books other programs saved, returns their ids"""
+        if self._change_log is None:
+            return []
+        return refresh_books(self, overwrite_dirty)
+
+    @timed("model.read_snapshot")
+    def read_snapshot(self, path: str, version: dict) -> bool:
+        """Loads data from the snapshot if it has the given version"""
+        try:
+            table = columnar.read_table(path, format="feather")
+        except (ImportError, OSError, ValueError):
+            return False
+        stored = (table.schema.metadata or {}).get(b"books_version")
+        if stored is None or json.loads(stored) != version:
+            return False
+        # columns converted without a copy point into the read-only mapped
+        # file, but the model edits its frame in place
+        self.data = table.to_pandas().copy()
+        if metrics.enabled:
+            self.count_rows("model.read_snapshot", self.data)
+        return True
+
+    def write_snapshot(self, path: str, version: dict) -> bool:
+        """Stores data with its version as Feather, if pyarrow is installed"""
+        try:
+            columnar.write_books(
+                self.data,
+                path,
+                format="feather",
+                metadata={b"books_version": json.dumps(version)},
+            )
+        except (ImportError, OSError, ValueError):
+            return False
+        return True
+
+    @timed("model.export_books")
+    def export_books(self, path: str, format: str = None) -> int:
+        """Writes the books with their dtypes to a Parquet or Feather file
+
+        The format is taken from the suffix of path unless given. Returns the
+        number of books written.
+        """
+        columnar.write_books(self.data, path, format)
+        if metrics.enabled:
+            self.count_rows("model.export_books", self.data)
+        return len(self.data)
+
+    @timed("model.import_books")
+    def import_books(self, path: str, format: str = None) -> int:
+        """Replaces the books with those of a Parquet or Feather file
+
+        The file has to have the book id column; the books table is rewritten
+        with the imported books. Returns the number of books imported.
+        """
+        books = columnar.read_books(path, format=format)
+        if "index" not in books.columns:
+            raise ValueError(f"{path} has no book id (index) column")
+        if books["index"].duplicated().any():
+            raise ValueError(f"{path} has repeated book ids")
+        # read_books may map the file read-only, the model edits in place
+        self.data = books.copy()
+        self.write_to_sqlite(write_index=False)
+        if metrics.enabled:
+            self.count_rows("model.import_books", self.data)
+        return len(self.data)
+
+    @timed("model.convert_columns_to_datetime")
     def convert_columns_to_datetime(self, columns: list):
         for column in columns:
             self.data[column] = pd.to_datetime(self.data[column])
         return self.data
 
-    def read_config_file(self, config_file: yaml) -> dict:
-        # read yaml config file and return as dict
-        with open(config_file, "r") as stream:
+    def convert_columns_to_compact_dtypes(self, column_dtypes: dict) -> pd.DataFrame:
+        """Converts columns to the memory saving dtypes given in the config
+
+        Handles category, the nullable numeric dtypes (e.g. Int32) and the
+        string dtypes; string[pyarrow] falls back to string if pyarrow is not
+        installed. Columns configured as str, float, int or date keep the dtype
+        they were loaded with.
+        """
+        for column, dtype in column_dtypes.items():
+            if not is_compact_dtype(dtype) or column not in self.data.columns:
+                continue
             try:
-                self.config = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-                return False
-        return self.config
+                self.data[column] = self.data[column].astype(dtype)
+            except ImportError:
+                self.data[column] = self.data[column].astype("string")
+        return self.data
+
+    def memory_usage(self) -> pd.DataFrame:
+        """Returns dtype and memory use in bytes per column, largest first"""
+        usage = pd.DataFrame(
+            {
+                "dtype": self.data.dtypes.astype(str),
+                "bytes": self.data.memory_usage(index=False, deep=True),
+            }
+        )
+        return usage.sort_values("bytes", ascending=False)
+
+    def read_config_file(self, config_file: str) -> Config:
+        # shared by all models of the process, raises ConfigError if invalid
+        return load_config(config_file)
 
     def import_original_list(self, list_file) -> pd.DataFrame:
         self.data = pd.read_csv(list_file, sep="\t")
         return self.data
 
+    def get_book(self, book_id: int) -> pd.DataFrame:
+        """Returns the row of the book with the given id, empty if unknown"""
+        position = self.book_index.get(book_id)
+        if position is None:
+            return self.data.iloc[[]]
+        return self.data.iloc[[position]]
+
+    def add_book(self, book: dict) -> None:
+        """Appends a new book and marks it for saving"""
+        book_id = book["index"]
+        if book_id in self.book_index:
+            raise KeyError(f"Book id {book_id} already exists")
+        # extend the frame and its indexes in place instead of rebuilding them
+        self._data = pd.concat([self._data, self._new_rows([book])], ignore_index=True)
+        self.book_index[book_id] = len(self._data) - 1
+        self._update_years(self._data.index[-1:], book)
+        for column, search_index in self._search_indexes.items():
+            search_index.append(book.get(column))
+        if self._kpis is not None:
+            self._kpis.data = self._data
+            self._kpis.append_book()
+        elif self._has_kpi_inputs():
+            # building the engine computes the new book's derived columns
+            self.kpis
+        if self._facets is not None:
+            self._facets.data = self._data
+            self._facets.append_book()
+        self._id_order = None
+        self.data_version += 1
+        self.dirty_rows.add(book_id)
+
+    def update_book(self, book_id: int, values: dict) -> pd.DataFrame:
+        """Sets the given column values of a book and marks it for saving"""
+        position = self.book_index.get(book_id)
+        if position is None:
+            raise KeyError(f"No book with id {book_id}")
+        label = self.data.index[position]
+        for column, value in values.items():
+            self._add_missing_categories(column, [value])
+            self.data.loc[label, column] = value
+            if column in self._search_indexes:
+                self._search_indexes[column].update(position, value)
+        self._update_years([label], values)
+        if any(column in KPI_INPUT_COLUMNS for column in values):
+            self._update_kpis([position])
+        if self._facets is not None:
+            self._facets.update_book(position)
+        self.data_version += 1
+        self.dirty_rows.add(book_id)
+        return self.data.iloc[[position]]
+
+    @timed("model.update_books")
+    def update_books(self, changes: pd.DataFrame, keep_missing: bool = True) -> int:
+        """Sets column values of many books at once and marks them for saving
+
+        changes has the book ids in an "index" column and one column per
+        value to set; missing values leave the value of the book unchanged,
+        unless keep_missing is False.
+        The values are assigned per column for all books together. The
+        derived reading columns and the facet totals are adjusted book by
+        book for up to INCREMENTAL_UPDATE_LIMIT books and recomputed once for
+        more. Returns the number of books changed.
+        """
+        ids = changes["index"]
+        positions = self.book_positions(ids)
+        if positions.isna().any():
+            raise KeyError(f"No books with ids {ids[positions.isna()].tolist()}")
+        if ids.duplicated().any():
+            raise ValueError(f"Repeated book ids {ids[ids.duplicated()].tolist()}")
+        columns = [column for column in changes.columns if column != "index"]
+        unknown = [column for column in columns if column not in self._data.columns]
+        if unknown:
+            raise KeyError(f"Columns {unknown} not in data")
+
+        positions = positions.astype(int).to_numpy()
+        labels = self._data.index[positions]
+        for column in columns:
+            present = changes[column].notna().to_numpy() | (not keep_missing)
+            values = changes[column].to_numpy()[present]
+            self._add_missing_categories(column, values.tolist())
+            self._data.loc[labels[present], column] = values
+            if column in self._search_indexes:
+                for position, value in zip(positions[present], values):
+                    self._search_indexes[column].update(position, value)
+        self._update_years(labels, columns)
+        incremental = len(positions) <= INCREMENTAL_UPDATE_LIMIT
+        if any(column in KPI_INPUT_COLUMNS for column in columns):
+            self._update_kpis(positions if incremental else None)
+        if self._facets is not None:
+            if incremental:
+                for position in positions:
+                    self._facets.update_book(position)
+            else:
+                self._facets.rebuild()
+        self.data_version += 1
+        self.dirty_rows.update(ids.tolist())
+        return len(changes)
+
+    def _has_kpi_inputs(self) -> bool:
+        return all(column in self._data.columns for column in KPI_INPUT_COLUMNS)
+
+    def _update_kpis(self, positions=None) -> None:
+        """Recomputes the derived reading columns after the inputs of the books
+        at positions, or of all books if positions is None, were edited
+
+        The engine is built on first use, so saves never write derived values
+        that are older than the dates and pages they come from.
+        """
+        if self._kpis is None:
+            if self._has_kpi_inputs():
+                self.kpis
+        elif positions is None:
+            self._kpis.rebuild()
+        else:
+            for position in positions:
+                self._kpis.update_book(position)
+
+    def _add_missing_categories(self, column: str, values: list) -> None:
+        if column not in self._data.columns:
+            return
+        dtype = self._data[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            missing = {value for value in values if not pd.isna(value)}
+            missing -= set(dtype.categories)
+            if missing:
+                self._data[column] = self._data[column].cat.add_categories(
+                    sorted(missing)
+                )
+
+    def _new_rows(self, books: list) -> pd.DataFrame:
+        """Builds rows with the dtypes of data so that appending keeps them"""
+        rows = pd.DataFrame(books, columns=self._data.columns)
+        for column in rows.columns:
+            self._add_missing_categories(column, rows[column].tolist())
+            try:
+                rows[column] = rows[column].astype(self._data[column].dtype)
+            except (TypeError, ValueError):
+                # e.g. a missing value in a non-nullable integer column
+                pass
+        return rows
+
+    @timed("model.write_to_sqlite")
     def write_to_sqlite(self, write_index=True) -> None:
         self.data.to_sql(
             "books",
-            con=sqlite3.connect(self.config["db_name"]),
+            con=self.database.connection,
             if_exists="replace",
             index=write_index,
         )
+        self.create_id_index()
+        self.change_log.table_replaced()
+        self.change_log.mark_synced()
+        self.dirty_rows = set()
+        if metrics.enabled:
+            self.count_rows("model.write_to_sqlite", self.data)
         return self.data
+
+    def table_exists(self, table: str) -> bool:
+        return (
+            self.database.connection.execute(
+                "select 1 from sqlite_master where type = 'table' and name = ?",
+                (table,),
+            ).fetchone()
+            is not None
+        )
+
+    def create_id_index(self) -> None:
+        """Indexes the book id column so keyed updates and lookups avoid scans"""
+        con = self.database.connection
+        columns = [row[1] for row in con.execute("pragma table_info(books)")]
+        if "index" in columns:
+            with con:
+                con.execute(
+                    'create index if not exists "ix_books_index" on books ("index")'
+                )
+
+    @timed("model.save_changes")
+    def save_changes(self, force: bool = False) -> int:
+        """Writes the rows changed since the last save in a single transaction
+
+        Rows are matched on the "index" column; books that are not in the table
+        yet are inserted. Falls back to a full write if the table is missing.
+        Raises ConflictError and writes nothing if another program saved any
+        of the changed books since they were loaded, unless force is set; the
+        write lock is taken before the check, so no save can slip in between.
+        Returns the number of rows written.
+        """
+        con = self.database.connection
+        if not self.table_exists("books"):
+            self.write_to_sqlite(write_index=False)
+            return len(self.data)
+        if not self.dirty_rows:
+            return 0
+        self.change_log.create()
+
+        changed = self.data.iloc[
+            sorted(self.book_index[book_id] for book_id in self.dirty_rows)
+        ]
+        # columns that only exist in memory, e.g. derived ones, are not saved
+        table_columns = [row[1] for row in con.execute("pragma table_info(books)")]
+        columns = [
+            column
+            for column in changed.columns
+            if column != "index" and column in table_columns
+        ]
+        assignments = ", ".join(f'"{column}" = ?' for column in columns)
+        column_names = ", ".join(f'"{column}"' for column in ["index"] + columns)
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+
+        # the connection context manager commits on success and rolls back on
+        # any error, so an interrupted save leaves the table untouched
+        with con:
+            con.execute("begin immediate")
+            conflicts = set() if force else self.change_log.conflicts(self.dirty_rows)
+            if conflicts:
+                raise ConflictError(conflicts)
+            for row in changed[["index"] + columns].itertuples(index=False):
+                values = [self._to_sql_value(value) for value in row]
+                cursor = con.execute(
+                    f'update books set {assignments} where "index" = ?',
+                    values[1:] + values[:1],
+                )
+                if cursor.rowcount == 0:
+                    con.execute(
+                        f"insert into books ({column_names}) values ({placeholders})",
+                        values,
+                    )
+            self.change_log.saved(self.dirty_rows)
+        self.dirty_rows = set()
+        if metrics.enabled:
+            self.count_rows("model.save_changes", changed)
+        return len(changed)
+
+    @staticmethod
+    def count_rows(operation: str, frame: pd.DataFrame) -> None:
+        """Counts the rows and in-memory bytes of a frame read or written"""
+        metrics.count(operation, "rows", len(frame))
+        metrics.count(operation, "bytes", int(frame.memory_usage(deep=True).sum()))
+
+    @staticmethod
+    def _to_sql_value(value):
+        # store values the same way DataFrame.to_sql does
+        if pd.isna(value):
+            return None
+        if isinstance(value, pd.Timestamp):
+            return value.to_pydatetime().isoformat(" ")
+        if hasattr(value, "item"):
+            return value.item()
+        return value
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.instrumentation import timed
+
+
+class Pager:
+    """Pages through all books in id order for the command line browser
+
+    Pages are fetched by keyset, i.e. the books after the last id shown, so
+    every book appears exactly once at any catalog size. While one page is
+    read, the next one is rendered on a background thread. Rendered pages are
+    cached until the data version of the model changes.
+
+    table_format is any tabulate format; "plain" and "simple" render much
+    faster than "fancy_grid", and "compact" skips tabulate altogether.
+    """
+
+    def __init__(self, model, page_size: int = 50, table_format: str = "fancy_grid"):
+        self.model = model
+        self.page_size = page_size
+        self.table_format = table_format
+        self.cache = {}
+        self.cache_version = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def render_page(self, after_id=None) -> tuple:
+        """Returns the rendered page after the given id and the last id on it"""
+        if self.cache_version != self.model.data_version:
+            self.cache = {}
+            self.cache_version = self.model.data_version
+        if after_id not in self.cache:
+            books = self.model.page(after_id, self.page_size)
+            if books.empty:
+                self.cache[after_id] = (None, None)
+            else:
+                self.cache[after_id] = (self.render(books), books["index"].iloc[-1])
+        return self.cache[after_id]
+
+    @timed("pager.render")
+    def render(self, books) -> str:
+        if self.table_format == "compact":
+            return books.to_string(index=False, max_colwidth=40)
+        from tabulate import tabulate
+
+        return tabulate(
+            books, headers="keys", tablefmt=self.table_format, showindex=False
+        )
+
+    def pages(self):
+        """Yields the rendered pages in order, rendering ahead by one page"""
+        upcoming = self.executor.submit(self.render_page, None)
+        while True:
+            text, last_id = upcoming.result()
+            if text is None:
+                return
+            upcoming = self.executor.submit(self.render_page, last_id)
+            yield text
@@ -0,0 +1,106 @@
+# Applies reading progress for many books at once from a CSV or TSV file
+import pandas as pd
+from src.dates import normalize_dates
+
+PROGRESS_DATE_COLUMNS = ("Date Started", "Date Finished")
+# number of problems listed in the error message, the rest is counted
+SHOWN_PROBLEMS = 20
+
+
+class ProgressFileError(ValueError):
+    """Raised with all problems found in a progress file, nothing is applied"""
+
+    def __init__(self, problems: list):
+        self.problems = problems
+        shown = problems[:SHOWN_PROBLEMS]
+        if len(problems) > len(shown):
+            shown.append(f"... and {len(problems) - len(shown)} more")
+        super().__init__("Invalid progress file:\n" + "\n".join(shown))
+
+
+def read_progress_file(path: str) -> tuple:
+    """Reads a file with an id column and one or both date columns
+
+    Files ending in .tsv are tab separated, all others comma separated. The
+    dates may be in any format normalize_dates understands; empty cells leave
+    the book's date as it is. Returns the changes, with the ids in an "index"
+    column, and the (line, problem) pairs found while parsing.
+    """
+    separator = "\t" if str(path).endswith(".tsv") else ","
+    try:
+        frame = pd.read_csv(path, sep=separator, dtype=str, skipinitialspace=True)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError) as error:
+        raise ProgressFileError([f"Cannot read the file: {error}"]) from error
+    frame.columns = frame.columns.str.strip()
+    date_columns = [column for column in PROGRESS_DATE_COLUMNS if column in frame]
+    if "id" not in frame or not date_columns:
+        raise ProgressFileError(
+            ['The file needs an "id" column and "Date Started" and/or "Date Finished"']
+        )
+
+    problems = []
+    # line numbers as seen in an editor, the header is line 1
+    lines = frame.index + 2
+    ids = pd.to_numeric(frame["id"].str.strip(), errors="coerce")
+    ids = ids.where(ids % 1 == 0)
+    problems += [(line, "invalid id") for line in lines[ids.isna()]]
+    changes = pd.DataFrame({"index": ids.astype("Int64")})
+    for column in date_columns:
+        changes[column], unparseable = normalize_dates(frame[column])
+        failed = frame[column].str.strip().isin(unparseable)
+        problems += [(line, f"cannot parse {column}") for line in lines[failed]]
+    repeated = changes["index"].duplicated(keep=False) & changes["index"].notna()
+    problems += [(line, "book id repeated") for line in lines[repeated]]
+    return changes, problems
+
+
+def validate_progress(model, changes: pd.DataFrame) -> list:
+    """Checks the changes against the books of the model
+
+    All ids have to exist and no book may end up finished before it was
+    started, taking the current dates of the book where the change has none.
+    Returns (line, problem) pairs.
+    """
+    lines = changes.index + 2
+    positions = model.book_positions(changes["index"])
+    unknown = positions.isna() & changes["index"].notna()
+    problems = [
+        (line, f"no book with id {book_id}")
+        for line, book_id in zip(lines[unknown], changes["index"][unknown])
+    ]
+
+    known = positions.notna().to_numpy()
+    current = model.data.iloc[positions[known].astype(int)]
+    dates = {}
+    for column in PROGRESS_DATE_COLUMNS:
+        dates[column] = pd.Series(
+            current[column].to_numpy(), index=changes.index[known]
+        ).astype("datetime64[ns]")
+        if column in changes:
+            new_dates = changes[column][known]
+            dates[column] = new_dates.where(new_dates.notna(), dates[column])
+    backwards = (dates["Date Finished"] < dates["Date Started"]).to_numpy()
+    problems += [
+        (line, "Date Finished is before Date Started")
+        for line in lines[known][backwards]
+    ]
+    return problems
+
+
+def apply_progress_file(model, path: str, save=None) -> int:
+    """Validates the progress file and applies and saves all of it, or nothing
+
+    The dates are set for all books in one step, the derived reading columns
+    are recomputed once, and the books are saved in one transaction by save,
+    model.save_changes by default. Raises ProgressFileError listing every
+    problem found. Returns the number of books updated.
+    """
+    changes, problems = read_progress_file(path)
+    problems += validate_progress(model, changes)
+    if problems:
+        raise ProgressFileError(
+            [f"line {line}: {problem}" for line, problem in sorted(problems)]
+        )
+    updated = model.update_books(changes.astype({"index": "int64"}))
+    (save or model.save_changes)()
+    return updated
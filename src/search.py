@@ -0,0 +1,133 @@
+import bisect
+import re
+import unicodedata
+
+import pandas as pd
+
+WORD = re.compile(r"\w+")
+
+
+def normalize(text) -> str:
+    """Case folds the text and strips accents so that "Émile" matches "emile" """
+    if text is None or (not isinstance(text, str) and pd.isna(text)):
+        return ""
+    text = str(text)
+    if text.isascii():  # nothing to strip, skip the decomposition
+        return text.casefold()
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(
+        char for char in decomposed if not unicodedata.combining(char)
+    ).casefold()
+
+
+def tokenize(text) -> list:
+    return WORD.findall(normalize(text))
+
+
+def parse_query(query: str) -> tuple:
+    """Splits a query into quoted phrases and single prefix terms"""
+    phrases = [tokenize(phrase) for phrase in re.findall(r'"([^"]*)"', query)]
+    terms = tokenize(re.sub(r'"[^"]*"', " ", query))
+    return [phrase for phrase in phrases if phrase], terms
+
+
+class SearchIndex:
+    """In-memory inverted index over the values of one text column
+
+    Rows are identified by their position in the frame. Every term of a query
+    has to match the start of a token; terms in double quotes have to appear
+    as a consecutive phrase. Results are ranked by exact token matches first.
+    """
+
+    def __init__(self, values: list):
+        self.row_tokens = []
+        self.postings = {}
+        self._sorted_tokens = None
+        # repeated values, e.g. the books of one author, are tokenized once
+        known = {}
+        for value in values:
+            if isinstance(value, str):
+                tokens = known.get(value)
+                if tokens is None:
+                    tokens = known[value] = tokenize(value)
+            else:
+                tokens = tokenize(value)
+            self.row_tokens.append(tokens)
+            for token in tokens:
+                rows = self.postings.get(token)
+                if rows is None:
+                    rows = self.postings[token] = set()
+                rows.add(len(self.row_tokens) - 1)
+
+    def append(self, value) -> None:
+        self.row_tokens.append([])
+        self.update(len(self.row_tokens) - 1, value)
+
+    def update(self, position: int, value) -> None:
+        self._set_tokens(position, tokenize(value))
+
+    def _set_tokens(self, position: int, tokens: list) -> None:
+        for token in self.row_tokens[position]:
+            rows = self.postings.get(token)
+            if rows is not None:
+                rows.discard(position)
+        self.row_tokens[position] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                self._sorted_tokens = None
+            self.postings[token].add(position)
+
+    @property
+    def sorted_tokens(self) -> list:
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self.postings)
+        return self._sorted_tokens
+
+    def prefix_matches(self, prefix: str) -> set:
+        rows = set()
+        tokens = self.sorted_tokens
+        start = bisect.bisect_left(tokens, prefix)
+        for token in tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            rows |= self.postings[token]
+        return rows
+
+    def search(self, query: str) -> list:
+        """Returns the positions of all matching rows, best match first"""
+        phrases, terms = parse_query(query)
+        if not phrases and not terms:
+            return list(range(len(self.row_tokens)))
+
+        candidates = None
+        for phrase in phrases:
+            rows = set.intersection(
+                *(self.postings.get(token, set()) for token in phrase)
+            )
+            rows = {
+                row
+                for row in rows
+                if self._contains_phrase(self.row_tokens[row], phrase)
+            }
+            candidates = rows if candidates is None else candidates & rows
+        for term in terms:
+            rows = self.prefix_matches(term)
+            candidates = rows if candidates is None else candidates & rows
+            if not candidates:
+                return []
+
+        def rank(row):
+            tokens = set(self.row_tokens[row])
+            exact_matches = sum(term in tokens for term in terms)
+            return (-exact_matches, len(self.row_tokens[row]), row)
+
+        return sorted(candidates, key=rank)
+
+    @staticmethod
+    def _contains_phrase(tokens: list, phrase: list) -> bool:
+        length = len(phrase)
+        return any(
+            tokens[start : start + length] == phrase
+            for start in range(len(tokens) - length + 1)
+        )
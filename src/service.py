@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+from src.kpi import KPI_DERIVED_COLUMNS
+from src.model import ConflictError
+from src.years import YEAR_COLUMN
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class BookService:
+    """Serves one loaded Model to many clients over a small HTTP/JSON API
+
+    Requests are parsed on the asyncio event loop; all work on the model runs
+    on a bounded thread pool and is serialized by a lock, because the model is
+    not thread-safe. Books saved by other programs, e.g. the CLI or the UI,
+    are reloaded before each request. GET responses are cached until the
+    data version of the model changes, i.e. until the next edit or reload.
+
+    Endpoints:
+        GET   /search?column=Author&q=dickens&limit=50
+        GET   /books/<id>
+        PATCH /books/<id>   with a JSON object of new column values
+        GET   /progress
+        GET   /facets?column=Author&q=dickens&limit=10
+    """
+
+    def __init__(self, model, max_workers: int = 4):
+        self.model = model
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.cache_version = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8001):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, body = await self.handle_request(reader)
+        except HTTPError as error:
+            status, body = error.status, json.dumps({"error": str(error)}).encode()
+        except Exception as error:
+            status, body = 500, json.dumps({"error": str(error)}).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        writer.close()
+
+    async def handle_request(self, reader) -> tuple:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, target, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            content_length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if content_length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        body = await reader.readexactly(content_length) if content_length else b""
+
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if method == "GET":
+            return 200, await self.cached(url.path, query)
+        if method == "PATCH":
+            return 200, await self.run(self.edit_book, url.path, body)
+        raise HTTPError(405, f"Method {method} not allowed")
+
+    async def run(self, function, *args):
+        """Runs function on the thread pool while holding the model lock"""
+
+        def locked():
+            with self.lock:
+                return function(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, locked)
+
+    async def cached(self, path: str, query: dict) -> bytes:
+        await self.run(self.model.refresh)
+        key = (path, tuple(sorted(query.items())))
+        if self.cache_version == self.model.data_version and key in self.cache:
+            return self.cache[key]
+        version, body = await self.run(self.get, path, query)
+        if self.cache_version != version:
+            self.cache = {}
+            self.cache_version = version
+        self.cache[key] = body
+        return body
+
+    def get(self, path: str, query: dict) -> tuple:
+        version = self.model.data_version
+        if path == "/search":
+            try:
+                books = self.model.search(query.get("column", "Title"), query["q"])
+                limit = int(query.get("limit", 50))
+            except (KeyError, ValueError) as error:
+                raise HTTPError(400, f"Invalid search: {error}")
+            return version, self.to_json(books.head(limit))
+        if path == "/progress":
+            return version, json.dumps(self.progress()).encode()
+        if path == "/facets":
+            return version, json.dumps(self.facets(query)).encode()
+        return version, self.to_json(self.find_book(path))
+
+    def find_book(self, path: str) -> pd.DataFrame:
+        parts = path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "books":
+            raise HTTPError(404, f"Unknown path {path}")
+        try:
+            book_id = int(parts[1])
+        except ValueError:
+            raise HTTPError(400, f"Invalid book id {parts[1]}")
+        book = self.model.get_book(book_id)
+        if book.empty:
+            raise HTTPError(404, f"No book with id {book_id}")
+        return book
+
+    def edit_book(self, path: str, body: bytes) -> bytes:
+        """Applies the new column values of a book and saves them right away
+
+        If another program saved the book since it was loaded, the edit is
+        dropped for that version and answered with 409 Conflict.
+        """
+        self.model.refresh()
+        book_id = int(self.find_book(path)["index"].iloc[0])
+        try:
+            values = json.loads(body)
+        except json.JSONDecodeError as error:
+            raise HTTPError(400, f"Invalid JSON: {error}")
+        if not isinstance(values, dict) or not values:
+            raise HTTPError(400, "Expected an object of column values")
+        # all values are checked before any is set, so a bad one changes nothing
+        values = {
+            column: self.to_column_value(column, value)
+            for column, value in values.items()
+        }
+        book = self.model.update_book(book_id, values)
+        try:
+            self.model.save_changes()
+        except ConflictError as error:
+            # otherwise the book stays unsaved and fails every later save
+            self.model.refresh(overwrite_dirty=True)
+            raise HTTPError(409, str(error))
+        return self.to_json(book)
+
+    def to_column_value(self, column: str, value):
+        """Converts a JSON value to the dtype of an editable column"""
+        derived = column in KPI_DERIVED_COLUMNS or column == YEAR_COLUMN
+        if column == "index" or derived or column not in self.model.data.columns:
+            raise HTTPError(400, f"Column {column} cannot be edited")
+        if not pd.api.types.is_scalar(value):
+            raise HTTPError(400, f"Invalid value for {column}: {value!r}")
+        dtype = self.model.data[column].dtype
+        # new categories are added by the model, text columns take any value
+        if value is None or dtype == object or isinstance(dtype, pd.CategoricalDtype):
+            return value
+        try:
+            return pd.array([value], dtype=dtype)[0]
+        except (TypeError, ValueError) as error:
+            raise HTTPError(400, f"Invalid value for {column}: {error}")
+
+    def progress(self) -> dict:
+        kpis = self.model.kpis
+        return {
+            "books": kpis.book_count,
+            "read": kpis.finished_count,
+            "unread": kpis.unread_count,
+            "pages_read": kpis.pages_read,
+            "average_speed": kpis.average_speed,
+        }
+
+    def facets(self, query: dict) -> dict:
+        """Counts per facet value of all books, or of the books matching q"""
+        try:
+            positions = (
+                self.model.search_positions(query.get("column", "Title"), query["q"])
+                if "q" in query
+                else None
+            )
+            limit = int(query["limit"]) if "limit" in query else None
+        except (KeyError, ValueError) as error:
+            raise HTTPError(400, f"Invalid facets query: {error}")
+        return {
+            facet: json.loads(summary.reset_index().to_json(orient="records"))
+            for facet, summary in self.model.facet_summary(positions, limit).items()
+        }
+
+    @staticmethod
+    def to_json(books: pd.DataFrame) -> bytes:
+        return books.to_json(orient="records", date_format="iso").encode()
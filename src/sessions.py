@@ -0,0 +1,152 @@
+# Append-only log of reading sessions with totals kept up to date by SQLite
+import datetime
+import sqlite3
+
+import pandas as pd
+
+SCHEMA = [
+    """create table if not exists reading_sessions (
+        id integer primary key,
+        book_id integer not null,
+        date text not null,
+        pages integer not null check (pages != 0)
+    )""",
+    "create index if not exists ix_reading_sessions_book "
+    "on reading_sessions (book_id, date)",
+    """create table if not exists book_progress (
+        book_id integer primary key,
+        pages_read integer not null,
+        sessions integer not null,
+        first_date text not null,
+        last_date text not null
+    )""",
+    "create table if not exists daily_pages "
+    "(date text primary key, pages integer not null, sessions integer not null)",
+    "create table if not exists weekly_pages "
+    "(week text primary key, pages integer not null, sessions integer not null)",
+    # each logged session adds to the totals in the same transaction, so no
+    # query ever has to sum up the whole history
+    """create trigger if not exists reading_sessions_totals
+    after insert on reading_sessions begin
+        insert into book_progress values
+            (new.book_id, new.pages, 1, new.date, new.date)
+        on conflict (book_id) do update set
+            pages_read = pages_read + excluded.pages_read,
+            sessions = sessions + 1,
+            first_date = min(first_date, excluded.first_date),
+            last_date = max(last_date, excluded.last_date);
+        insert into daily_pages values (new.date, new.pages, 1)
+        on conflict (date) do update set
+            pages = pages + excluded.pages, sessions = sessions + 1;
+        insert into weekly_pages
+            values (date(new.date, '-6 days', 'weekday 1'), new.pages, 1)
+        on conflict (week) do update set
+            pages = pages + excluded.pages, sessions = sessions + 1;
+    end""",
+    """create trigger if not exists reading_sessions_no_update
+    before update on reading_sessions begin
+        select raise(abort, 'reading_sessions is append-only');
+    end""",
+    """create trigger if not exists reading_sessions_no_delete
+    before delete on reading_sessions begin
+        select raise(abort, 'reading_sessions is append-only');
+    end""",
+]
+
+
+def session_date(date=None) -> str:
+    """Returns the date as YYYY-MM-DD, today if None"""
+    if date is None:
+        return datetime.date.today().isoformat()
+    return pd.Timestamp(date).date().isoformat()
+
+
+class ReadingLog:
+    """Reading sessions (book id, date, pages) stored in reading_sessions
+
+    Sessions are only ever appended; a negative number of pages corrects an
+    earlier session. Triggers add every session to the pages read per book
+    and per day and week (weeks start on Monday), so logging a session is one
+    insert and the progress queries read those totals instead of the log.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def log_session(self, book_id: int, pages: int, date=None) -> None:
+        if int(pages) == 0:
+            raise ValueError("A session has to have pages")
+        with self.connection:
+            self.connection.execute(
+                "insert into reading_sessions (book_id, date, pages) values (?, ?, ?)",
+                (int(book_id), session_date(date), int(pages)),
+            )
+
+    def log_sessions(self, sessions: pd.DataFrame) -> int:
+        """Appends many sessions in one transaction
+
+        sessions has the book ids in an "index" column, a "Pages" column and
+        optionally a "Date" column; missing dates are today. Returns the
+        number of sessions logged.
+        """
+        pages = sessions["Pages"].astype(int)
+        if (pages == 0).any():
+            raise ValueError("A session has to have pages")
+        dates = pd.to_datetime(sessions.get("Date", pd.Series(pd.NaT, sessions.index)))
+        dates = dates.dt.strftime("%Y-%m-%d").fillna(session_date())
+        rows = list(
+            zip(
+                sessions["index"].astype(int).tolist(),
+                dates.tolist(),
+                pages.tolist(),
+            )
+        )
+        with self.connection:
+            self.connection.executemany(
+                "insert into reading_sessions (book_id, date, pages) values (?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def progress(self) -> pd.DataFrame:
+        """Returns the pages read, sessions and first and last date per book"""
+        return pd.read_sql(
+            "select book_id, pages_read, sessions, first_date, last_date "
+            "from book_progress order by book_id",
+            self.connection,
+            parse_dates=["first_date", "last_date"],
+        )
+
+    def daily_totals(self, start=None, end=None) -> pd.DataFrame:
+        """Returns the pages and sessions per day from start to end, both included"""
+        return self._totals("daily_pages", "date", start, end)
+
+    def weekly_totals(self, start=None, end=None) -> pd.DataFrame:
+        """Returns the pages and sessions of the weeks starting from start to end
+
+        Weeks are labeled with their Monday.
+        """
+        return self._totals("weekly_pages", "week", start, end)
+
+    def _totals(self, table: str, key: str, start, end) -> pd.DataFrame:
+        start = "0000-01-01" if start is None else session_date(start)
+        end = "9999-12-31" if end is None else session_date(end)
+        return pd.read_sql(
+            f"select {key}, pages, sessions from {table} "
+            f"where {key} between ? and ? order by {key}",
+            self.connection,
+            params=(start, end),
+            parse_dates=[key],
+        )
+
+    def history(self, book_id: int) -> pd.DataFrame:
+        """Returns the sessions of one book in the order they were logged"""
+        return pd.read_sql(
+            "select date, pages from reading_sessions where book_id = ? order by id",
+            self.connection,
+            params=(int(book_id),),
+            parse_dates=["date"],
+        )
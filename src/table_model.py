@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from PyQt5 import QtCore
+from src.instrumentation import timed
+
+
+def format_value(value) -> str:
+    """Formats a single cell the way it is shown in the book tables"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, (np.datetime64, pd.Timestamp)):
+        return str(pd.Timestamp(value).date())
+    if isinstance(value, (float, np.floating)):
+        return f"{value:g}"
+    return str(value)
+
+
+class BookTableModel(QtCore.QAbstractTableModel):
+    """Read-only Qt table model backed directly by the columns of a DataFrame
+
+    Cells are only formatted when a view asks for them in data(), and rows are
+    handed to the view in batches through fetchMore. A search result can be
+    shown by passing row positions to set_rows, which leaves the frame as is.
+    """
+
+    def __init__(self, frame: pd.DataFrame, batch_size: int = 200, parent=None):
+        super().__init__(parent)
+        self.batch_size = batch_size
+        self.set_frame(frame)
+
+    @timed("table_model.set_frame")
+    def set_frame(self, frame: pd.DataFrame, rows=None) -> None:
+        self.beginResetModel()
+        self.headers = [str(column) for column in frame.columns]
+        # the arrays behind the columns, to_numpy would box categories and
+        # nullable integers into new object arrays
+        self.columns = [frame[column].array for column in frame.columns]
+        self._set_rows(rows, len(frame))
+        self.endResetModel()
+
+    def set_rows(self, rows) -> None:
+        """Shows only the rows at the given positions of the frame"""
+        self.beginResetModel()
+        total = len(self.columns[0]) if self.columns else 0
+        self._set_rows(rows, total)
+        self.endResetModel()
+
+    def _set_rows(self, rows, total: int) -> None:
+        self.rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        self.total_rows = total if rows is None else len(self.rows)
+        self.loaded_rows = min(self.batch_size, self.total_rows)
+
+    def rowCount(self, parent=QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.loaded_rows
+
+    def columnCount(self, parent=QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.columns)
+
+    @timed("table_model.data")
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        row = index.row() if self.rows is None else self.rows[index.row()]
+        return format_value(self.columns[index.column()][row])
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.headers[section]
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()) -> bool:
+        return not parent.isValid() and self.loaded_rows < self.total_rows
+
+    @timed("table_model.fetch_more")
+    def fetchMore(self, parent=QtCore.QModelIndex()) -> None:
+        count = min(self.batch_size, self.total_rows - self.loaded_rows)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(
+            QtCore.QModelIndex(), self.loaded_rows, self.loaded_rows + count - 1
+        )
+        self.loaded_rows += count
+        self.endInsertRows()
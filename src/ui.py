@@ -1,18 +1,36 @@
-from PyQt5 import QtWidgets
-from src.model import Model
-from dateutil.parser import parse
+from PyQt5 import QtCore, QtWidgets
+from src.instrumentation import slot, timed
+from src.workers import Worker
+
+# pandas and the modules using it are imported on the worker thread by
+# load_books, so the window is shown before they are loaded
+
+# how often books saved by another program, e.g. the CLI, are looked for
+REFRESH_INTERVAL_MS = 5000
 
 
 class UI:
 
-    def __init__(self, config: str):
-        self.model = Model(config)
-        self.model.read_data_from_db()
+    def __init__(self, config: str, list_file: str = None):
+        self.config = config
+        self.list_file = list_file
+        self.model = None
 
         self.app = QtWidgets.QApplication([])
         self.window = QtWidgets.QMainWindow()
         self.window.setWindowTitle("Book Reading App")
 
+        # Database work runs on a single background thread, one job at a time
+        self.thread_pool = QtCore.QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
+
+        # books saved by other programs are reloaded while no job runs
+        self.refresh_timer = QtCore.QTimer()
+        self.refresh_timer.setInterval(REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(self.reload_changed_books)
+        # ids of books whose edits were dropped for another program's save
+        self.conflicts = []
+
         self.create_menu()
 
     def create_menu(self):
@@ -44,76 +62,162 @@ class UI:
         self.edit_book_button.clicked.connect(self.edit_book_details)
         self.menu_layout.addWidget(self.edit_book_button)
 
+        self.import_progress_button = QtWidgets.QPushButton(
+            "Import reading progress")
+        self.import_progress_button.clicked.connect(
+            self.import_progress_file)
+        self.menu_layout.addWidget(self.import_progress_button)
+
         self.reading_progress_button = QtWidgets.QPushButton(
             "Show reading progress")
         self.reading_progress_button.clicked.connect(
             self.show_average_reading_speed)
         self.menu_layout.addWidget(self.reading_progress_button)
 
+        self.forecast_button = QtWidgets.QPushButton("Forecast finish date")
+        self.forecast_button.clicked.connect(self.forecast_finish_date)
+        self.menu_layout.addWidget(self.forecast_button)
+
         self.exit_button = QtWidgets.QPushButton("Exit")
         self.exit_button.clicked.connect(self.save_and_exit)
         self.menu_layout.addWidget(self.exit_button)
 
+        # Status shown while background jobs are running
+        self.status_label = QtWidgets.QLabel()
+        self.menu_layout.addWidget(self.status_label)
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.menu_layout.addWidget(self.progress_bar)
+
         self.window.setCentralWidget(self.menu_widget)
+        self.run_in_background(self.load_books, self.books_loaded,
+                               "Loading books...")
         self.window.show()
         self.app.exec_()
 
-    def show_all_books(self):
-        self.books_widget = QtWidgets.QTableWidget()
-        self.books_widget.setRowCount(len(self.model.data))
-        self.books_widget.setColumnCount(len(self.model.data.columns))
-        self.books_widget.setHorizontalHeaderLabels(self.model.data.columns)
+    def run_in_background(self, function, on_result, message: str):
+        """Runs function on the worker thread while the menu shows message"""
+        self.set_busy(message)
+        worker = Worker(function, report_progress=True)
+        worker.signals.progress.connect(self.status_label.setText)
+        worker.signals.result.connect(on_result)
+        worker.signals.error.connect(self.show_error)
+        self.thread_pool.start(worker)
 
-        for i, row in enumerate(self.model.data.values):
-            for j, value in enumerate(row):
-                self.books_widget.setItem(
-                    i, j, QtWidgets.QTableWidgetItem(str(value)))
+    def set_busy(self, message: str):
+        for button in self.menu_widget.findChildren(QtWidgets.QPushButton):
+            button.setEnabled(False)
+        self.status_label.setText(message)
+        self.progress_bar.show()
 
-        self.books_widget.show()
+    def set_ready(self, message: str):
+        # without loaded books only Exit works
+        for button in self.menu_widget.findChildren(QtWidgets.QPushButton):
+            button.setEnabled(self.model is not None
+                              or button is self.exit_button)
+        self.status_label.setText(message)
+        self.progress_bar.hide()
+
+    def show_error(self, error: Exception):
+        self.set_ready("")
+        QtWidgets.QMessageBox.warning(self.window, "Error", str(error))
+
+    @timed("ui.load_books")
+    def load_books(self, progress):
+        from src.model import Model
+
+        if self.list_file is not None:
+            from src.importer import Importer
+            progress("Checking book list...")
+            importer = Importer(self.config)
+            with importer.model:
+                importer.sync(self.list_file)
+            progress("Loading books...")
+        # set only once loaded, the menu stays disabled if loading fails
+        model = Model(self.config)
+        model.read_data_from_db()
+        progress("Building search index...")
+        model.search_index("Author")
+        model.search_index("Title")
+        model.kpis
+        self.model = model
+        return len(model.data)
+
+    @slot("ui.books_loaded")
+    def books_loaded(self, book_count: int):
+        self.set_ready(f"{book_count} books loaded")
+        self.refresh_timer.start()
+
+    @slot("ui.reload_changed_books")
+    def reload_changed_books(self):
+        # only the check, a single pragma, runs on the GUI thread; the reload
+        # runs on the worker while no other job or edit dialog uses the model
+        if (self.model is None or self.thread_pool.activeThreadCount() > 0
+                or QtWidgets.QApplication.activeModalWidget() is not None
+                or not self.model.changed_elsewhere()):
+            return
+        status = self.status_label.text()
+        self.run_in_background(
+            lambda progress: self.model.refresh(),
+            lambda reloaded: self.books_reloaded(reloaded, status),
+            "Reloading books changed by another program...")
 
+    @slot("ui.books_reloaded")
+    def books_reloaded(self, reloaded: list, status: str):
+        if reloaded:
+            status = (f"Reloaded {len(reloaded)} books changed by another "
+                      "program")
+        self.set_ready(status)
+
+    @slot("ui.show_all_books")
+    def show_all_books(self):
+        self.show_books(self.model.data)
+
+    @slot("ui.show_books_by_author")
     def show_books_by_author(self):
         author, ok = QtWidgets.QInputDialog.getText(self.window, "Author",
                                                     "Enter author: ")
         if ok:
-            found_books = self.model.data[
-                self.model.data["Author"].str.contains(author, case=False)]
-            self.show_books(found_books)
+            self.show_books(self.model.data,
+                            self.model.search_positions("Author", author))
 
+    @slot("ui.show_books_by_title")
     def show_books_by_title(self):
         title, ok = QtWidgets.QInputDialog.getText(self.window, "Title",
                                                    "Enter title: ")
         if ok:
-            found_books = self.model.data[
-                self.model.data["Title"].str.contains(title, case=False)]
-            self.show_books(found_books)
+            self.show_books(self.model.data,
+                            self.model.search_positions("Title", title))
 
+    @slot("ui.show_books_by_id")
     def show_books_by_id(self):
         book_id, ok = QtWidgets.QInputDialog.getText(self.window, "Book ID",
                                                      "Enter book id: ")
         if ok:
-            found_books = self.model.data[self.model.data["index"] == int(
-                book_id)]
+            found_books = self.model.get_book(int(book_id))
             self.show_books(found_books)
 
-    def show_books(self, found_books):
-        self.books_widget = QtWidgets.QTableWidget()
-        self.books_widget.setRowCount(len(found_books))
-        self.books_widget.setColumnCount(len(found_books.columns))
-        self.books_widget.setHorizontalHeaderLabels(found_books.columns)
-
-        for i, row in enumerate(found_books.values):
-            for j, value in enumerate(row):
-                self.books_widget.setItem(
-                    i, j, QtWidgets.QTableWidgetItem(str(value)))
+    def show_books(self, found_books, rows=None):
+        from src.table_model import BookTableModel
 
+        # cells are formatted by the table model only when they are painted
+        self.books_model = BookTableModel(found_books)
+        if rows is not None:
+            self.books_model.set_rows(rows)
+        self.books_widget = QtWidgets.QTableView()
+        self.books_widget.setModel(self.books_model)
         self.books_widget.show()
 
+    @slot("ui.edit_book_details")
     def edit_book_details(self):
         book_id, ok = QtWidgets.QInputDialog.getText(self.window, "Book ID",
                                                      "Enter book id: ")
         if ok:
-            found_books = self.model.data[self.model.data["index"] == int(
-                book_id)]
+            found_books = self.model.get_book(int(book_id))
+            if found_books.empty:
+                QtWidgets.QMessageBox.warning(self.window, "Error",
+                                              "Book not found.")
+                return
             self.show_books(found_books)
 
             # Get new values for start/finish dates from user
@@ -125,14 +229,15 @@ class UI:
                     self.window, "Finish Date",
                     "Enter finish reading date (YYYY-MM-DD): ")
                 if ok:
+                    from dateutil.parser import parse
                     try:
                         start_date = parse(start_new_value)
                         finish_date = parse(finish_new_value)
-                        self.model.data.loc[self.model.data["index"] ==
-                                            int(book_id), "Date Started"] = start_date
-                        self.model.data.loc[self.model.data["index"] ==
-                                            int(book_id),
-                                            "Date Finished"] = finish_date
+                        found_books = self.model.update_book(
+                            int(book_id), {
+                                "Date Started": start_date,
+                                "Date Finished": finish_date
+                            })
                         self.show_books(found_books)
                     except ValueError:
                         QtWidgets.QMessageBox.warning(
@@ -140,12 +245,81 @@ class UI:
                             "Invalid date format. Please enter dates in the format YYYY-MM-DD."
                         )
 
+    @slot("ui.import_progress_file")
+    def import_progress_file(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self.window, "Import reading progress", "",
+            "Progress files (*.csv *.tsv)")
+        if path:
+            self.run_in_background(
+                lambda progress: self.apply_progress_file(path),
+                self.progress_imported, "Importing reading progress...")
+
+    def apply_progress_file(self, path: str) -> int:
+        from src.progress import apply_progress_file
+        return apply_progress_file(self.model, path)
+
+    @slot("ui.progress_imported")
+    def progress_imported(self, updated: int):
+        self.set_ready(f"Updated and saved {updated} books")
+
+    @slot("ui.show_average_reading_speed")
     def show_average_reading_speed(self):
         reading_speed = self.model.calculate_average_reading_speed()
+        kpis = self.model.kpis
         QtWidgets.QMessageBox.information(
             self.window, "Reading Speed",
-            f"Your average reading speed is {reading_speed} pages per day.")
+            f"Your average reading speed is {reading_speed:.1f} pages per day.\n"
+            f"Books read: {kpis.finished_count}, "
+            f"Books unread: {kpis.unread_count}")
 
+    @slot("ui.forecast_finish_date")
+    def forecast_finish_date(self):
+        # simulations are cached per data version, only the first run waits
+        self.run_in_background(
+            lambda progress: self.model.forecaster.forecast(
+                birth_date=self.model.config["birth_date"]),
+            self.show_forecast, "Simulating the finish date...")
+
+    @slot("ui.show_forecast")
+    def show_forecast(self, forecast):
+        self.set_ready("Forecast ready")
+        lines = []
+        for row in forecast.itertuples(index=False):
+            line = f"{row.Percentile}%: {row[1]:%Y-%m-%d}"
+            if "Age" in forecast:
+                line += f", at age {row.Age}"
+            lines.append(line)
+        QtWidgets.QMessageBox.information(
+            self.window, "Finish Date",
+            "Chance of having finished the list by:\n" + "\n".join(lines))
+
+    @slot("ui.save_and_exit")
     def save_and_exit(self):
-        self.model.write_to_sqlite(write_index=False)
+        self.refresh_timer.stop()
+        self.run_in_background(self.save_changes, self.saved,
+                               "Saving changes...")
+
+    @timed("ui.save_changes")
+    def save_changes(self, progress):
+        if self.model is None:  # loading failed, there is nothing to save
+            return 0
+        from src.model import ConflictError
+        try:
+            saved = self.model.save_changes()
+        except ConflictError as error:
+            # the version saved by the other program is kept for these books
+            self.conflicts = error.book_ids
+            self.model.refresh(overwrite_dirty=True)
+            saved = self.model.save_changes()
+        self.model.close()
+        return saved
+
+    @slot("ui.saved")
+    def saved(self, saved: int):
+        if self.conflicts:
+            QtWidgets.QMessageBox.warning(
+                self.window, "Changes not saved",
+                "These books were changed by another program, their edits "
+                "were not saved: " + ", ".join(map(str, self.conflicts)))
         self.app.exit()
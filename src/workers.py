@@ -0,0 +1,37 @@
+from PyQt5 import QtCore
+
+
+class WorkerSignals(QtCore.QObject):
+    """Signals of a Worker, delivered to slots on the GUI thread"""
+
+    progress = QtCore.pyqtSignal(str)
+    result = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(Exception)
+    finished = QtCore.pyqtSignal()
+
+
+class Worker(QtCore.QRunnable):
+    """Runs a function on a QThreadPool thread and reports back through signals
+
+    If report_progress is set, the function is called with a progress keyword
+    argument that emits the progress signal with a status message.
+    """
+
+    def __init__(self, function, *args, report_progress: bool = False, **kwargs):
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        if report_progress:
+            self.kwargs["progress"] = self.signals.progress.emit
+
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as exc:
+            self.signals.error.emit(exc)
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
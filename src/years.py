@@ -0,0 +1,71 @@
+import re
+
+import numpy as np
+import pandas as pd
+from src.dates import parse_years
+
+# derived from the column named by year_column in the config
+YEAR_COLUMN = "Year"
+
+
+# "1900-1950", "500BC - 100", "1900 to 1950"; a leading minus is a sign
+RANGE_SEPARATOR = re.compile(r"(?<=\S)\s*(?:-|–|\bto\b)\s*(?=\S)")
+
+
+def parse_year_range(text: str) -> tuple:
+    """Returns the first and last year of a range like "500BC-100" or one year
+
+    Raises ValueError if a bound is not a year.
+    """
+    bounds = RANGE_SEPARATOR.split(text.strip(), maxsplit=1)
+    years, unparseable = parse_years(pd.Series(bounds, dtype=object))
+    if unparseable or years.isna().any():
+        raise ValueError(f"Not a year or range of years: {text}")
+    return int(years.iloc[0]), int(years.iloc[-1])
+
+
+class YearIndex:
+    """Row positions of the books sorted by publication year
+
+    Year ranges, chronological order and decade or century counts are found
+    by binary search in the sorted years instead of scanning the column.
+    Books without a known year come last in chronological order and are in
+    no range or facet.
+    """
+
+    def __init__(self, years: pd.Series):
+        known = years.notna().to_numpy()
+        positions = np.flatnonzero(known)
+        values = years[known].to_numpy(dtype=np.int64)
+        order = np.argsort(values, kind="stable")
+        self.years = values[order]
+        self.positions = positions[order]
+        self.unknown = np.flatnonzero(~known)
+
+    def between(self, first: int = None, last: int = None) -> np.ndarray:
+        """Returns the positions of the books from first to last, both included"""
+        start = 0 if first is None else np.searchsorted(self.years, first, "left")
+        stop = (
+            len(self.years)
+            if last is None
+            else np.searchsorted(self.years, last, "right")
+        )
+        return self.positions[start:stop]
+
+    def chronological(self) -> np.ndarray:
+        """Returns all positions, oldest first and unknown years last"""
+        return np.concatenate([self.positions, self.unknown])
+
+    def facets(self, width: int = 10) -> pd.Series:
+        """Counts the books per period of width years, e.g. 10 for decades
+
+        The periods are labeled with their first year and empty ones are
+        left out.
+        """
+        if len(self.years) == 0:
+            return pd.Series([], dtype=int, name="Books")
+        first = self.years[0] // width * width
+        edges = np.arange(first, self.years[-1] + width + 1, width)
+        counts = np.diff(np.searchsorted(self.years, edges, "left"))
+        facets = pd.Series(counts, index=edges[:-1], name="Books")
+        return facets[facets > 0]
@@ -0,0 +1,45 @@
+import pandas as pd
+from benchmarks.generate import HEADER, generate_list
+from benchmarks.run import find_regressions, measure
+
+
+def test_generate_list(tmp_path):
+    list_file = tmp_path / "list.tsv"
+    generate_list(list_file, 200)
+    data = pd.read_csv(list_file, sep="\t", keep_default_na=False)
+    assert len(data) == 200
+    assert len(data.columns) == len(HEADER)
+    # the trailing columns are blank
+    assert (data.iloc[:, 20:] == "").all().all()
+    started = data["Date Started"][data["Date Started"] != ""]
+    assert started.str.match(r"\d{4}-\d{2}-\d{2}$").any()
+    assert started.str.contains("approx").any()
+
+
+def test_generate_list_is_reproducible(tmp_path):
+    generate_list(tmp_path / "a.tsv", 50, seed=7)
+    generate_list(tmp_path / "b.tsv", 50, seed=7)
+    assert (tmp_path / "a.tsv").read_text() == (tmp_path / "b.tsv").read_text()
+
+
+def test_measure():
+    result = measure(lambda: sum(range(100)), repeats=5, items=100)
+    assert result["p50"] <= result["p95"] <= result["p99"]
+    assert result["throughput"] > 0
+    assert result["peak_memory"] >= 0
+
+
+def test_find_regressions():
+    baseline = {
+        "import": {"p50": 1.0, "peak_memory": 100},
+        "get_book": {"p50": 0.001, "peak_memory": 10},
+    }
+    results = {
+        "import": {"p50": 1.4, "peak_memory": 200},
+        "get_book": {"p50": 0.002, "peak_memory": 10},
+        "search_title": {"p50": 5.0, "peak_memory": 10},
+    }
+    regressions = find_regressions(results, baseline, tolerance=0.5)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("import peak_memory")
+    assert regressions[1].startswith("get_book p50")
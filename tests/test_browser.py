@@ -1,12 +1,23 @@
 from src.browser import Browser
-from src.model import Model
+from src.config import Config
+from src.instrumentation import metrics
+from src.lazy_model import LazyModel
+from src.model import ConflictError, Model
 from unittest import mock
 import pandas as pd
 from dateutil.parser import parse
+import sqlite3
+import pytest
+
+
+memory_config = mock.patch(
+    "src.lazy_model.load_config", return_value=Config({"db_name": "test.db"})
+)
+
 
 # Instance of Browser class with mocked Model Class
 def browser():
-    with mock.patch.object(Model, "__init__", return_value=None):
+    with memory_config, mock.patch.object(Model, "__init__", return_value=None):
         with mock.patch.object(Model, "read_data_from_db", return_value="test.db"):
             browser = Browser("path/to/config")
             browser.model = mock.create_autospec(Model)
@@ -16,14 +27,46 @@ def browser():
 test_browser = browser()
 
 
+# Browser with a real Model holding the given data
+def browser_with_data(data):
+    browser_with_data = browser()
+    with mock.patch.object(
+        Model, "read_config_file", return_value=Config({"db_name": "test.db"})
+    ):
+        browser_with_data.model = Model("path/to/config")
+    browser_with_data.model.data = data
+    return browser_with_data
+
+
 def test_browser_init():
     # Test the init function
-    with mock.patch.object(Model, "__init__", return_value=None) as mock_init:
-        with mock.patch.object(Model, "read_data_from_db") as mock_read:
-            test_browser = Browser(config="path/to/config")
-            assert mock_init.called
-            assert mock_read.called
-            assert test_browser is not None
+    with memory_config:
+        with mock.patch.object(Model, "__init__", return_value=None) as mock_init:
+            with mock.patch.object(Model, "read_data_from_db") as mock_read:
+                test_browser = Browser(config="path/to/config")
+                assert mock_init.called
+                assert mock_read.called
+                assert test_browser is not None
+
+
+def test_browser_with_lazy_backend(tmp_path):
+    config = Config({"db_name": str(tmp_path / "books.db"), "backend": "lazy"})
+    with mock.patch.object(Model, "read_config_file", return_value=config):
+        writer = Model("path/to/config")
+        writer.data = pd.DataFrame({"index": [0], "Title": ["Emma"]})
+        writer.write_to_sqlite(write_index=False)
+        writer.close()
+        with mock.patch("src.lazy_model.load_config", return_value=config):
+            lazy_browser = Browser("path/to/config")
+    assert isinstance(lazy_browser.model, LazyModel)
+    assert lazy_browser.model.get_book(0)["Title"].tolist() == ["Emma"]
+
+    # statistics over all books are refused, the menu goes on
+    with mock.patch("builtins.input", side_effect=["6", "q", "n"]):
+        with mock.patch("builtins.print") as mock_print:
+            lazy_browser.menu()
+    printed = [str(call.args[0]) for call in mock_print.call_args_list if call.args]
+    assert "Reading statistics needs the memory backend" in printed
 
 
 @mock.patch("src.browser.Browser.show_all_books")
@@ -58,10 +101,26 @@ def test_bowser_menu_invalid_choice():
 
 def test_browser_show_all_books():
     # Test the show_all_books function
-    test_browser.model.data = pd.DataFrame(pd.Series(range(1, 101)))
+    pager_browser = browser_with_data(pd.DataFrame({"index": range(100, 0, -1)}))
     with mock.patch("builtins.input", return_value="a") as mock_input:
-        test_browser.show_all_books()
-    assert mock_input.assert_called
+        with mock.patch("builtins.print") as mock_print:
+            pager_browser.show_all_books()
+    assert mock_input.call_count == 2
+    pages = [call.args[0] for call in mock_print.call_args_list]
+    shown_ids = [
+        int(line.strip("│ "))
+        for page in pages
+        for line in page.splitlines()
+        if line.strip("│ ").isdigit()
+    ]
+    assert shown_ids == list(range(1, 101))
+
+
+def test_browser_show_all_books_quit():
+    pager_browser = browser_with_data(pd.DataFrame({"index": range(120)}))
+    with mock.patch("builtins.input", return_value="q") as mock_input:
+        pager_browser.show_all_books()
+    assert mock_input.call_count == 1
 
 
 @mock.patch(
@@ -70,63 +129,96 @@ def test_browser_show_all_books():
 )
 def test_browser_show_books_by_author(mock_read_sql):
     # Test the show_books_by_author function
-    test_browser.model.data = pd.DataFrame(
-        {"Author": ["foo", "bar", "baz", "qux", "quux"]}
+    author_browser = browser_with_data(
+        pd.DataFrame({"Author": ["foo", "bar", "baz", "qux", "quux"]})
     )
     with mock.patch("builtins.input", return_value="bar") as mock_input:
-        found_books = test_browser.show_books_by_author()
+        found_books = author_browser.show_books_by_author()
         assert found_books["Author"].nunique() == 1
         assert mock_input.assert_called
         assert mock_read_sql.assert_called
 
 
+def test_browser_times_books_by_title_without_the_prompt():
+    title_browser = browser_with_data(pd.DataFrame({"Title": ["foo", "bar"]}))
+    clock = mock.Mock(return_value=10.0)
+
+    def answer(prompt):
+        # the user takes a minute to answer
+        clock.return_value += 60.0
+        return "bar"
+
+    metrics.reset()
+    metrics.enabled = True
+    try:
+        with mock.patch("src.instrumentation.time.perf_counter", clock):
+            with mock.patch("builtins.input", side_effect=answer):
+                title_browser.show_books_by_title()
+        durations = metrics.snapshot()["durations"]
+    finally:
+        metrics.enabled = False
+        metrics.reset()
+    assert durations["browser.show_books_by_title"]["sum"] == 0
+
+
 def test_browser_show_books_by_title():
     # Test the show_books_by_author function
-    test_browser.model.data = pd.DataFrame(
-        {"Title": ["foo", "bar", "baz", "qux", "quux"]}
+    title_browser = browser_with_data(
+        pd.DataFrame({"Title": ["foo", "bar", "baz", "qux", "quux"]})
     )
     with mock.patch("builtins.input", return_value="bar") as mock_input:
-        found_books = test_browser.show_books_by_title()
+        found_books = title_browser.show_books_by_title()
         assert found_books["Title"].nunique() == 1
         assert mock_input.assert_called
 
 
 def test_browser_show_books_by_id():
     # Test the show_books_by_author function
-    test_browser.model.data = pd.DataFrame({"index": [1, 2, 3, 4, 5]})
+    id_browser = browser_with_data(pd.DataFrame({"index": [1, 2, 3, 4, 5]}))
     with mock.patch("builtins.input", return_value=3) as mock_input:
-        found_books = test_browser.show_books_by_id()
-        assert found_books["index"].nunique() == 1
+        found_books = id_browser.show_books_by_id()
+        assert found_books["index"].tolist() == [3]
         assert mock_input.assert_called
 
 
+def test_browser_edit_book_details_unknown_id():
+    unknown_browser = browser_with_data(pd.DataFrame({"index": [1, 2, 3]}))
+    with mock.patch("builtins.input", side_effect=[7]) as mock_input:
+        found_books = unknown_browser.edit_book_details()
+        assert found_books.empty
+        assert mock_input.call_count == 1
+    assert unknown_browser.model.dirty_rows == set()
+
+
 def test_browser_edit_book_details():
     # Test the show_books_by_author function
-    test_browser.model.data = pd.DataFrame(
-        {
-            "index": [1, 2, 3, 4, 5],
-            "Date Started": [
-                "2020-01-01",
-                "2020-01-02",
-                "2020-01-03",
-                "2020-01-04",
-                "2020-01-05",
-            ],
-            "Date Finished": [
-                "2020-02-01",
-                "2020-02-02",
-                "2020-02-03",
-                "2020-02-04",
-                "2020-02-05",
-            ],
-        }
+    edit_browser = browser_with_data(
+        pd.DataFrame(
+            {
+                "index": [1, 2, 3, 4, 5],
+                "Date Started": [
+                    "2020-01-01",
+                    "2020-01-02",
+                    "2020-01-03",
+                    "2020-01-04",
+                    "2020-01-05",
+                ],
+                "Date Finished": [
+                    "2020-02-01",
+                    "2020-02-02",
+                    "2020-02-03",
+                    "2020-02-04",
+                    "2020-02-05",
+                ],
+            }
+        )
     )
 
     # Enter new dates for book 3
     with mock.patch(
         "builtins.input", side_effect=[3, "2022-05-13", "2022-6-13"]
     ) as mock_input:
-        found_books = test_browser.edit_book_details()
+        found_books = edit_browser.edit_book_details()
         assert found_books.loc[found_books["index"] == 3, ["Date Started"]].values[
             0
         ] == parse("2022-05-13", fuzzy=True)
@@ -134,6 +226,7 @@ def test_browser_edit_book_details():
             0
         ] == parse("2022-06-13", fuzzy=True)
         assert mock_input.assert_called
+    assert edit_browser.model.dirty_rows == {3}
 
 
 def test_save_and_exit():
@@ -146,10 +239,39 @@ def test_save_and_exit():
 
 def test_save_and_exit_exception():
     # Test the exit and save function with sqlite3 exception
+    test_browser.model.save_changes.side_effect = sqlite3.OperationalError
     with mock.patch("builtins.input", return_value="y") as mock_input:
         return_value = test_browser.save_and_exit()
         assert mock_input.assert_called
         assert return_value == False
+    test_browser.model.save_changes.side_effect = None
+
+
+@pytest.mark.parametrize("overwrite", ["y", "n"])
+def test_save_and_exit_conflict(overwrite):
+    conflict_browser = browser()
+    conflict_browser.model.save_changes.side_effect = [ConflictError([3]), 1]
+    with mock.patch("builtins.input", side_effect=["y", overwrite]):
+        with mock.patch("builtins.print") as mock_print:
+            conflict_browser.save_and_exit()
+    mock_print.assert_any_call("Changes saved")
+    if overwrite == "y":
+        conflict_browser.model.save_changes.assert_called_with(force=True)
+        conflict_browser.model.refresh.assert_not_called()
+    else:
+        conflict_browser.model.save_changes.assert_called_with()
+        conflict_browser.model.refresh.assert_called_once_with(overwrite_dirty=True)
+    assert conflict_browser.model.close.called
+
+
+def test_menu_reloads_changed_books():
+    reload_browser = browser()
+    reload_browser.model.refresh.return_value = [1, 2]
+    with mock.patch("builtins.input", return_value="q"):
+        with mock.patch.object(Browser, "save_and_exit"):
+            with mock.patch("builtins.print") as mock_print:
+                reload_browser.menu()
+    mock_print.assert_any_call("Reloaded 2 books changed by another program")
 
 
 # def test_update_kpi():
@@ -183,23 +305,150 @@ def test_update_kpi():
         "Date Finished": ["2020-01-05", "2020-01-10", "2020-01-20"],
         "Pages": [100, 200, 300],
     }
-    test_browser.model.data = pd.DataFrame(data)
+    kpi_browser = browser_with_data(pd.DataFrame(data))
 
     # Convert columns to datetime
-    test_browser.model.data["Date Started"] = pd.to_datetime(
-        test_browser.model.data["Date Started"]
+    kpi_browser.model.data["Date Started"] = pd.to_datetime(
+        kpi_browser.model.data["Date Started"]
     )
-    test_browser.model.data["Date Finished"] = pd.to_datetime(
-        test_browser.model.data["Date Finished"]
+    kpi_browser.model.data["Date Finished"] = pd.to_datetime(
+        kpi_browser.model.data["Date Finished"]
     )
     # Call the method being tested
 
-    test_browser.update_kpi()
+    kpi_browser.update_kpi()
 
     # Assert that the new columns have been added
-    assert "Days Read" in test_browser.model.data.columns
-    assert "Pages per Day" in test_browser.model.data.columns
+    assert "Days Read" in kpi_browser.model.data.columns
+    assert "Pages per Day" in kpi_browser.model.data.columns
 
     # Assert that the values in the new columns are correct
-    assert test_browser.model.data["Days Read"].tolist() == [4, 5, 5]
-    assert test_browser.model.data["Pages per Day"].tolist() == [25.0, 40.0, 60.0]
+    assert kpi_browser.model.data["Days Read"].tolist() == [4, 5, 5]
+    assert kpi_browser.model.data["Pages per Day"].tolist() == [25.0, 40.0, 60.0]
+
+
+def test_show_average_reading_speed(capsys):
+    progress_browser = browser_with_data(
+        pd.DataFrame(
+            {
+                "index": [0, 1, 2],
+                "Title": ["Book 1", "Book 2", "Book 3"],
+                "Pages": [100, 200, 300],
+                "Date Started": pd.to_datetime(["2020-01-01", "2020-01-05", None]),
+                "Date Finished": pd.to_datetime(["2020-01-05", "2020-01-05", None]),
+            }
+        )
+    )
+    progress_browser.show_average_reading_speed()
+    output = capsys.readouterr().out
+    assert "Books read: 2, Books unread: 1" in output
+    assert "Average reading speed: 112.50 pages/day" in output
+
+    # finishing the third book only updates the running totals
+    progress_browser.model.update_book(
+        2,
+        {
+            "Date Started": pd.Timestamp("2020-02-01"),
+            "Date Finished": pd.Timestamp("2020-02-04"),
+        },
+    )
+    progress_browser.show_read_unread_count()
+    assert "Books read: 3, Books unread: 0" in capsys.readouterr().out
+    assert progress_browser.model.calculate_average_reading_speed() == pytest.approx(
+        325 / 3
+    )
+
+
+def test_import_progress_file(tmp_path):
+    progress_browser = browser_with_data(pd.DataFrame({"index": [1, 2]}))
+    with mock.patch(
+        "src.browser.apply_progress_file", return_value=2
+    ) as mock_apply, mock.patch("builtins.input", return_value="progress.csv"):
+        assert progress_browser.import_progress_file() == 2
+    mock_apply.assert_called_once_with(
+        progress_browser.model, "progress.csv", progress_browser.save_changes
+    )
+
+    with mock.patch("builtins.input", return_value=str(tmp_path / "missing.csv")):
+        assert progress_browser.import_progress_file() == 0
+
+
+def test_import_progress_file_asks_on_conflicts():
+    conflict_browser = browser()
+    conflict_browser.model.save_changes.side_effect = [ConflictError([1]), 1]
+
+    def apply(model, path, save):
+        save()
+        return 2
+
+    with mock.patch("src.browser.apply_progress_file", side_effect=apply):
+        with mock.patch("builtins.input", side_effect=["progress.csv", "y"]):
+            assert conflict_browser.import_progress_file() == 2
+    conflict_browser.model.save_changes.assert_called_with(force=True)
+
+
+def test_time_to_finish_list(capsys):
+    forecast_browser = browser_with_data(
+        pd.DataFrame(
+            {
+                "index": [0, 1],
+                "Pages": [100, 300],
+                "Date Started": pd.to_datetime(["2020-01-01", None]),
+                "Date Finished": pd.to_datetime(["2020-01-11", None]),
+            }
+        )
+    )
+    forecast = forecast_browser.time_to_finish_list()
+    assert forecast["Percentile"].tolist() == [10, 50, 90]
+    assert "Finish Date" in capsys.readouterr().out
+
+    forecast_browser.model.data = forecast_browser.model.data.iloc[1:]
+    assert forecast_browser.time_to_finish_list().empty
+    assert "Cannot forecast the finish date" in capsys.readouterr().out
+
+
+def test_show_books_by_year(capsys):
+    year_browser = browser_with_data(
+        pd.DataFrame({"index": [0, 1, 2], "Date": ["1922", "500BC", "8"]})
+    )
+    year_browser.model.config = year_browser.model.config.replace(
+        relevant_columns=["Date"]
+    )
+    year_browser.model.derive_publication_years()
+    with mock.patch("builtins.input", return_value="500BC-100"):
+        assert year_browser.show_books_by_year()["index"].tolist() == [1, 2]
+    with mock.patch("builtins.input", return_value="soon"):
+        assert year_browser.show_books_by_year().empty
+    assert "Not a year" in capsys.readouterr().out
+
+
+def test_show_facets(capsys):
+    facet_browser = browser_with_data(
+        pd.DataFrame(
+            {
+                "index": [0, 1, 2],
+                "Status": ["r", "r", "tbr"],
+                "Pages": [100, 200, 300],
+                "Date Started": pd.to_datetime(["2020-01-01", None, None]),
+                "Date Finished": pd.to_datetime(["2020-01-05", None, None]),
+            }
+        )
+    )
+    summaries = facet_browser.show_facets()
+    assert summaries["Status"]["Books"].to_dict() == {"r": 2, "tbr": 1}
+    assert "By Status" in capsys.readouterr().out
+
+
+def test_log_reading_session(tmp_path, capsys):
+    session_browser = browser_with_data(pd.DataFrame({"index": [1, 2]}))
+    session_browser.model.config = session_browser.model.config.replace(
+        db_name=str(tmp_path / "books.db")
+    )
+    with mock.patch("builtins.input", side_effect=["2", "35", "2024-01-01"]):
+        progress = session_browser.log_reading_session()
+    assert progress["pages_read"].tolist() == [35]
+
+    with mock.patch("builtins.input", side_effect=["9", "35", ""]):
+        assert session_browser.log_reading_session().empty
+    assert "Session not logged" in capsys.readouterr().out
+    session_browser.model.close()
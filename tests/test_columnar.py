@@ -0,0 +1,43 @@
+from src.columnar import columnar_format, read_books, read_table, write_books
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+
+def books():
+    return pd.DataFrame(
+        {
+            "index": [1, 2, 3],
+            "Title": ["Book 1", "Book 2", "Book 3"],
+            "Author": pd.Categorical(["Author 1", "Author 2", "Author 1"]),
+            "Pages": pd.array([100, None, 300], dtype="Int32"),
+            "Date Finished": pd.to_datetime(["2020-01-05", None, "2021-03-01"]),
+        }
+    )
+
+
+def test_columnar_format():
+    assert columnar_format("books.parquet") == "parquet"
+    assert columnar_format("books.ARROW") == "feather"
+    assert columnar_format("books.db", "feather") == "feather"
+    with pytest.raises(ValueError, match="Cannot tell the format"):
+        columnar_format("books.csv")
+
+
+@pytest.mark.parametrize("name", ["books.parquet", "books.feather", "books.arrow"])
+def test_write_and_read_books_keep_dtypes(tmp_path, name):
+    path = str(tmp_path / name)
+    write_books(books(), path)
+    pd.testing.assert_frame_equal(read_books(path), books())
+    assert not (tmp_path / f"{name}.tmp").exists()
+
+
+@pytest.mark.parametrize("name", ["books.parquet", "books.feather"])
+def test_read_selected_columns(tmp_path, name):
+    path = str(tmp_path / name)
+    write_books(books(), path, metadata={b"source": b"test"})
+    table = read_table(path, columns=["Author", "Date Finished"])
+    assert table.column_names == ["Author", "Date Finished"]
+    assert table.schema.metadata[b"source"] == b"test"
+    assert read_books(path, columns=["Author"])["Author"].dtype == "category"
@@ -0,0 +1,113 @@
+# Tests the validated configuration
+
+import os
+
+import pytest
+import yaml
+from src.config import Config, ConfigError, load_config, validate
+
+SETTINGS = {
+    "relevant_columns": ["Title", "Author", "Pages", "Date Started"],
+    "column_dtypes": {
+        "Title": "str",
+        "Author": "category",
+        "Pages": "Int32",
+        "Date Started": "date",
+    },
+    "db_name": "books.db",
+}
+
+
+def write_config(path, settings):
+    with open(path, "w") as stream:
+        yaml.safe_dump(settings, stream)
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "config_file", ["config/config.yaml", "config/test_config.yaml"]
+)
+def test_shipped_configs_are_valid(config_file):
+    config = load_config(config_file)
+    assert "Date Started" in config.date_columns
+
+
+def test_derived_settings():
+    config = Config(SETTINGS)
+    assert config.relevant_columns == ("Title", "Author", "Pages", "Date Started")
+    assert config.date_columns == ("Date Started",)
+    assert dict(config.parse_dtypes) == {
+        "Title": "str",
+        "Author": "category",
+        "Pages": "Int32",
+    }
+    assert dict(config.compact_dtypes) == {"Author": "category", "Pages": "Int32"}
+    # defaults are filled in
+    assert config["page_size"] == 50
+    assert config["snapshot"] is None
+
+
+def test_config_is_read_only():
+    config = Config(SETTINGS)
+    with pytest.raises(TypeError):
+        config["db_name"] = "other.db"
+    with pytest.raises(TypeError):
+        config.column_dtypes["Title"] = "category"
+    with pytest.raises(AttributeError):
+        config["relevant_columns"].append("Status")
+
+
+def test_replace():
+    config = Config(SETTINGS)
+    changed = config.replace(page_size=10)
+    assert changed["page_size"] == 10
+    assert config["page_size"] == 50
+    assert changed.to_dict()["relevant_columns"] == SETTINGS["relevant_columns"]
+
+
+@pytest.mark.parametrize(
+    "changes, message",
+    [
+        ({"db_name": None}, "db_name has to be a str"),
+        ({"page_size": 0}, "page_size has to be positive"),
+        ({"import_chunksize": True}, "import_chunksize has to be a int"),
+        ({"colum_dtypes": {}}, "Unknown settings: colum_dtypes"),
+        ({"identity_columns": ["Title", "ISBN"]}, "not relevant: ISBN"),
+        ({"column_dtypes": {"ISBN": "str"}}, "unknown column ISBN"),
+        ({"year_column": "Published"}, "Published is not a relevant column"),
+        ({"birth_date": 1990}, "birth_date has to be a str or date"),
+    ],
+)
+def test_validate_rejects_invalid_settings(changes, message):
+    with pytest.raises(ConfigError, match=message):
+        validate({**SETTINGS, **changes})
+
+
+def test_validate_requires_settings():
+    with pytest.raises(ConfigError, match="Missing settings: db_name"):
+        validate({key: SETTINGS[key] for key in ("relevant_columns", "column_dtypes")})
+    with pytest.raises(ConfigError):
+        validate(["not", "a", "mapping"])
+
+
+def test_load_config_is_cached_until_the_file_changes(tmp_path):
+    config_file = write_config(tmp_path / "config.yaml", SETTINGS)
+    config = load_config(config_file)
+    assert load_config(config_file) is config
+
+    write_config(config_file, {**SETTINGS, "page_size": 20})
+    # make sure the modification time differs on coarse clocks
+    stat = os.stat(config_file)
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    reloaded = load_config(config_file)
+    assert reloaded is not config
+    assert reloaded["page_size"] == 20
+
+
+def test_load_config_errors(tmp_path):
+    with pytest.raises(ConfigError, match="Cannot read config"):
+        load_config(str(tmp_path / "missing.yaml"))
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("relevant_columns: [")
+    with pytest.raises(ConfigError, match="Invalid YAML"):
+        load_config(str(config_file))
@@ -0,0 +1,36 @@
+# Tests the database connection manager
+
+from src.database import Database
+import pytest
+
+
+def test_connection_is_reused(tmp_path):
+    database = Database(str(tmp_path / "books.db"))
+    assert database.connection is database.connection
+    database.close()
+
+
+def test_pragmas_are_applied(tmp_path):
+    database = Database(
+        str(tmp_path / "books.db"),
+        {"journal_mode": "wal", "synchronous": "normal", "cache_size": -2000},
+    )
+    con = database.connection
+    assert con.execute("pragma journal_mode").fetchone()[0] == "wal"
+    assert con.execute("pragma synchronous").fetchone()[0] == 1
+    assert con.execute("pragma cache_size").fetchone()[0] == -2000
+    database.close()
+
+
+def test_invalid_pragma_raises(tmp_path):
+    database = Database(str(tmp_path / "books.db"), {"cache_size; drop": 1})
+    with pytest.raises(ValueError):
+        database.connection
+
+
+def test_context_manager_closes_connection(tmp_path):
+    with Database(str(tmp_path / "books.db")) as database:
+        con = database.connection
+    assert database._connection is None
+    with pytest.raises(Exception):
+        con.execute("select 1")
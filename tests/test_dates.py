@@ -0,0 +1,77 @@
+# Tests the date normalization
+
+from src.dates import normalize_dates, parse_years
+from unittest import mock
+import pandas as pd
+
+
+def test_normalize_dates_mixed_formats():
+    values = pd.Series(
+        [
+            "5.3.2021",
+            "6.3.2021",
+            "11-Dec-19",
+            "2020-01-02",
+            None,
+            " ",
+            "March 3rd 2020",
+            "7/3/2021",
+            "nope",
+        ]
+    )
+    converted, unparseable = normalize_dates(values)
+    assert converted.dtype == "datetime64[ns]"
+    assert converted.tolist()[:4] == [
+        pd.Timestamp("2021-03-05"),
+        pd.Timestamp("2021-03-06"),
+        pd.Timestamp("2019-12-11"),
+        pd.Timestamp("2020-01-02"),
+    ]
+    assert converted.isna().tolist()[4:6] == [True, True]
+    assert converted[6] == pd.Timestamp("2020-03-03")
+    # odd values are read day first like the rest of the column
+    assert converted[7] == pd.Timestamp("2021-03-07")
+    assert pd.isna(converted[8])
+    assert unparseable == ["nope"]
+
+
+def test_normalize_dates_reads_a_column_in_one_order():
+    month_first, _ = normalize_dates(pd.Series(["12/25/2020", "01/02/2020"]))
+    assert month_first.tolist() == [
+        pd.Timestamp("2020-12-25"),
+        pd.Timestamp("2020-01-02"),
+    ]
+    day_first, _ = normalize_dates(
+        pd.Series(["25/12/2020", "13/01/2020", "01/02/2020"])
+    )
+    assert day_first[2] == pd.Timestamp("2020-02-01")
+
+
+def test_normalize_dates_parses_each_string_once():
+    values = pd.Series(["March 3rd 2020"] * 1000 + ["11-Dec-19"] * 1000)
+    with mock.patch(
+        "src.dates.parse_fuzzy", wraps=lambda value, dayfirst: pd.NaT
+    ) as fuzzy:
+        converted, unparseable = normalize_dates(values)
+    assert fuzzy.call_count == 1
+    assert unparseable == ["March 3rd 2020"]
+    assert converted.notna().sum() == 1000
+
+
+def test_normalize_dates_keeps_datetime_columns():
+    values = pd.Series(pd.to_datetime(["2020-01-01"]))
+    converted, unparseable = normalize_dates(values)
+    assert converted is values
+    assert unparseable == []
+
+
+def test_parse_years():
+    values = pd.Series(
+        ["500BC", "8", " 1850 ", "c. 1600", "AD 8", "44 B.C.", None, "", "unknown"]
+    )
+    years, unparseable = parse_years(values)
+    assert years.dtype == "Int32"
+    assert years.tolist()[:6] == [-500, 8, 1850, 1600, 8, -44]
+    assert years.isna().tolist()[6:] == [True, True, True]
+    assert unparseable == ["unknown"]
+    assert parse_years(pd.Series([1850, 1900]))[0].tolist() == [1850, 1900]
@@ -0,0 +1,68 @@
+from src.facets import MISSING, FacetEngine
+from src.kpi import KpiEngine
+import numpy as np
+import pandas as pd
+
+
+def books():
+    data = pd.DataFrame(
+        {
+            "Author": pd.Categorical(["Dickens", "Austen", "Dickens", None]),
+            "Status": ["r", None, "r", "tbr"],
+            "Pages": [500.0, 474.0, 1000.0, None],
+            "Date Started": pd.to_datetime(["2020-01-01", None, "2020-02-01", None]),
+            "Date Finished": pd.to_datetime(["2020-01-11", None, "2020-02-21", None]),
+            "Year": pd.array([1838, 1815, 1853, -500], dtype="Int32"),
+        }
+    )
+    KpiEngine(data)
+    return data
+
+
+def test_summary_of_all_books():
+    engine = FacetEngine(books())
+    assert engine.facets == ["Status", "Author", "Century"]
+    summaries = engine.summary()
+    authors = summaries["Author"]
+    assert authors.index.tolist() == ["Dickens", "Austen", MISSING]
+    assert authors["Books"].tolist() == [2, 1, 1]
+    assert authors["Read"].tolist() == [2, 0, 0]
+    assert authors["Pages"].tolist() == [1500, 474, 0]
+    assert authors.loc["Dickens", "Pages per Day"] == 50
+    assert np.isnan(authors.loc["Austen", "Pages per Day"])
+    assert summaries["Century"]["Books"].to_dict() == {1800: 3, -500: 1}
+    assert summaries["Status"]["Books"].to_dict() == {"r": 2, MISSING: 1, "tbr": 1}
+
+
+def test_summary_of_positions_and_limit():
+    engine = FacetEngine(books())
+    summaries = engine.summary(positions=[1, 2], limit=1)
+    assert summaries["Author"]["Books"].to_dict() == {"Dickens": 1}
+    assert summaries["Century"]["Books"].to_dict() == {1800: 2}
+    assert engine.summary(positions=[])["Author"].empty
+
+
+def test_updates_match_rebuild():
+    data = books()
+    kpis = KpiEngine(data)
+    engine = FacetEngine(data)
+    data.loc[1, ["Date Started", "Date Finished"]] = pd.to_datetime(
+        ["2021-01-01", "2021-01-05"]
+    )
+    data.loc[1, "Status"] = "read later"
+    data.loc[3, "Year"] = 1999
+    for position in (1, 3):
+        kpis.update_book(position)
+        engine.update_book(position)
+
+    data.loc[4] = pd.Series({"Author": "Eliot", "Status": "r", "Year": 1871})
+    kpis.append_book()
+    engine.append_book()
+
+    rebuilt = FacetEngine(data).summary()
+    for facet, summary in engine.summary().items():
+        pd.testing.assert_frame_equal(
+            summary.sort_index(key=lambda index: index.astype(str)),
+            rebuilt[facet].sort_index(key=lambda index: index.astype(str)),
+        )
+    assert engine.summary()["Status"].loc["read later", "Read"] == 1
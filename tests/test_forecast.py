@@ -0,0 +1,100 @@
+from src.config import Config
+from src.forecast import FinishForecaster
+from src.model import Model
+from unittest import mock
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+
+# Model with two books of 200 pages read in days, and the unread books
+def model_with_books(unread_pages=(100, None), days=(20, 20)):
+    with mock.patch.object(
+        Model, "read_config_file", return_value=Config({"db_name": "test.db"})
+    ):
+        model = Model("path/to/config")
+    model.data = pd.DataFrame(
+        {
+            "index": range(2 + len(unread_pages)),
+            "Pages": [200, 200, *unread_pages],
+            "Date Started": pd.to_datetime(
+                ["2020-01-01", "2020-02-01"] + [None] * len(unread_pages)
+            ),
+            "Date Finished": pd.to_datetime(
+                [
+                    pd.Timestamp("2020-01-01") + pd.Timedelta(days=days[0]),
+                    pd.Timestamp("2020-02-01") + pd.Timedelta(days=days[1]),
+                ]
+                + [None] * len(unread_pages)
+            ),
+        }
+    )
+    return model
+
+
+def test_remaining_pages_fills_unknown_with_median():
+    forecaster = FinishForecaster(model_with_books(unread_pages=(100, None)))
+    assert forecaster.remaining_pages().tolist() == [100, 100]
+
+
+def test_forecast_constant_speed():
+    # every finished book was read at 10 pages per day, so sigma is 0
+    forecaster = FinishForecaster(model_with_books(), simulations=100, seed=1)
+    assert forecaster.fit() == pytest.approx((np.log(10), 0))
+    forecast = forecaster.forecast(today=pd.Timestamp("2024-01-01"))
+    assert forecast["Percentile"].tolist() == [10, 50, 90]
+    assert forecast["Finish Date"].tolist() == [datetime.date(2024, 1, 21)] * 3
+    assert "Age" not in forecast
+
+
+def test_forecast_ages():
+    forecaster = FinishForecaster(model_with_books(), simulations=100, seed=1)
+    forecast = forecaster.forecast(
+        today=pd.Timestamp("2024-01-01"), birth_date=datetime.date(1990, 1, 21)
+    )
+    assert forecast["Age"].tolist() == [34, 34, 34]
+
+
+def test_forecast_percentiles_are_ordered():
+    forecaster = FinishForecaster(
+        model_with_books(days=(5, 40)), simulations=2000, seed=1
+    )
+    forecast = forecaster.forecast(percentiles=(5, 50, 95))
+    assert forecast["Finish Date"].is_monotonic_increasing
+    assert forecast["Finish Date"].iloc[0] < forecast["Finish Date"].iloc[-1]
+
+
+def test_simulation_cached_per_data_version():
+    model = model_with_books(days=(5, 40))
+    forecaster = FinishForecaster(model, simulations=100, seed=1)
+    days = forecaster.simulate_days()
+    with mock.patch.object(forecaster, "fit") as mock_fit:
+        assert forecaster.simulate_days() is days
+        assert not mock_fit.called
+
+    model.update_book(3, {"Pages": 1000})
+    assert forecaster.simulate_days().mean() > days.mean()
+
+
+def test_approximation_for_many_draws():
+    # the sum over many books is close to its moment matched log-normal
+    model = model_with_books(unread_pages=(100,) * 200, days=(5, 40))
+    exact = FinishForecaster(model, simulations=5000, seed=1).simulate_days()
+    with mock.patch("src.forecast.MAX_EXACT_DRAWS", 0):
+        approximated = FinishForecaster(model, simulations=5000, seed=1).simulate_days()
+    assert approximated.mean() == pytest.approx(exact.mean(), rel=0.05)
+    assert (approximated >= 0).all()
+
+
+def test_forecast_without_finished_books():
+    model = model_with_books()
+    model.data = model.data.assign(**{"Date Finished": pd.NaT})
+    with pytest.raises(ValueError, match="Finish a book"):
+        model.forecaster.forecast()
+
+
+def test_remaining_pages_subtracts_logged_sessions():
+    model = model_with_books(unread_pages=(100, 300))
+    with mock.patch.object(model, "pages_read", return_value=np.array([0, 0, 40, 500])):
+        assert FinishForecaster(model).remaining_pages().tolist() == [60, 0]
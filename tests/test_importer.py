@@ -1,6 +1,7 @@
 # Tests the importer class
 
 from io import BytesIO
+from src.config import Config
 from src.model import Model
 import unittest.mock as mock
 
@@ -54,12 +55,13 @@ def test_convert_column_dtypes():
 def test_convert_column_dtypes_with_dates():
     # Test the convert_column_dtypes function with dates as input columns
     test_importer.model.data = pd.DataFrame(columns=["foo", "bar", "baz"])
-    result = test_importer.convert_column_dtypes(
-        column_dtypes={"foo": "date", "bar": "datetime64", "baz": "float"}
-    )
+    column_dtypes = {"foo": "date", "bar": "datetime64", "baz": "float"}
+    result = test_importer.convert_column_dtypes(column_dtypes=column_dtypes)
     assert result.dtypes.equals(
         pd.Series({"foo": "datetime64[ns]", "bar": "datetime64[ns]", "baz": "float64"})
     )
+    # the dtypes passed in are not changed
+    assert column_dtypes == {"foo": "date", "bar": "datetime64", "baz": "float"}
 
 
 def test_convert_column_dtypes_non_existing_column():
@@ -90,6 +92,137 @@ def test_convert_dates_to_correct_format():
 
 def test_convert_dates_to_correct_format_with_wrong_format():
     # Test the convert_columns_to_correct_format function with a wrong format
-    test_importer.model.data = pd.DataFrame({"foo": ["thisisnotadate"]})
-    with mock.patch("pandas.DataFrame.apply", side_effect=pd.errors.ParserError):
-        assert test_importer.convert_dates_to_correct_format("foo") == False
+    test_importer.model.data = pd.DataFrame(
+        {"foo": ["thisisnotadate", "11-Dec-19", None]}
+    )
+    result = test_importer.convert_dates_to_correct_format("foo")
+    assert result.isna().tolist() == [True, False, True]
+    assert result[1] == pd.Timestamp("2019-12-11")
+    assert test_importer.unparseable_dates["foo"] == ["thisisnotadate"]
+
+
+def test_perform_import_streams_chunks(tmp_path):
+    # Test the chunked import with blank trailing columns and messy dates
+    list_file = tmp_path / "list.tsv"
+    list_file.write_text(
+        "#\tTitle\tPages\tDate Started\t\t\n"
+        "1\tUlysses\t730\t11-Dec-19\t\t\n"
+        "2\tDubliners\t\t\t\t\n"
+        "3\tEmma\t474\t2020-01-02\t\t\n"
+    )
+    config = {
+        "db_name": str(tmp_path / "books.db"),
+        "relevant_columns": ["Title", "Pages", "Date Started"],
+        "column_dtypes": {"Title": "str", "Pages": "float", "Date Started": "date"},
+        "import_chunksize": 2,
+    }
+    with mock.patch.object(Model, "read_config_file", return_value=Config(config)):
+        chunk_importer = Importer("path/to/config")
+    chunk_importer.perform_import(str(list_file))
+
+    con = chunk_importer.model.database.connection
+    read_data = pd.read_sql('select * from books order by "index"', con)
+    tables = [row[0] for row in con.execute("select name from sqlite_master")]
+    chunk_importer.model.close()
+
+    assert list(read_data.columns) == ["index", "Title", "Pages", "Date Started"]
+    assert read_data["index"].tolist() == [0, 1, 2]
+    assert read_data["Pages"].tolist()[0] == 730
+    assert read_data["Date Started"].tolist() == [
+        "2019-12-11 00:00:00",
+        None,
+        "2020-01-02 00:00:00",
+    ]
+    assert "books_import" not in tables
+    assert "ix_books_index" in tables
+
+
+def test_sync_skips_unchanged_list_and_merges_changes(tmp_path):
+    # Test that a re-import keeps progress entered in the database
+    list_file = tmp_path / "list.tsv"
+    list_file.write_text(
+        "Title\tAuthor\tPages\tDate Started\n"
+        "Ulysses\tJoyce\t730\t\n"
+        "Emma\tAusten\t474\t2020-01-02\n"
+    )
+    config = {
+        "db_name": str(tmp_path / "books.db"),
+        "relevant_columns": ["Title", "Author", "Pages", "Date Started"],
+        "column_dtypes": {
+            "Title": "str",
+            "Author": "str",
+            "Pages": "float",
+            "Date Started": "date",
+        },
+        "identity_columns": ["Title", "Author"],
+        "progress_columns": ["Date Started"],
+    }
+    with mock.patch.object(Model, "read_config_file", return_value=Config(config)):
+        sync_importer = Importer("path/to/config")
+    assert sync_importer.sync(str(list_file)) == "imported"
+    assert sync_importer.sync(str(list_file)) == "unchanged"
+
+    # the user starts reading Ulysses, then the list gets a new page count
+    # for Ulysses, a different start date for Emma and a new book
+    sync_importer.model.read_data_from_db()
+    sync_importer.model.update_book(0, {"Date Started": pd.Timestamp("2021-05-01")})
+    sync_importer.model.save_changes()
+    list_file.write_text(
+        "Title\tAuthor\tPages\tDate Started\n"
+        "Dubliners\tJoyce\t200\t\n"
+        "Ulysses\tJoyce\t740\t\n"
+        "Emma\tAusten\t474\t2019-01-01\n"
+    )
+    assert sync_importer.sync(str(list_file)) == "merged"
+    assert sync_importer.sync(str(list_file)) == "unchanged"
+
+    sync_importer.model.read_data_from_db()
+    books = sync_importer.model.data.set_index("Title")
+    sync_importer.model.close()
+    assert books.loc["Ulysses", "index"] == 0
+    assert books.loc["Ulysses", "Pages"] == 740
+    assert books.loc["Ulysses", "Date Started"] == pd.Timestamp("2021-05-01")
+    assert books.loc["Emma", "Date Started"] == pd.Timestamp("2020-01-02")
+    assert books.loc["Dubliners", "index"] == 2
+
+
+def test_merge_import_counts_changes(tmp_path):
+    list_file = tmp_path / "list.tsv"
+    list_file.write_text("Title\tAuthor\tPages\nUlysses\tJoyce\t730\n")
+    config = {
+        "db_name": str(tmp_path / "books.db"),
+        "relevant_columns": ["Title", "Author", "Pages"],
+        "column_dtypes": {"Title": "str", "Author": "str", "Pages": "float"},
+    }
+    with mock.patch.object(Model, "read_config_file", return_value=Config(config)):
+        merge_importer = Importer("path/to/config")
+    merge_importer.perform_import(str(list_file))
+    assert merge_importer.merge_import(str(list_file)) == (0, 0)
+    list_file.write_text(
+        "Title\tAuthor\tPages\nUlysses\tJoyce\t740\nEmma\tAusten\t474\n"
+    )
+    assert merge_importer.merge_import(str(list_file)) == (1, 1)
+    merge_importer.model.close()
+
+
+def test_import_derives_publication_year(tmp_path):
+    list_file = tmp_path / "list.tsv"
+    list_file.write_text(
+        "Title\tDate\n" "Aesop's Fables\t500BC\n" "Ulysses\t1922\n" "Beowulf\t?\n"
+    )
+    config = {
+        "db_name": str(tmp_path / "books.db"),
+        "relevant_columns": ["Title", "Date"],
+        "column_dtypes": {"Title": "str", "Date": "str"},
+    }
+    with mock.patch.object(Model, "read_config_file", return_value=Config(config)):
+        year_importer = Importer("path/to/config")
+    year_importer.perform_import(str(list_file))
+    assert year_importer.unparseable_years == ["?"]
+
+    year_importer.model.read_data_from_db()
+    assert year_importer.model.data["Year"].tolist() == [-500, 1922, pd.NA]
+    assert year_importer.model.books_by_year(-600, 0)["Title"].tolist() == [
+        "Aesop's Fables"
+    ]
+    year_importer.model.close()
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+from src.instrumentation import Metrics, configure, metrics, slot, timed, timer
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.reset()
+    metrics.enabled = True
+    yield metrics
+    metrics.enabled = False
+    metrics.reset()
+
+
+def test_disabled_metrics_record_nothing():
+    disabled = Metrics()
+    disabled.count("model.save_changes", "rows", 3)
+    disabled.observe("model.save_changes", 0.1)
+    assert disabled.snapshot() == {"counters": {}, "durations": {}}
+
+
+def test_observe_fills_histogram():
+    enabled = Metrics(enabled=True, buckets=(0.01, 0.1, 1.0))
+    enabled.observe("model.read_data_from_db", 0.05)
+    enabled.observe("model.read_data_from_db", 2.0)
+    histogram = enabled.snapshot()["durations"]["model.read_data_from_db"]
+    assert histogram["count"] == 2
+    assert histogram["sum"] == pytest.approx(2.05)
+    assert histogram["buckets"] == {"0.01": 0, "0.1": 1, "1.0": 1}
+
+
+def test_timed_counts_calls(enabled_metrics):
+    @timed("test.add")
+    def add(a, b):
+        return a + b
+
+    assert add(1, 2) == 3
+    assert add(2, 3) == 5
+    snapshot = enabled_metrics.snapshot()
+    assert snapshot["counters"]["calls"]["test.add"] == 2
+    assert snapshot["durations"]["test.add"]["count"] == 2
+
+
+def test_timed_records_failing_calls(enabled_metrics):
+    @timed("test.fail")
+    def fail():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fail()
+    assert enabled_metrics.snapshot()["durations"]["test.fail"]["count"] == 1
+
+
+def test_timer_records_the_block(enabled_metrics):
+    with timer("test.block"):
+        pass
+    with pytest.raises(ValueError):
+        with timer("test.block"):
+            raise ValueError
+    snapshot = enabled_metrics.snapshot()
+    assert snapshot["counters"]["calls"]["test.block"] == 2
+    assert snapshot["durations"]["test.block"]["count"] == 2
+
+
+def test_slot_drops_surplus_signal_arguments(enabled_metrics):
+    class Window:
+        @slot("test.clicked")
+        def clicked(self):
+            return "clicked"
+
+    # a button's clicked signal passes its checked state
+    assert Window().clicked(False) == "clicked"
+    assert enabled_metrics.snapshot()["counters"]["calls"]["test.clicked"] == 1
+
+
+def test_to_prometheus():
+    enabled = Metrics(enabled=True, buckets=(0.1, 1.0))
+    enabled.count("importer.perform_import", "rows", 1000)
+    enabled.observe("importer.perform_import", 0.5)
+    text = enabled.to_prometheus()
+    assert 'books_rows_total{operation="importer.perform_import"} 1000' in text
+    assert (
+        'books_duration_seconds_bucket{operation="importer.perform_import",le="0.1"} 0'
+        in text
+    )
+    assert (
+        'books_duration_seconds_bucket{operation="importer.perform_import",le="+Inf"} 1'
+        in text
+    )
+    assert 'books_duration_seconds_count{operation="importer.perform_import"} 1' in text
+
+
+def test_export(tmp_path):
+    enabled = Metrics(enabled=True)
+    enabled.count("model.save_changes", "rows", 2)
+    enabled.export(str(tmp_path / "metrics.json"))
+    enabled.export(str(tmp_path / "metrics.prom"))
+    with open(tmp_path / "metrics.json") as stream:
+        assert json.load(stream)["counters"]["rows"]["model.save_changes"] == 2
+    assert "books_rows_total" in (tmp_path / "metrics.prom").read_text()
+    with pytest.raises(ValueError):
+        enabled.export(str(tmp_path / "metrics.txt"), "csv")
+
+
+def test_configure():
+    configure({"enabled": True, "path": "metrics.json"})
+    assert metrics.enabled
+    configure(None)
+    assert not metrics.enabled
@@ -0,0 +1,63 @@
+# Tests the incremental KPI engine
+
+from src.kpi import KpiEngine
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def books():
+    return pd.DataFrame(
+        {
+            "Pages": [100.0, 200.0, 300.0, np.nan],
+            "Date Started": pd.to_datetime(
+                ["2020-01-01", "2020-01-05", "2020-02-01", None]
+            ),
+            "Date Finished": pd.to_datetime(["2020-01-05", "2020-01-05", None, None]),
+        }
+    )
+
+
+def test_rebuild_derives_columns_and_totals():
+    data = books()
+    kpis = KpiEngine(data)
+    assert data["Days Read"].tolist()[:2] == [4, 0]
+    assert data["Pages per Day"].tolist()[:2] == [25.0, 200.0]
+    assert kpis.book_count == 4
+    assert kpis.started_count == 3
+    assert kpis.finished_count == 2
+    assert kpis.unread_count == 2
+    assert kpis.pages_read == 300.0
+    assert kpis.average_speed == 112.5
+
+
+def test_update_book_matches_rebuild():
+    data = books()
+    kpis = KpiEngine(data)
+    data.loc[2, "Date Finished"] = pd.Timestamp("2020-02-11")
+    data.loc[0, "Date Finished"] = pd.NaT
+    kpis.update_book(2)
+    kpis.update_book(0)
+
+    rebuilt = KpiEngine(data.copy())
+    for attribute in ("started_count", "finished_count", "speed_count"):
+        assert getattr(kpis, attribute) == getattr(rebuilt, attribute)
+    assert kpis.average_speed == pytest.approx(rebuilt.average_speed)
+    assert kpis.pages_read == rebuilt.pages_read
+    assert data.loc[2, "Pages per Day"] == 30.0
+    assert np.isnan(data.loc[0, "Days Read"])
+
+
+def test_append_book():
+    data = books()
+    kpis = KpiEngine(data)
+    data.loc[4] = [50.0, pd.Timestamp("2021-01-01"), pd.Timestamp("2021-01-02"), 0, 0]
+    kpis.append_book()
+    assert kpis.book_count == 5
+    assert kpis.finished_count == 3
+    assert data.loc[4, "Pages per Day"] == 50.0
+
+
+def test_average_speed_without_finished_books():
+    data = books().iloc[2:].reset_index(drop=True)
+    assert KpiEngine(data).average_speed == 0.0
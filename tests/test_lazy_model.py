@@ -0,0 +1,172 @@
+# Tests the SQL-backed lazy model
+
+from src.config import Config
+from src.lazy_model import LazyModel, NotLoadedError, open_model
+from src.model import ConflictError, Model
+from unittest import mock
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def lazy_model(tmp_path):
+    config = {
+        "db_name": str(tmp_path / "books.db"),
+        "column_dtypes": {"Title": "str", "Date Started": "date"},
+    }
+    with mock.patch.object(Model, "read_config_file", return_value=Config(config)):
+        writer = Model("path/to/config.json")
+        lazy_model = LazyModel("path/to/config.json")
+    writer.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2, 3],
+            "Title": ["Ulysses", "Dubliners", "War and Peace", "Peace and War"],
+            "Date Started": [None, "2020-01-01 00:00:00", None, None],
+        }
+    )
+    writer.write_to_sqlite(write_index=False)
+    writer.close()
+    lazy_model.read_data_from_db()
+    yield lazy_model
+    lazy_model.close()
+
+
+def test_read_data_from_db_loads_no_rows(lazy_model):
+    assert lazy_model.data is None
+    assert lazy_model.columns == ["index", "Title", "Date Started"]
+    assert lazy_model.count() == 4
+
+
+def test_query_projects_and_converts_dates(lazy_model):
+    books = lazy_model.query(["Date Started"], where='"index" = ?', params=(1,))
+    assert list(books.columns) == ["index", "Date Started"]
+    assert books["Date Started"].tolist() == [pd.Timestamp("2020-01-01")]
+    with pytest.raises(KeyError):
+        lazy_model.query(["Pages"])
+
+
+def test_page_uses_keyset(lazy_model):
+    first_page = lazy_model.page(limit=3, columns=["Title"])
+    assert first_page["index"].tolist() == [0, 1, 2]
+    # the pager passes the last id of a page as a numpy integer
+    second_page = lazy_model.page(after_id=np.int64(2), limit=3, columns=["Title"])
+    assert second_page["index"].tolist() == [3]
+
+
+def test_search_pushes_down_like(lazy_model):
+    assert lazy_model.search("Title", "PEACE")["index"].tolist() == [2, 3]
+    assert lazy_model.search("Title", '"war and peace"')["index"].tolist() == [2]
+    assert lazy_model.get_book(1)["Title"].tolist() == ["Dubliners"]
+
+
+def test_edits_are_buffered_until_saved(lazy_model):
+    found_books = lazy_model.update_book(0, {"Title": "Finnegans Wake"})
+    assert found_books["Title"].tolist() == ["Finnegans Wake"]
+    assert lazy_model.count('"Title" = ?', ("Finnegans Wake",)) == 0
+    with pytest.raises(KeyError):
+        lazy_model.update_book(9, {"Title": "Missing"})
+
+    assert lazy_model.save_changes() == 1
+    assert lazy_model.pending_changes == {}
+    assert lazy_model.count('"Title" = ?', ("Finnegans Wake",)) == 1
+
+
+def test_new_books_are_inserted_on_save(lazy_model):
+    lazy_model.add_book({"index": 4, "Title": "Emma"})
+    with pytest.raises(KeyError, match="already exists"):
+        lazy_model.add_book({"index": 0, "Title": "Ulysses"})
+    with pytest.raises(KeyError):
+        lazy_model.add_book({"index": 5, "Pages": 474})
+    lazy_model.update_book(4, {"Date Started": pd.Timestamp("2024-01-02")})
+    assert lazy_model.count() == 4
+
+    assert lazy_model.save_changes() == 1
+    book = lazy_model.get_book(4)
+    assert book["Title"].tolist() == ["Emma"]
+    assert book["Date Started"].tolist() == [pd.Timestamp("2024-01-02")]
+
+
+def test_save_changes_detects_conflicts(lazy_model):
+    with mock.patch.object(Model, "read_config_file", return_value=lazy_model.config):
+        other = LazyModel("path/to/config.json")
+    other.read_data_from_db()
+    lazy_model.update_book(0, {"Title": "Mine"})
+    lazy_model.update_book(1, {"Title": "Unrelated"})
+    other.update_book(0, {"Title": "Theirs"})
+    assert other.save_changes() == 1
+
+    with pytest.raises(ConflictError) as conflict:
+        lazy_model.save_changes()
+    assert conflict.value.book_ids == [0]
+    assert lazy_model.count('"Title" = ?', ("Unrelated",)) == 0
+
+    # taking the other program's version keeps the other edits
+    assert lazy_model.refresh(overwrite_dirty=True) == [0]
+    assert lazy_model.get_book(0)["Title"].tolist() == ["Theirs"]
+    assert lazy_model.save_changes() == 1
+    assert lazy_model.get_book(1)["Title"].tolist() == ["Unrelated"]
+
+    # or forcing the edit over it
+    lazy_model.update_book(2, {"Title": "Mine"})
+    other.update_book(2, {"Title": "Theirs"})
+    other.save_changes()
+    with pytest.raises(ConflictError):
+        lazy_model.save_changes()
+    assert lazy_model.save_changes(force=True) == 1
+    assert lazy_model.get_book(2)["Title"].tolist() == ["Mine"]
+    other.close()
+
+
+def test_edits_recompute_the_derived_columns(tmp_path):
+    config = Config({"db_name": str(tmp_path / "books.db")})
+    with mock.patch.object(Model, "read_config_file", return_value=config):
+        writer = Model("path/to/config.json")
+        lazy_model = LazyModel("path/to/config.json")
+    writer.data = pd.DataFrame(
+        {
+            "index": [0],
+            "Pages": [500.0],
+            "Date Started": ["2020-01-01 00:00:00"],
+            "Date Finished": [None],
+            "Days Read": [float("nan")],
+            "Pages per Day": [float("nan")],
+        }
+    )
+    writer.write_to_sqlite(write_index=False)
+    writer.close()
+    with mock.patch.object(LazyModel, "create_id_index") as create_id_index:
+        lazy_model.read_data_from_db()
+    # loading never writes
+    create_id_index.assert_not_called()
+
+    lazy_model.update_book(0, {"Date Finished": pd.Timestamp("2020-01-11")})
+    lazy_model.add_book({"index": 1, "Pages": 30.0})
+    lazy_model.update_book(1, {"Date Started": pd.Timestamp("2020-01-01")})
+    lazy_model.update_book(1, {"Date Finished": pd.Timestamp("2020-01-01")})
+    lazy_model.save_changes()
+    books = lazy_model.query(["Days Read", "Pages per Day"])
+    assert books["Days Read"].tolist() == [10, 0]
+    assert books["Pages per Day"].tolist() == [50.0, 30.0]
+    lazy_model.close()
+
+
+def test_features_over_all_books_are_refused(lazy_model):
+    for feature in (
+        lambda: lazy_model.kpis,
+        lambda: lazy_model.facet_summary(),
+        lambda: lazy_model.books_by_year(1800),
+        lambda: lazy_model.reading_progress(),
+        lambda: lazy_model.search_positions("Title", "peace"),
+        lambda: lazy_model.update_books(pd.DataFrame({"index": [0], "Title": ["A"]})),
+    ):
+        with pytest.raises(NotLoadedError):
+            feature()
+
+
+def test_open_model_selects_the_backend():
+    for backend, backend_class in (("memory", Model), ("lazy", LazyModel)):
+        config = Config({"db_name": "test.db", "backend": backend})
+        with mock.patch("src.lazy_model.load_config", return_value=config):
+            with mock.patch.object(Model, "read_config_file", return_value=config):
+                assert type(open_model("path/to/config.json")) is backend_class
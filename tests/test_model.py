@@ -1,21 +1,29 @@
-from src.model import Model
+import json
+from src.config import Config, ConfigError
+from src.instrumentation import configure, metrics
+from src.model import ConflictError, Model
 from unittest import mock
-import yaml
 import pandas as pd
 import sqlite3
 import os
+import pytest
 
 
 def test_init():
     with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
-        mock_read_config_file.return_value = {"foo": "bar"}
+        mock_read_config_file.return_value = Config({"foo": "bar"})
         model = Model("path/to/config.json")
-        assert model.config == {"foo": "bar"}
+        assert model.config["foo"] == "bar"
 
 
-def test_read_data_from_db():
+def test_read_data_from_db(tmp_path):
     with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
-        mock_read_config_file.return_value = {"db_name": "bar"}
+        mock_read_config_file.return_value = Config(
+            {
+                "db_name": str(tmp_path / "bar"),
+                "column_dtypes": {"foo": "date", "bar": "int"},
+            }
+        )
         model = Model("path/to/config.json")
         with mock.patch(
             "pandas.read_sql",
@@ -28,14 +36,12 @@ def test_read_data_from_db():
                 assert model.data == "baz"
 
 
-@mock.patch("builtins.open", mock.mock_open(read_data="data"))
-def test_read_config_file_yaml_error():
-    # Test the read_config_file function with a yaml error
-    with mock.patch("yaml.safe_load", side_effect=yaml.YAMLError) as exc_info:
-        model = Model("path/to/config.json")
-        return_value = model.read_config_file("path/to/config/file")
-        assert exc_info.called
-        assert return_value is False
+def test_read_config_file_yaml_error(tmp_path):
+    # An invalid config raises instead of leaving the model without settings
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("column_dtypes: [")
+    with pytest.raises(ConfigError):
+        Model(str(config_file))
 
 
 def test_convert_columns_to_datetime():
@@ -49,7 +55,7 @@ def test_convert_columns_to_datetime():
 
     # Create an instance of the class
     with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
-        mock_read_config_file.return_value = {"db_name": "bar"}
+        mock_read_config_file.return_value = Config({"db_name": "bar"})
         model = Model("path/to/config.json")
     model.data = df
     # Convert date columns to datetime
@@ -73,14 +79,11 @@ def test_write_to_sqlite():
     df = pd.DataFrame(test_data)
 
     with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
-        mock_read_config_file.return_value = {"db_name": "bar"}
+        mock_read_config_file.return_value = Config({"db_name": "test.db"})
         model = Model("path/to/config.json")
 
     model.data = df
 
-    # Set the database name
-    model.db_name = "test.db"
-
     # write to sqlite
     model.write_to_sqlite()
 
@@ -113,7 +116,7 @@ def test_import_original_list():
     sample_df.to_csv("list.tsv", sep="\t", index=False)
 
     with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
-        mock_read_config_file.return_value = {"db_name": "bar"}
+        mock_read_config_file.return_value = Config({"db_name": "bar"})
         model = Model("path/to/config.json")
 
     model.data = sample_df
@@ -122,3 +125,725 @@ def test_import_original_list():
 
     # assert that the returned DataFrame is equal to the sample DataFrame
     assert result.equals(sample_df)
+
+
+def test_update_book_marks_row_dirty():
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config({"db_name": "bar"})
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame({"index": [0, 1, 2], "Pages": [100, 200, 300]})
+
+    found_books = model.update_book(1, {"Pages": 250})
+
+    assert found_books["Pages"].tolist() == [250]
+    assert model.data["Pages"].tolist() == [100, 250, 300]
+    assert model.dirty_rows == {1}
+
+
+def test_save_changes_writes_only_dirty_rows(tmp_path):
+    db_name = str(tmp_path / "books.db")
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config({"db_name": db_name})
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2],
+            "Title": ["Book 1", "Book 2", "Book 3"],
+            "Date Started": pd.to_datetime([None, "2020-01-01", None]),
+        }
+    )
+    model.write_to_sqlite(write_index=False)
+
+    # change a row behind the model's back to prove it is not rewritten
+    con = sqlite3.connect(db_name)
+    with con:
+        con.execute("update books set Title = 'Other' where \"index\" = 0")
+
+    model.update_book(2, {"Date Started": pd.Timestamp("2021-03-04")})
+    model.add_book({"index": 3, "Title": "Book 4"})
+    assert model.save_changes() == 2
+    assert model.dirty_rows == set()
+
+    read_data = pd.read_sql_query('select * from books order by "index"', con)
+    con.close()
+    assert read_data["Title"].tolist() == ["Other", "Book 2", "Book 3", "Book 4"]
+    assert read_data["Date Started"].tolist() == [
+        None,
+        "2020-01-01 00:00:00",
+        "2021-03-04 00:00:00",
+        None,
+    ]
+
+
+def test_save_changes_rolls_back_on_error(tmp_path):
+    db_name = str(tmp_path / "books.db")
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config({"db_name": db_name})
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame({"index": [0, 1], "Title": ["Book 1", "Book 2"]})
+    model.write_to_sqlite(write_index=False)
+
+    model.update_book(0, {"Title": "Changed"})
+    model.update_book(1, {"Title": "Changed"})
+    with mock.patch.object(
+        Model, "_to_sql_value", side_effect=[0, "Changed", RuntimeError]
+    ):
+        try:
+            model.save_changes()
+        except RuntimeError:
+            pass
+
+    con = sqlite3.connect(db_name)
+    read_data = pd.read_sql_query('select * from books order by "index"', con)
+    con.close()
+    assert read_data["Title"].tolist() == ["Book 1", "Book 2"]
+    assert model.dirty_rows == {0, 1}
+
+
+def test_model_shares_and_closes_connection(tmp_path):
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config(
+            {
+                "db_name": str(tmp_path / "books.db"),
+                "sqlite_pragmas": {"journal_mode": "wal"},
+            }
+        )
+        model = Model("path/to/config.json")
+    with model:
+        model.data = pd.DataFrame({"index": [0], "Title": ["Book 1"]})
+        model.write_to_sqlite(write_index=False)
+        con = model.database.connection
+        assert model.database.connection is con
+        assert con.execute("pragma journal_mode").fetchone()[0] == "wal"
+    assert model.database._connection is None
+
+
+def test_book_index_lookups():
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config({"db_name": "bar"})
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {"index": [10, 20, 30], "Title": ["Book 1", "Book 2", "Book 3"]},
+        index=[5, 6, 7],
+    )
+
+    assert model.book_index == {10: 0, 20: 1, 30: 2}
+    assert model.get_book(20)["Title"].tolist() == ["Book 2"]
+    assert model.get_book(99).empty
+
+    model.add_book({"index": 40, "Title": "Book 4"})
+    assert model.book_index[40] == 3
+    assert model.get_book(40)["Title"].tolist() == ["Book 4"]
+    model.update_book(30, {"Title": "Changed"})
+    assert model.get_book(30)["Title"].tolist() == ["Changed"]
+    with pytest.raises(KeyError):
+        model.update_book(99, {"Title": "Missing"})
+    with pytest.raises(KeyError):
+        model.add_book({"index": 10, "Title": "Duplicate"})
+
+    # replacing the frame rebuilds the index
+    model.data = pd.DataFrame({"index": [20], "Title": ["Reloaded"]})
+    assert model.book_index == {20: 0}
+    assert model.get_book(10).empty
+
+
+def test_search_index_follows_edits():
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config({"db_name": "bar"})
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {"index": [0, 1], "Title": ["Ulysses", "Dubliners"]}, index=[3, 4]
+    )
+
+    assert model.search("Title", "dub")["index"].tolist() == [1]
+    model.update_book(1, {"Title": "Ulysses Annotated"})
+    model.add_book({"index": 2, "Title": "Ulysses Revisited"})
+    assert model.search("Title", "ulysses")["index"].tolist() == [0, 1, 2]
+    assert model.search("Title", "dub").empty
+
+    model.data = pd.DataFrame({"index": [5], "Title": ["Dubliners"]})
+    assert model.search("Title", "dub")["index"].tolist() == [5]
+
+
+def test_compact_dtypes_survive_edits(tmp_path):
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config(
+            {
+                "db_name": str(tmp_path / "books.db"),
+                "column_dtypes": {
+                    "Author": "category",
+                    "Pages": "Int32",
+                    "Title": "string[pyarrow]",
+                    "Date Started": "date",
+                },
+            }
+        )
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2],
+            "Title": ["Ulysses", "Dubliners", "Emma"],
+            "Author": ["Joyce", "Joyce", "Austen"],
+            "Pages": [730.0, None, 474.0],
+            "Date Started": [None, None, None],
+        }
+    )
+    model.write_to_sqlite(write_index=False)
+    model.read_data_from_db()
+
+    assert model.data["Author"].dtype == "category"
+    assert model.data["Pages"].dtype == "Int32"
+    assert model.data["Title"].dtype == "string"
+    usage = model.memory_usage()
+    assert list(usage.columns) == ["dtype", "bytes"]
+    assert usage.loc["Author", "dtype"] == "category"
+
+    model.update_book(1, {"Author": "Woolf", "Pages": 200})
+    model.add_book({"index": 3, "Title": "Orlando", "Author": "Woolf"})
+    assert model.data["Author"].dtype == "category"
+    assert model.data["Pages"].dtype == "Int32"
+    assert model.data["Author"].tolist() == ["Joyce", "Woolf", "Austen", "Woolf"]
+    assert model.save_changes() == 2
+    model.close()
+
+
+def test_instrumentation_exports_on_close(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    config = {
+        "db_name": str(tmp_path / "books.db"),
+        "instrumentation": {"enabled": True, "path": str(metrics_file)},
+    }
+    with mock.patch.object(Model, "read_config_file", return_value=Config(config)):
+        model = Model("path/to/config.json")
+    metrics.reset()
+    try:
+        with model:
+            model.data = pd.DataFrame({"index": [0, 1], "Title": ["Book 1", "Book 2"]})
+            model.write_to_sqlite(write_index=False)
+            model.update_book(1, {"Title": "Other"})
+            model.save_changes()
+    finally:
+        configure(None)
+    with open(metrics_file) as stream:
+        exported = json.load(stream)
+    metrics.reset()
+    assert exported["counters"]["rows"] == {
+        "model.save_changes": 1,
+        "model.write_to_sqlite": 2,
+    }
+    assert exported["durations"]["model.save_changes"]["count"] == 1
+
+
+def snapshot_model(tmp_path):
+    config = {
+        "db_name": str(tmp_path / "books.db"),
+        "snapshot": str(tmp_path / "books.feather"),
+        "column_dtypes": {"Title": "str", "Author": "category", "Date Started": "date"},
+    }
+    with mock.patch.object(Model, "read_config_file", return_value=Config(config)):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1],
+            "Title": ["Book 1", "Book 2"],
+            "Author": ["Author 1", "Author 1"],
+            "Date Started": pd.to_datetime(["2020-01-01", None]),
+        }
+    )
+    model.write_to_sqlite(write_index=False)
+    return model
+
+
+def test_read_data_from_db_uses_current_snapshot(tmp_path):
+    pytest.importorskip("pyarrow")
+    model = snapshot_model(tmp_path)
+    model.read_data_from_db()
+    assert os.path.exists(tmp_path / "books.feather")
+    loaded = model.data
+
+    with mock.patch("pandas.read_sql") as mock_read_sql:
+        model.read_data_from_db()
+        mock_read_sql.assert_not_called()
+    pd.testing.assert_frame_equal(model.data, loaded)
+    assert model.data["Author"].dtype == "category"
+    assert model.data["Date Started"].dtype == "datetime64[ns]"
+    model.close()
+
+
+def test_snapshot_is_not_used_for_a_recreated_database(tmp_path):
+    pytest.importorskip("pyarrow")
+
+    def load(title):
+        # both databases get the same schema version and change count
+        model = snapshot_model(tmp_path)
+        con = sqlite3.connect(tmp_path / "books.db")
+        with con:
+            con.execute('update books set Title = ? where "index" = 1', (title,))
+        con.close()
+        model.read_data_from_db()
+        model.close()
+        return model.data["Title"].tolist()
+
+    assert load("Book 2") == ["Book 1", "Book 2"]
+    os.remove(tmp_path / "books.db")
+    assert load("Changed") == ["Book 1", "Changed"]
+
+
+def test_snapshot_is_invalidated_by_writes(tmp_path):
+    pytest.importorskip("pyarrow")
+    model = snapshot_model(tmp_path)
+    model.read_data_from_db()
+
+    # a write from another connection changes the version
+    con = sqlite3.connect(tmp_path / "books.db")
+    with con:
+        con.execute("update books set Title = 'Other' where \"index\" = 0")
+    con.close()
+    model.read_data_from_db()
+    assert model.data["Title"].tolist() == ["Other", "Book 2"]
+
+    # so does loading with different dtypes
+    column_dtypes = {**model.config.column_dtypes, "Author": "str"}
+    model.config = model.config.replace(column_dtypes=column_dtypes)
+    model.read_data_from_db()
+    assert model.data["Author"].dtype == object
+
+    # and replacing the table
+    model.data = model.data.iloc[:1]
+    model.write_to_sqlite(write_index=False)
+    model.read_data_from_db()
+    assert len(model.data) == 1
+    model.close()
+
+
+def test_update_books():
+    with mock.patch.object(Model, "read_config_file") as mock_read_config_file:
+        mock_read_config_file.return_value = Config({"db_name": "bar"})
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {"index": [5, 6, 7], "Title": ["Book 1", "Book 2", "Book 3"]},
+        index=[2, 1, 0],
+    )
+    model.search_index("Title")
+    changes = pd.DataFrame({"index": [7, 5], "Title": ["Ulysses", None]})
+    assert model.update_books(changes) == 2
+    assert model.data["Title"].tolist() == ["Book 1", "Book 2", "Ulysses"]
+    assert model.search("Title", "ulysses")["index"].tolist() == [7]
+    assert model.dirty_rows == {5, 7}
+
+    with pytest.raises(KeyError):
+        model.update_books(pd.DataFrame({"index": [8], "Title": ["Emma"]}))
+    with pytest.raises(ValueError):
+        model.update_books(pd.DataFrame({"index": [5, 5], "Title": ["A", "B"]}))
+
+
+@pytest.mark.parametrize("name", ["books.parquet", "books.feather"])
+def test_export_and_import_books(tmp_path, name):
+    pytest.importorskip("pyarrow")
+    model = snapshot_model(tmp_path)
+    model.data["Author"] = model.data["Author"].astype("category")
+    exported = model.data
+    assert model.export_books(str(tmp_path / name)) == 2
+
+    model.data = model.data.iloc[:0]
+    model.write_to_sqlite(write_index=False)
+    assert model.import_books(str(tmp_path / name)) == 2
+    pd.testing.assert_frame_equal(model.data, exported)
+    # the imported frame can be edited in place
+    model.update_book(1, {"Author": "Author 1", "Date Started": pd.Timestamp(0)})
+    model.read_data_from_db()
+    assert model.data["Title"].tolist() == ["Book 1", "Book 2"]
+    model.close()
+
+
+def test_import_books_needs_ids(tmp_path):
+    pytest.importorskip("pyarrow")
+    model = snapshot_model(tmp_path)
+    path = str(tmp_path / "books.parquet")
+    model.data = model.data.drop(columns="index")
+    model.export_books(path)
+    with pytest.raises(ValueError, match="no book id"):
+        model.import_books(path)
+    model.close()
+
+
+def year_model():
+    config = Config({"db_name": "test.db", "relevant_columns": ["Title", "Date"]})
+    with mock.patch.object(Model, "read_config_file", return_value=config):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2, 3],
+            "Title": ["Fables", "Metamorphoses", "Ulysses", "Untitled"],
+            "Date": ["500BC", "8", "1922", "unknown"],
+        }
+    )
+    assert model.derive_publication_years() == ["unknown"]
+    return model
+
+
+def test_books_by_year():
+    model = year_model()
+    assert model.data["Year"].tolist()[:3] == [-500, 8, 1922]
+    assert model.books_by_year(-1000, 100)["Title"].tolist() == [
+        "Fables",
+        "Metamorphoses",
+    ]
+    assert model.books_by_year(1900)["Title"].tolist() == ["Ulysses"]
+    assert model.year_facets(100).to_dict() == {-500: 1, 0: 1, 1900: 1}
+
+
+def test_year_follows_edits():
+    model = year_model()
+    model.books_by_year()
+    model.update_book(3, {"Date": "1850"})
+    assert model.data["Year"].tolist()[3] == 1850
+    assert model.books_by_year(1800, 1900)["Title"].tolist() == ["Untitled"]
+
+    model.update_books(pd.DataFrame({"index": [0], "Date": ["2000"]}))
+    model.add_book({"index": 4, "Title": "Emma", "Date": "1815"})
+    assert model.books_by_year(1800)["Title"].tolist() == [
+        "Emma",
+        "Untitled",
+        "Ulysses",
+        "Fables",
+    ]
+
+
+def test_facets_follow_edits():
+    with mock.patch.object(
+        Model, "read_config_file", return_value=Config({"db_name": "test.db"})
+    ):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1],
+            "Author": ["Dickens", "Austen"],
+            "Pages": [500.0, 474.0],
+            "Date Started": pd.to_datetime(["2020-01-01", None]),
+            "Date Finished": pd.to_datetime(["2020-01-11", None]),
+        }
+    )
+    assert model.facet_summary()["Author"]["Read"].to_dict() == {
+        "Dickens": 1,
+        "Austen": 0,
+    }
+    model.update_book(1, {"Author": "Dickens"})
+    model.add_book({"index": 2, "Author": "Eliot", "Pages": 800.0})
+    model.update_books(
+        pd.DataFrame({"index": [2], "Date Finished": [pd.Timestamp("2021-01-01")]})
+    )
+    authors = model.facet_summary(positions=[0, 1, 2])["Author"]
+    assert authors["Books"].to_dict() == {"Dickens": 2, "Eliot": 1}
+    assert authors["Read"].to_dict() == {"Dickens": 1, "Eliot": 1}
+
+
+def test_update_books_adjusts_totals_of_few_books():
+    with mock.patch.object(
+        Model, "read_config_file", return_value=Config({"db_name": "test.db"})
+    ):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2],
+            "Author": ["Dickens", "Austen", "Eliot"],
+            "Pages": [500.0, 474.0, 800.0],
+            "Date Started": pd.to_datetime(["2020-01-01", "2020-02-01", None]),
+            "Date Finished": pd.to_datetime(["2020-01-11", None, None]),
+        }
+    )
+    model.facet_summary()
+    changes = pd.DataFrame(
+        {
+            "index": [1, 2],
+            "Author": ["Dickens", "Austen"],
+            "Date Finished": pd.to_datetime(["2020-02-05", None]),
+        }
+    )
+    with mock.patch.object(model.kpis, "rebuild") as kpi_rebuild:
+        with mock.patch.object(model.facets, "rebuild") as facet_rebuild:
+            model.update_books(changes)
+    kpi_rebuild.assert_not_called()
+    facet_rebuild.assert_not_called()
+    assert model.data["Days Read"].tolist()[:2] == [10, 4]
+    adjusted = model.facet_summary()
+    speed = model.kpis.average_speed
+
+    model.kpis.rebuild()
+    model.facets.rebuild()
+    for facet, summary in model.facet_summary().items():
+        pd.testing.assert_frame_equal(adjusted[facet], summary)
+    assert model.kpis.average_speed == speed
+
+    # more books than the limit are recomputed at once
+    with mock.patch("src.model.INCREMENTAL_UPDATE_LIMIT", 1):
+        with mock.patch.object(model.facets, "rebuild") as facet_rebuild:
+            model.update_books(changes)
+    facet_rebuild.assert_called_once()
+
+
+def test_log_sessions(tmp_path):
+    model = snapshot_model(tmp_path)
+    version = model.data_version
+    model.log_session(1, 40, "2024-01-01")
+    model.log_sessions(pd.DataFrame({"index": [0, 1], "Pages": [10, 20]}))
+    assert model.data_version == version + 2
+    assert model.pages_read().tolist() == [10, 60]
+    with pytest.raises(KeyError, match="No book with id 5"):
+        model.log_session(5, 10)
+    with pytest.raises(KeyError, match=r"\[7\]"):
+        model.log_sessions(pd.DataFrame({"index": [0, 7], "Pages": [1, 1]}))
+    assert model.reading_log.progress()["sessions"].tolist() == [1, 2]
+
+    # logging does not touch the books table, so the snapshot stays valid
+    model.read_data_from_db()
+    with mock.patch("pandas.read_sql") as mock_read_sql:
+        model.read_data_from_db()
+        mock_read_sql.assert_not_called()
+    model.close()
+
+
+def two_models(tmp_path):
+    """Two instances of the app on one database, both with the books loaded"""
+    config = Config(
+        {
+            "db_name": str(tmp_path / "books.db"),
+            "column_dtypes": {"Author": "category", "Date Started": "date"},
+        }
+    )
+    with mock.patch.object(Model, "read_config_file", return_value=config):
+        first = Model("path/to/config.json")
+        second = Model("path/to/config.json")
+    first.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2],
+            "Title": ["Book 1", "Book 2", "Book 3"],
+            "Author": ["Author 1", "Author 1", "Author 2"],
+            "Date Started": pd.to_datetime(["2020-01-01", None, None]),
+        }
+    )
+    first.write_to_sqlite(write_index=False)
+    first.read_data_from_db()
+    second.read_data_from_db()
+    return first, second
+
+
+def test_save_changes_detects_conflicts(tmp_path):
+    first, second = two_models(tmp_path)
+    first.update_book(0, {"Title": "First"})
+    assert first.save_changes() == 1
+
+    # the first instance's own save is not a conflict for its next save
+    first.update_book(0, {"Title": "First again"})
+    first.update_book(1, {"Title": "Other book"})
+    assert first.save_changes() == 2
+
+    second.update_book(0, {"Title": "Second"})
+    second.update_book(2, {"Title": "Unrelated"})
+    with pytest.raises(ConflictError) as conflict:
+        second.save_changes()
+    assert conflict.value.book_ids == [0]
+    # nothing was written and the edits are still unsaved
+    assert second.dirty_rows == {0, 2}
+    con = sqlite3.connect(tmp_path / "books.db")
+    titles = pd.read_sql('select Title from books order by "index"', con)["Title"]
+    assert titles.tolist() == ["First again", "Other book", "Book 3"]
+
+    # taking the other program's version resolves the conflict
+    assert second.refresh(overwrite_dirty=True) == [0, 1]
+    assert second.data["Title"].tolist() == ["First again", "Other book", "Unrelated"]
+    assert second.save_changes() == 1
+    titles = pd.read_sql('select Title from books order by "index"', con)["Title"]
+    assert titles.tolist() == ["First again", "Other book", "Unrelated"]
+    con.close()
+
+    # or forcing the edits over it
+    first.update_book(2, {"Title": "Stale"})
+    with pytest.raises(ConflictError):
+        first.save_changes()
+    assert first.save_changes(force=True) == 1
+    second.update_book(2, {"Title": "Newer"})
+    with pytest.raises(ConflictError) as conflict:
+        second.save_changes()
+    assert conflict.value.book_ids == [2]
+    first.close()
+    second.close()
+
+
+def test_refresh_loads_only_changed_books(tmp_path):
+    first, second = two_models(tmp_path)
+    assert not second.changed_elsewhere()
+    assert second.refresh() == []
+
+    first.update_book(1, {"Date Started": pd.Timestamp("2021-05-06")})
+    first.add_book({"index": 3, "Title": "Book 4", "Author": "Author 3"})
+    first.save_changes()
+    assert second.changed_elsewhere()
+    assert not first.changed_elsewhere()
+    second.update_book(2, {"Title": "Unsaved"})
+    second.search_index("Title")
+    with mock.patch.object(Model, "read_data_from_db") as mock_read_data_from_db:
+        assert second.refresh() == [1, 3]
+        mock_read_data_from_db.assert_not_called()
+    assert second.data["Title"].tolist() == ["Book 1", "Book 2", "Unsaved", "Book 4"]
+    assert second.data.loc[1, "Date Started"] == pd.Timestamp("2021-05-06")
+    assert second.data["Author"].dtype == "category"
+    assert second.get_book(3)["Author"].item() == "Author 3"
+    assert second.search("Title", "Book 4")["index"].tolist() == [3]
+    # the reloaded books are not saved again, the edit still is
+    assert second.dirty_rows == {2}
+    assert second.refresh() == []
+
+    # deleted books need the whole table, the unsaved edit is applied again
+    con = sqlite3.connect(tmp_path / "books.db")
+    with con:
+        con.execute('delete from books where "index" = 3')
+    con.close()
+    assert second.refresh() == [0, 1, 2]
+    assert second.data["Title"].tolist() == ["Book 1", "Book 2", "Unsaved"]
+    assert second.dirty_rows == {2}
+    assert second.save_changes() == 1
+    first.close()
+    second.close()
+
+
+def test_refresh_after_the_table_was_replaced(tmp_path):
+    first, second = two_models(tmp_path)
+    first.data = first.data.iloc[:2]
+    first.write_to_sqlite(write_index=False)
+    second.update_book(0, {"Title": "Second"})
+    with pytest.raises(ConflictError):
+        second.save_changes()
+    assert second.refresh(overwrite_dirty=True) == [0, 1]
+    assert second.dirty_rows == set()
+    assert first.refresh() == []
+    first.close()
+    second.close()
+
+
+@mock.patch("src.changes.REFRESH_ROW_LIMIT", 1)
+def test_reloading_the_whole_table_keeps_unsaved_edits(tmp_path):
+    first, second = two_models(tmp_path)
+    first.update_book(0, {"Title": "First"})
+    first.update_book(1, {"Title": "First too"})
+    first.save_changes()
+    second.update_book(0, {"Title": "Second"})
+    second.update_book(2, {"Title": "Unrelated"})
+    second.add_book({"index": 3, "Title": "New"})
+
+    # too many changes for a partial reload; every edit survives it
+    assert second.refresh() == [0, 1, 2, 3]
+    assert second.data["Title"].tolist() == ["Second", "First too", "Unrelated", "New"]
+    assert second.dirty_rows == {0, 2, 3}
+    with pytest.raises(ConflictError) as conflict:
+        second.save_changes()
+    assert conflict.value.book_ids == [0]
+
+    # taking the other version drops only the conflicting edit
+    second.refresh(overwrite_dirty=True)
+    assert second.data["Title"].tolist() == ["First", "First too", "Unrelated", "New"]
+    assert second.dirty_rows == {2, 3}
+    assert second.save_changes() == 2
+    first.close()
+    second.close()
+
+
+def test_refresh_after_loading_from_snapshot(tmp_path):
+    pytest.importorskip("pyarrow")
+    model = snapshot_model(tmp_path)
+    model.read_data_from_db()
+    with mock.patch("pandas.read_sql") as mock_read_sql:
+        model.read_data_from_db()
+        mock_read_sql.assert_not_called()
+    with mock.patch.object(Model, "read_config_file", return_value=model.config):
+        other = Model("path/to/config.json")
+    other.read_data_from_db()
+    other.update_book(
+        1, {"Author": "Author 1", "Date Started": pd.Timestamp("2022-02-02")}
+    )
+    other.save_changes()
+
+    assert model.refresh() == [1]
+    assert model.data.loc[1, "Date Started"] == pd.Timestamp("2022-02-02")
+    model.update_book(0, {"Author": "Author 1"})
+    model.close()
+    other.close()
+
+
+def test_edits_save_current_derived_columns(tmp_path):
+    with mock.patch.object(
+        Model,
+        "read_config_file",
+        return_value=Config({"db_name": str(tmp_path / "books.db")}),
+    ):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2],
+            "Pages": [300.0, 200.0, 100.0],
+            "Date Started": pd.to_datetime(["2020-01-01", "2020-01-01", None]),
+            "Date Finished": pd.to_datetime(["2020-02-05", None, None]),
+            "Days Read": [35.0, None, None],
+            "Pages per Day": [300 / 35, None, None],
+        }
+    )
+    model.write_to_sqlite(write_index=False)
+
+    # no statistics were shown, so the KPI engine does not exist yet
+    model.update_book(0, {"Date Finished": pd.Timestamp("2020-01-11")})
+    model.save_changes()
+    # a new frame drops the engine again, for the bulk edit
+    model.data = model.data.copy()
+    model.update_books(
+        pd.DataFrame({"index": [1], "Date Finished": pd.to_datetime(["2020-01-21"])})
+    )
+    model.add_book(
+        {
+            "index": 3,
+            "Pages": 50.0,
+            "Date Started": pd.Timestamp("2020-03-01"),
+            "Date Finished": pd.Timestamp("2020-03-06"),
+        }
+    )
+    model.save_changes()
+
+    saved = pd.read_sql(
+        'select "Days Read", "Pages per Day" from books order by "index"',
+        model.database.connection,
+    )
+    assert saved["Days Read"].tolist()[:2] == [10.0, 20.0]
+    assert saved["Days Read"].tolist()[3] == 5.0
+    assert saved["Pages per Day"].tolist()[:2] == [30.0, 10.0]
+    assert saved["Pages per Day"].tolist()[3] == 10.0
+    model.close()
+
+
+def test_loading_does_not_write(tmp_path):
+    con = sqlite3.connect(tmp_path / "books.db")
+    pd.DataFrame({"index": [0, 1], "Title": ["Book 1", "Book 2"]}).to_sql(
+        "books", con, index=False
+    )
+    config = Config(
+        {"db_name": str(tmp_path / "books.db"), "snapshot": str(tmp_path / "s")}
+    )
+    with mock.patch.object(Model, "read_config_file", return_value=config):
+        first = Model("path/to/config.json")
+        second = Model("path/to/config.json")
+    first.read_data_from_db()
+    second.read_data_from_db()
+    assert first.database.connection.total_changes == 0
+    assert not os.path.exists(tmp_path / "s")
+    tables = pd.read_sql("select name from sqlite_master", con)["name"].tolist()
+    assert tables == ["books"]
+
+    # the first save creates the log, later entries are new to both models
+    first.update_book(1, {"Title": "First"})
+    first.save_changes()
+    second.update_book(1, {"Title": "Second"})
+    with pytest.raises(ConflictError):
+        second.save_changes()
+    assert second.refresh(overwrite_dirty=True) == [1]
+    assert second.data["Title"].tolist() == ["Book 1", "First"]
+    con.close()
+    first.close()
+    second.close()
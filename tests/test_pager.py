@@ -0,0 +1,49 @@
+# Tests the keyset pager of the command line browser
+
+from src.config import Config
+from src.model import Model
+from src.pager import Pager
+from unittest import mock
+import pandas as pd
+
+
+def model_with_books(count):
+    with mock.patch.object(
+        Model, "read_config_file", return_value=Config({"db_name": "bar"})
+    ):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {"index": range(count), "Title": [f"Book {n}" for n in range(count)]}
+    )
+    return model
+
+
+def test_model_page_uses_keyset():
+    model = model_with_books(120)
+    assert model.page(limit=50)["index"].tolist() == list(range(50))
+    assert model.page(49, 50)["index"].tolist() == list(range(50, 100))
+    assert model.page(99, 50)["index"].tolist() == list(range(100, 120))
+    assert model.page(119, 50).empty
+
+
+def test_pages_cover_all_books():
+    pager = Pager(model_with_books(120), page_size=50, table_format="plain")
+    pages = list(pager.pages())
+    assert len(pages) == 3
+    assert "Book 0" in pages[0] and "Book 49" in pages[0]
+    assert "Book 50" in pages[1] and "Book 119" in pages[2]
+
+
+def test_rendered_pages_are_cached_per_data_version():
+    model = model_with_books(10)
+    pager = Pager(model, page_size=5, table_format="compact")
+    with mock.patch.object(model, "page", wraps=model.page) as mock_page:
+        first = pager.render_page()
+        assert pager.render_page() == first
+        assert mock_page.call_count == 1
+
+        model.update_book(0, {"Title": "Changed"})
+        text, last_id = pager.render_page()
+        assert mock_page.call_count == 2
+    assert "Changed" in text
+    assert last_id == 4
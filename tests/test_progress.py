@@ -0,0 +1,133 @@
+# Tests the bulk update of reading progress from a file
+
+from src.config import Config
+from src.model import Model
+from src.progress import (
+    ProgressFileError,
+    apply_progress_file,
+    read_progress_file,
+    validate_progress,
+)
+from unittest import mock
+import pandas as pd
+import pytest
+import sqlite3
+
+
+def progress_model(tmp_path):
+    config = Config({"db_name": str(tmp_path / "books.db")})
+    with mock.patch.object(Model, "read_config_file", return_value=config):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [10, 11, 12],
+            "Title": ["Book 1", "Book 2", "Book 3"],
+            "Pages": [100, 300, 50],
+            "Date Started": pd.to_datetime(["2021-01-01", None, None]),
+            "Date Finished": pd.to_datetime([None, None, None]),
+        }
+    )
+    model.write_to_sqlite(write_index=False)
+    return model
+
+
+def test_read_progress_file(tmp_path):
+    path = tmp_path / "progress.tsv"
+    path.write_text(
+        "id\tDate Started\tDate Finished\n"
+        "10\t\t11.01.2021\n"
+        "11\t2021-02-01\t2021-02-04\n"
+    )
+    changes, problems = read_progress_file(str(path))
+    assert problems == []
+    assert changes["index"].tolist() == [10, 11]
+    assert changes["Date Started"].isna().tolist() == [True, False]
+    assert changes["Date Finished"].tolist() == [
+        pd.Timestamp("2021-01-11"),
+        pd.Timestamp("2021-02-04"),
+    ]
+
+
+def test_read_progress_file_problems(tmp_path):
+    path = tmp_path / "progress.csv"
+    path.write_text(
+        "id, Date Finished\n"
+        "ten, 2021-01-11\n"
+        "11, someday\n"
+        "12, 2021-01-11\n"
+        "12, 2021-01-12\n"
+    )
+    changes, problems = read_progress_file(str(path))
+    assert problems == [
+        (2, "invalid id"),
+        (3, "cannot parse Date Finished"),
+        (4, "book id repeated"),
+        (5, "book id repeated"),
+    ]
+
+
+def test_read_progress_file_needs_columns(tmp_path):
+    path = tmp_path / "progress.csv"
+    path.write_text("id,Title\n10,Book 1\n")
+    with pytest.raises(ProgressFileError):
+        read_progress_file(str(path))
+
+
+@pytest.mark.parametrize(
+    "text", ["", "id,Date Finished\n10,2021-01-11\n11,2021-01-12,extra,fields\n"]
+)
+def test_read_progress_file_unreadable(tmp_path, text):
+    path = tmp_path / "progress.csv"
+    path.write_text(text)
+    with pytest.raises(ProgressFileError, match="Cannot read the file"):
+        read_progress_file(str(path))
+
+
+def test_validate_progress(tmp_path):
+    model = progress_model(tmp_path)
+    changes = pd.DataFrame(
+        {
+            "index": pd.array([10, 99, 11], dtype="Int64"),
+            "Date Finished": pd.to_datetime(["2020-12-31", "2021-01-01", None]),
+        }
+    )
+    # book 10 was started in 2021 and cannot be finished before that
+    assert validate_progress(model, changes) == [
+        (3, "no book with id 99"),
+        (2, "Date Finished is before Date Started"),
+    ]
+    model.close()
+
+
+def test_apply_progress_file(tmp_path):
+    model = progress_model(tmp_path)
+    model.kpis
+    path = tmp_path / "progress.csv"
+    path.write_text(
+        "id,Date Started,Date Finished\n" "10,,2021-01-11\n" "11,1 Feb 2021,4.2.2021\n"
+    )
+    assert apply_progress_file(model, str(path)) == 2
+    assert model.data["Days Read"].tolist()[:2] == [10, 3]
+    assert model.kpis.finished_count == 2
+    assert model.kpis.average_speed == pytest.approx((10 + 100) / 2)
+
+    con = sqlite3.connect(tmp_path / "books.db")
+    saved = pd.read_sql('select * from books order by "index"', con)
+    con.close()
+    assert saved["Date Finished"].tolist() == [
+        "2021-01-11 00:00:00",
+        "2021-02-04 00:00:00",
+        None,
+    ]
+    model.close()
+
+
+def test_apply_progress_file_applies_nothing_on_error(tmp_path):
+    model = progress_model(tmp_path)
+    path = tmp_path / "progress.csv"
+    path.write_text("id,Date Finished\n11,2021-01-11\n99,2021-01-11\n")
+    with pytest.raises(ProgressFileError, match="line 3: no book with id 99"):
+        apply_progress_file(model, str(path))
+    assert model.data["Date Finished"].isna().all()
+    assert model.dirty_rows == set()
+    model.close()
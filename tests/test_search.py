@@ -0,0 +1,45 @@
+# Tests the full-text search index
+
+from src.search import SearchIndex, normalize, parse_query
+
+
+def test_normalize_strips_accents_and_case():
+    assert normalize("Émile ZOLA") == "emile zola"
+    assert normalize(None) == ""
+    assert normalize(float("nan")) == ""
+
+
+def test_parse_query():
+    assert parse_query('"war and" peace') == ([["war", "and"]], ["peace"])
+
+
+def test_prefix_and_accent_insensitive_search():
+    index = SearchIndex(["Émile Zola", "Honoré de Balzac", "Emily Brontë", None])
+    assert index.search("emil") == [0, 2]
+    assert index.search("BRONTE") == [2]
+    assert index.search("balzac honore") == [1]
+    assert index.search("dickens") == []
+
+
+def test_exact_matches_rank_first():
+    index = SearchIndex(["The Warden", "War and Peace", "The War of the Worlds"])
+    assert index.search("war") == [1, 2, 0]
+
+
+def test_phrase_search():
+    index = SearchIndex(["Peace and War", "War and Peace"])
+    assert index.search('"war and peace"') == [1]
+    assert index.search('"and peace" war') == [1]
+
+
+def test_empty_query_returns_all_rows():
+    index = SearchIndex(["foo", "bar"])
+    assert index.search("") == [0, 1]
+
+
+def test_update_and_append():
+    index = SearchIndex(["Ulysses", "Dubliners"])
+    index.update(0, "Finnegans Wake")
+    index.append("Ulysses Annotated")
+    assert index.search("ulysses") == [2]
+    assert index.search("finn") == [0]
@@ -0,0 +1,205 @@
+# Tests the HTTP/JSON service on localhost
+
+from src.config import Config
+from src.model import ConflictError, Model
+from src.service import BookService
+from unittest import mock
+import asyncio
+import json
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def model(tmp_path):
+    with mock.patch.object(
+        Model,
+        "read_config_file",
+        return_value=Config({"db_name": str(tmp_path / "books.db")}),
+    ):
+        model = Model("path/to/config.json")
+    model.data = pd.DataFrame(
+        {
+            "index": [0, 1, 2],
+            "Title": ["Oliver Twist", "Emma", "Bleak House"],
+            "Author": ["Dickens, Charles", "Austen, Jane", "Dickens, Charles"],
+            "Pages": [500.0, 474.0, 1000.0],
+            "Date Started": pd.to_datetime(["2020-01-01", None, None]),
+            "Date Finished": pd.to_datetime(["2020-01-11", None, None]),
+        }
+    )
+    model.write_to_sqlite(write_index=False)
+    yield model
+    model.close()
+
+
+async def request(port, method, target, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def run_with_service(model, client):
+    async def main():
+        service = BookService(model, max_workers=2)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return service, await client(port)
+
+    return asyncio.run(main())
+
+
+def test_search_lookup_and_progress(model):
+    async def client(port):
+        return await asyncio.gather(
+            request(port, "GET", "/search?column=Author&q=dickens"),
+            request(port, "GET", "/books/1"),
+            request(port, "GET", "/books/9"),
+            request(port, "GET", "/progress"),
+            request(port, "GET", "/search?column=Pagez&q=1"),
+        )
+
+    _, (search, book, missing, progress, invalid) = run_with_service(model, client)
+    assert search[0] == 200
+    assert [book["Title"] for book in search[1]] == ["Oliver Twist", "Bleak House"]
+    assert book == (200, [mock.ANY])
+    assert book[1][0]["Title"] == "Emma"
+    assert missing[0] == 404
+    assert progress == (
+        200,
+        {
+            "books": 3,
+            "read": 1,
+            "unread": 2,
+            "pages_read": 500.0,
+            "average_speed": 50.0,
+        },
+    )
+    assert invalid[0] == 400
+
+
+def test_edit_saves_and_invalidates_cache(model):
+    body = json.dumps({"Date Started": "2021-02-01", "Date Finished": "2021-02-05"})
+
+    async def client(port):
+        before = await request(port, "GET", "/progress")
+        edited = await request(port, "PATCH", "/books/1", body.encode())
+        after = await request(port, "GET", "/progress")
+        rejected = await request(port, "PATCH", "/books/1", b'{"Nope": 1}')
+        return before, edited, after, rejected
+
+    service, (before, edited, after, rejected) = run_with_service(model, client)
+    assert before[1]["read"] == 1
+    assert edited[0] == 200
+    assert edited[1][0]["Date Finished"].startswith("2021-02-05")
+    assert after[1]["read"] == 2
+    assert rejected[0] == 400
+
+    saved = pd.read_sql(
+        'select "Date Finished" from books where "index" = 1',
+        model.database.connection,
+    )
+    assert saved["Date Finished"].tolist() == ["2021-02-05 00:00:00"]
+
+
+def test_invalid_edits_change_nothing(model):
+    async def client(port):
+        responses = [
+            await request(port, "PATCH", "/books/1", json.dumps(values).encode())
+            for values in (
+                {"Title": "Persuasion", "Pages": "abc"},
+                {"Date Finished": "not a date"},
+                {"Days Read": 3},
+                {"Title": ["Persuasion"]},
+            )
+        ]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"PATCH /books/1 HTTP/1.1\r\nContent-Length: x\r\n\r\n")
+        await writer.drain()
+        malformed = await reader.read()
+        writer.close()
+        book = await request(port, "GET", "/books/1")
+        return responses, malformed, book
+
+    _, (responses, malformed, book) = run_with_service(model, client)
+    assert [status for status, _ in responses] == [400, 400, 400, 400]
+    assert malformed.startswith(b"HTTP/1.1 400")
+    assert book[1][0]["Title"] == "Emma"
+    assert model.data.loc[1, "Title"] == "Emma"
+    assert model.dirty_rows == set()
+
+
+def test_facets(model):
+    async def client(port):
+        return await asyncio.gather(
+            request(port, "GET", "/facets"),
+            request(port, "GET", "/facets?column=Title&q=emma&limit=5"),
+            request(port, "GET", "/facets?limit=many"),
+        )
+
+    _, (facets, filtered, invalid) = run_with_service(model, client)
+    assert facets[0] == 200
+    assert facets[1]["Author"] == [
+        {
+            "Author": "Dickens, Charles",
+            "Books": 2,
+            "Read": 1,
+            "Pages": 1500.0,
+            "Pages per Day": 50.0,
+        },
+        {
+            "Author": "Austen, Jane",
+            "Books": 1,
+            "Read": 0,
+            "Pages": 474.0,
+            "Pages per Day": None,
+        },
+    ]
+    assert [row["Author"] for row in filtered[1]["Author"]] == ["Austen, Jane"]
+    assert invalid[0] == 400
+
+
+def test_reloads_books_saved_by_other_programs(model):
+    with mock.patch.object(Model, "read_config_file", return_value=model.config):
+        other = Model("path/to/config.json")
+    other.read_data_from_db()
+    refresh = model.refresh
+    calls = []
+
+    def late_refresh(overwrite_dirty=False):
+        # the first refresh runs just before the other program saves
+        calls.append(overwrite_dirty)
+        return [] if len(calls) == 1 else refresh(overwrite_dirty)
+
+    async def client(port):
+        before = await request(port, "GET", "/books/1")
+        other.update_book(1, {"Title": "Persuasion"})
+        other.save_changes()
+        after = await request(port, "GET", "/books/1")
+        other.update_book(2, {"Title": "Hard Times"})
+        other.save_changes()
+        calls.clear()
+        with mock.patch.object(model, "refresh", side_effect=late_refresh):
+            conflict = await request(port, "PATCH", "/books/2", b'{"Pages": 1.0}')
+        edited = await request(port, "PATCH", "/books/0", b'{"Pages": 1.0}')
+        book = await request(port, "GET", "/books/2")
+        return before, after, conflict, edited, book
+
+    _, (before, after, conflict, edited, book) = run_with_service(model, client)
+    other.close()
+    assert before[1][0]["Title"] == "Emma"
+    assert after[1][0]["Title"] == "Persuasion"
+    assert conflict[0] == 409
+    assert str(ConflictError([2])) == conflict[1]["error"]
+    assert edited[0] == 200
+    assert book[1][0]["Title"] == "Hard Times"
+    assert book[1][0]["Pages"] == 1000.0
+    assert model.dirty_rows == set()
@@ -0,0 +1,78 @@
+from src.sessions import ReadingLog, session_date
+import datetime
+import pandas as pd
+import pytest
+import sqlite3
+
+
+@pytest.fixture
+def log():
+    connection = sqlite3.connect(":memory:")
+    yield ReadingLog(connection)
+    connection.close()
+
+
+def test_log_sessions_updates_totals(log):
+    log.log_session(1, 30, "2024-01-01")
+    log.log_sessions(
+        pd.DataFrame(
+            {
+                "index": [1, 2, 1],
+                "Pages": [20, 50, -5],
+                "Date": pd.to_datetime(["2024-01-03", "2024-01-03", "2024-01-08"]),
+            }
+        )
+    )
+    progress = log.progress()
+    assert progress["book_id"].tolist() == [1, 2]
+    assert progress["pages_read"].tolist() == [45, 50]
+    assert progress["sessions"].tolist() == [3, 1]
+    assert progress["first_date"].tolist()[0] == pd.Timestamp("2024-01-01")
+    assert progress["last_date"].tolist()[0] == pd.Timestamp("2024-01-08")
+
+    daily = log.daily_totals("2024-01-02")
+    assert (
+        daily["date"].tolist() == pd.to_datetime(["2024-01-03", "2024-01-08"]).tolist()
+    )
+    assert daily["pages"].tolist() == [70, -5]
+
+    # 2024-01-01 and 2024-01-08 are Mondays
+    weekly = log.weekly_totals()
+    assert (
+        weekly["week"].tolist() == pd.to_datetime(["2024-01-01", "2024-01-08"]).tolist()
+    )
+    assert weekly["pages"].tolist() == [100, -5]
+    assert weekly["sessions"].tolist() == [3, 1]
+    assert log.history(1)["pages"].tolist() == [30, 20, -5]
+
+
+def test_totals_match_the_log(log):
+    sessions = pd.DataFrame(
+        {
+            "index": [day % 7 for day in range(400)],
+            "Pages": [day % 30 + 1 for day in range(400)],
+            "Date": pd.date_range("2023-01-01", periods=400, freq="D"),
+        }
+    )
+    log.log_sessions(sessions)
+    sums = sessions.groupby("index")["Pages"].sum()
+    assert log.progress().set_index("book_id")["pages_read"].to_dict() == sums.to_dict()
+    weeks = sessions.groupby(sessions["Date"].dt.to_period("W-SUN"))["Pages"].sum()
+    assert log.weekly_totals()["pages"].tolist() == weeks.tolist()
+
+
+def test_log_is_append_only(log):
+    log.log_session(1, 10)
+    with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+        log.connection.execute("delete from reading_sessions")
+    with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+        log.connection.execute("update reading_sessions set pages = 1")
+    with pytest.raises(ValueError, match="has to have pages"):
+        log.log_session(1, 0)
+    assert log.progress()["pages_read"].tolist() == [10]
+
+
+def test_session_date():
+    assert session_date() == datetime.date.today().isoformat()
+    assert session_date(pd.Timestamp("2024-02-03 10:00")) == "2024-02-03"
+    assert session_date("3 Feb 2024") == "2024-02-03"
@@ -0,0 +1,72 @@
+# Tests the Qt table model for the book tables
+
+import numpy as np
+import pandas as pd
+import pytest
+
+QtCore = pytest.importorskip("PyQt5.QtCore")
+
+from src.table_model import BookTableModel, format_value
+
+
+def books(count):
+    return pd.DataFrame(
+        {
+            "index": range(count),
+            "Title": [f"Book {number}" for number in range(count)],
+            "Pages": [float(number) for number in range(count)],
+            "Date Started": pd.to_datetime(["2020-01-02"] + [None] * (count - 1)),
+        }
+    )
+
+
+def test_format_value():
+    assert format_value(None) == ""
+    assert format_value(float("nan")) == ""
+    assert format_value(pd.NaT) == ""
+    assert format_value(pd.Timestamp("2020-01-02 00:00:00")) == "2020-01-02"
+    assert format_value(600.0) == "600"
+    assert format_value("Ulysses") == "Ulysses"
+
+
+def test_cells_are_formatted_on_demand():
+    table_model = BookTableModel(books(3))
+    assert table_model.rowCount() == 3
+    assert table_model.columnCount() == 4
+    assert table_model.headerData(1, QtCore.Qt.Horizontal) == "Title"
+    assert table_model.data(table_model.index(0, 3)) == "2020-01-02"
+    assert table_model.data(table_model.index(2, 2)) == "2"
+    assert table_model.data(table_model.index(1, 3)) == ""
+
+
+def test_rows_are_fetched_in_batches():
+    table_model = BookTableModel(books(450), batch_size=200)
+    assert table_model.rowCount() == 200
+    assert table_model.canFetchMore()
+    table_model.fetchMore()
+    table_model.fetchMore()
+    assert table_model.rowCount() == 450
+    assert not table_model.canFetchMore()
+    table_model.fetchMore()
+    assert table_model.rowCount() == 450
+
+
+def test_set_rows_shows_selection_without_copy():
+    frame = books(5)
+    table_model = BookTableModel(frame)
+    table_model.set_rows([4, 1])
+    assert table_model.rowCount() == 2
+    assert table_model.data(table_model.index(0, 1)) == "Book 4"
+    assert table_model.data(table_model.index(1, 1)) == "Book 1"
+    assert np.shares_memory(table_model.columns[1].to_numpy(), frame["Title"])
+
+
+def test_compact_columns_are_not_copied():
+    frame = books(3).astype({"Title": "category", "Pages": "Int32"})
+    frame.loc[1, "Pages"] = pd.NA
+    table_model = BookTableModel(frame)
+    assert table_model.columns[1] is frame["Title"].array
+    assert table_model.columns[2] is frame["Pages"].array
+    assert table_model.data(table_model.index(2, 1)) == "Book 2"
+    assert table_model.data(table_model.index(2, 2)) == "2"
+    assert table_model.data(table_model.index(1, 2)) == ""
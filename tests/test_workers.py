@@ -0,0 +1,40 @@
+# Tests the background worker
+
+import pytest
+
+pytest.importorskip("PyQt5.QtCore")
+
+from src.workers import Worker
+
+
+def test_worker_emits_result_and_progress():
+    messages, results, finished = [], [], []
+
+    def job(value, progress):
+        progress("working")
+        return value * 2
+
+    worker = Worker(job, 21, report_progress=True)
+    worker.signals.progress.connect(messages.append)
+    worker.signals.result.connect(results.append)
+    worker.signals.finished.connect(lambda: finished.append(True))
+    worker.run()
+
+    assert messages == ["working"]
+    assert results == [42]
+    assert finished == [True]
+
+
+def test_worker_emits_error():
+    errors, results = [], []
+
+    def job():
+        raise ValueError("broken")
+
+    worker = Worker(job)
+    worker.signals.error.connect(errors.append)
+    worker.signals.result.connect(results.append)
+    worker.run()
+
+    assert [str(error) for error in errors] == ["broken"]
+    assert results == []
@@ -0,0 +1,42 @@
+from src.years import YearIndex, parse_year_range
+import pandas as pd
+import pytest
+
+
+def year_index():
+    return YearIndex(pd.Series([1850, None, -500, 1999, 1855, 8, 1900], dtype="Int32"))
+
+
+def test_between():
+    index = year_index()
+    assert index.between(1850, 1900).tolist() == [0, 4, 6]
+    assert index.between(-1000, 8).tolist() == [2, 5]
+    assert index.between(1901).tolist() == [3]
+    assert index.between(last=0).tolist() == [2]
+    assert index.between(2000, 2100).tolist() == []
+
+
+def test_chronological():
+    assert year_index().chronological().tolist() == [2, 5, 0, 4, 6, 3, 1]
+
+
+def test_facets():
+    index = year_index()
+    assert index.facets(10).to_dict() == {
+        -500: 1,
+        0: 1,
+        1850: 2,
+        1900: 1,
+        1990: 1,
+    }
+    assert index.facets(100).to_dict() == {-500: 1, 0: 1, 1800: 2, 1900: 2}
+    assert YearIndex(pd.Series([None], dtype="Int32")).facets().empty
+
+
+def test_parse_year_range():
+    assert parse_year_range("1850") == (1850, 1850)
+    assert parse_year_range("1900 - 1950") == (1900, 1950)
+    assert parse_year_range("500BC-100") == (-500, 100)
+    assert parse_year_range("-500 to 100") == (-500, 100)
+    with pytest.raises(ValueError, match="Not a year"):
+        parse_year_range("recent")